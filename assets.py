@@ -0,0 +1,254 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import pygame
+
+# Preprocessed asset bundle.
+#
+# `python assets.py` decodes every image and sound once and writes them to
+# BUNDLE_PATH: images as raw pixel rows, sounds as PCM in the mixer's sample
+# format.  At runtime the bundle is memory-mapped and assets are built from it
+# on first use, which skips PNG/MP3/OGG decoding entirely.  Bundle entries
+# whose source file has changed since the build, sounds recorded for a
+# different mixer format, and anything missing from the bundle fall back to
+# loading the source file, so a stale or absent bundle only costs speed.
+#
+# Sounds are handed out as one shared SoundHandle per path, so every Car uses
+# the same handle instead of decoding its own copy.
+
+BUNDLE_PATH = "assets.bundle"
+BUNDLE_MAGIC = b"RRAB"
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct("<4sII")  # magic, version, index length
+BUNDLE_ALIGN = 64
+ASSET_DIRECTORIES = ("images", "sounds")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+SOUND_EXTENSIONS = (".wav", ".ogg", ".mp3")
+
+
+def _data_start(index_length: int) -> int:
+    end = BUNDLE_HEADER.size + index_length
+    return end + -end % BUNDLE_ALIGN
+
+
+def _source_stamp(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class SoundHandle:
+    # Stands in for a pygame.mixer.Sound that is only decoded when first
+    # needed.  Missing sounds stay silent instead of failing.
+    def __init__(self, manager: "AssetManager", path: str):
+        self.manager = manager
+        self.path = path
+        self.volume: Optional[float] = None
+        self.sound: Optional[pygame.mixer.Sound] = None
+        self.loaded = False
+
+    @property
+    def available(self) -> bool:
+        return self.get() is not None
+
+    def get(self) -> Optional[pygame.mixer.Sound]:
+        if not self.loaded:
+            self.manager.load_sound(self)
+        return self.sound
+
+    def play(self, *args, **kwargs) -> Optional[pygame.mixer.Channel]:
+        sound = self.get()
+        return sound.play(*args, **kwargs) if sound is not None else None
+
+    def stop(self):
+        if self.sound is not None:
+            self.sound.stop()
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+        if self.sound is not None:
+            self.sound.set_volume(volume)
+
+    def get_length(self) -> float:
+        sound = self.get()
+        return sound.get_length() if sound is not None else 0.0
+
+
+class AssetManager:
+    def __init__(self, bundle_path: str = BUNDLE_PATH):
+        self.bundle_path = bundle_path
+        self.index: Optional[Dict[str, dict]] = None
+        self.data: Optional[memoryview] = None
+        self.images: Dict[str, pygame.Surface] = {}
+        self.sounds: Dict[str, SoundHandle] = {}
+        # Background preloading and the main thread may reach the same asset
+        self.lock = threading.RLock()
+        self.stats = {"bundled": 0, "decoded": 0, "missing": 0}
+
+    def _open(self):
+        if self.index is not None:
+            return
+        self.index = {}
+        try:
+            with open(self.bundle_path, "rb") as f:
+                bundle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            logging.info(f"No asset bundle at {self.bundle_path}; decoding source files")
+            return
+        try:
+            magic, version, index_length = BUNDLE_HEADER.unpack_from(bundle)
+        except struct.error:
+            magic = version = index_length = None
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            logging.warning(f"Ignoring {self.bundle_path}: not a version {BUNDLE_VERSION} asset bundle")
+            bundle.close()
+            return
+        self.index = json.loads(bundle[BUNDLE_HEADER.size:BUNDLE_HEADER.size + index_length])
+        self.data = memoryview(bundle)[_data_start(index_length):]
+
+    def _entry(self, path: str, kind: str) -> Optional[dict]:
+        self._open()
+        entry = self.index.get(path)
+        if entry is None or entry["kind"] != kind:
+            return None
+        # A bundle may ship without its sources, but an edited source wins
+        stamp = _source_stamp(path)
+        if stamp is not None and stamp != entry["source"]:
+            logging.info(f"{path} changed since the asset bundle was built")
+            return None
+        return entry
+
+    def image(self, path: str) -> pygame.Surface:
+        # Unconverted; callers convert() once a display mode is set
+        with self.lock:
+            surface = self.images.get(path)
+            if surface is None:
+                entry = self._entry(path, "image")
+                if entry is not None:
+                    # Shares the mapped pixels; convert() makes the working copy
+                    pixels = self.data[entry["offset"]:entry["offset"] + entry["length"]]
+                    surface = pygame.image.frombuffer(pixels, tuple(entry["size"]), entry["format"])
+                    self.stats["bundled"] += 1
+                else:
+                    surface = pygame.image.load(path)
+                    self.stats["decoded"] += 1
+                self.images[path] = surface
+            return surface
+
+    def sound(self, path: str, volume: Optional[float] = None) -> SoundHandle:
+        with self.lock:
+            handle = self.sounds.get(path)
+            if handle is None:
+                handle = self.sounds[path] = SoundHandle(self, path)
+        if volume is not None and volume != handle.volume:
+            handle.set_volume(volume)
+        return handle
+
+    def load_sound(self, handle: SoundHandle):
+        with self.lock:
+            if handle.loaded:
+                return
+            entry = self._entry(handle.path, "sound")
+            if entry is not None and pygame.mixer.get_init() is not None and list(pygame.mixer.get_init()) == entry["mixer"]:
+                handle.sound = pygame.mixer.Sound(buffer=self.data[entry["offset"]:entry["offset"] + entry["length"]])
+                self.stats["bundled"] += 1
+            else:
+                try:
+                    handle.sound = pygame.mixer.Sound(handle.path)
+                    self.stats["decoded"] += 1
+                except (FileNotFoundError, pygame.error) as e:
+                    logging.warning(f"Sound {handle.path} unavailable: {e}")
+                    self.stats["missing"] += 1
+            if handle.sound is not None and handle.volume is not None:
+                handle.sound.set_volume(handle.volume)
+            handle.loaded = True
+
+    def preload(self, handles: Iterable[SoundHandle], background: bool = True) -> Optional[threading.Thread]:
+        # Loads sounds off the main thread so the first frame does not wait for them
+        handles = list(handles)
+        if not background:
+            for handle in handles:
+                handle.get()
+            return None
+        thread = threading.Thread(target=self.preload, args=(handles, False), name="asset-preload", daemon=True)
+        thread.start()
+        return thread
+
+
+assets = AssetManager()
+
+
+def find_assets(directories: Iterable[str] = ASSET_DIRECTORIES) -> List[str]:
+    paths = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS + SOUND_EXTENSIONS):
+                paths.append(f"{directory}/{name}")
+    return paths
+
+
+def build_bundle(paths: Iterable[str], bundle_path: str = BUNDLE_PATH) -> Dict[str, dict]:
+    # Sounds are stored in whatever format the mixer was opened with; the game
+    # opens it with pygame.init() defaults, and so does this build
+    if pygame.mixer.get_init() is None:
+        pygame.mixer.init()
+    index: Dict[str, dict] = {}
+    blobs: List[bytes] = []
+    for path in paths:
+        if path.lower().endswith(SOUND_EXTENSIONS):
+            data = pygame.mixer.Sound(path).get_raw()
+            entry = {"kind": "sound", "mixer": list(pygame.mixer.get_init())}
+        else:
+            surface = pygame.image.load(path)
+            pixel_format = "RGBA" if surface.get_flags() & pygame.SRCALPHA else "RGB"
+            data = pygame.image.tobytes(surface, pixel_format)
+            entry = {"kind": "image", "size": list(surface.get_size()), "format": pixel_format}
+        entry["length"] = len(data)
+        entry["source"] = _source_stamp(path)
+        index[path] = entry
+        blobs.append(data)
+
+    # Offsets are relative to the aligned data section after the index
+    offset = 0
+    for entry, data in zip(index.values(), blobs):
+        offset += -offset % BUNDLE_ALIGN
+        entry["offset"] = offset
+        offset += len(data)
+
+    encoded = json.dumps(index).encode()
+    data_start = _data_start(len(encoded))
+    temporary = bundle_path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(encoded)))
+        f.write(encoded)
+        for entry, data in zip(index.values(), blobs):
+            f.write(b"\0" * (data_start + entry["offset"] - f.tell()))
+            f.write(data)
+    os.replace(temporary, bundle_path)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the preprocessed asset bundle")
+    parser.add_argument("paths", nargs="*", help=f"assets to include (default: everything in {', '.join(ASSET_DIRECTORIES)})")
+    parser.add_argument("-o", "--output", default=BUNDLE_PATH)
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+    start = time.perf_counter()
+    index = build_bundle(args.paths or find_assets(), args.output)
+    elapsed = time.perf_counter() - start
+    for path, entry in index.items():
+        print(f"{entry['kind']:<6} {entry['length']:>10} bytes  {path}")
+    print(f"Wrote {len(index)} assets ({os.path.getsize(args.output)} bytes) to {args.output} in {elapsed * 1e3:.0f} ms")
@@ -0,0 +1,158 @@
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional
+
+import pygame
+
+from assets import SoundHandle, assets
+
+# Every sound the client makes goes through one AudioSystem.
+#
+# Game code post()s named events as they happen ("shot", "impact", ...).  A
+# post only bumps a counter in a dict, so a frame with a hundred shots costs
+# a hundred increments and nothing else.  update() runs once a frame and
+# plays each posted event at most once, on the reserved channels of its
+# category, and only if that event last played at least its min_interval
+# ago.  All categories' channels are reserved, so Sound.play never has to
+# find (or steal) a free channel and a burst of shots can no longer cut off
+# the music or a stinger; within a category the oldest sound gives way.
+#
+# The music channel posts MUSIC_END_EVENT when a track finishes.  The main
+# loop passes pygame events to handle_event(), which calls on_music_end (by
+# default: play the track again), so nothing polls mixer.get_busy().
+#
+#   python audio.py   times post() under heavy fire and the update() after it
+
+MUSIC = "sounds/Music (1).wav"  # Not shipped in sounds/; the game runs without music until it is added
+SHOOT_SOUND = "sounds/Audio Shoot.wav"
+
+MUSIC_END_EVENT = pygame.event.custom_type()
+
+# Reserved channels per category, in channel order
+CATEGORY_CHANNELS = {"music": 1, "stingers": 1, "weapons": 3, "impacts": 2}
+# Unreserved channels left over for anything played directly
+FREE_CHANNELS = 2
+
+
+class SoundEvent:
+    __slots__ = ("path", "category", "volume", "min_interval")
+
+    def __init__(self, path: str, category: str, volume: float = 0.5, min_interval: float = 0.0):
+        self.path = path
+        self.category = category
+        self.volume = volume
+        # Seconds; posts within this of the last time it played are dropped
+        self.min_interval = min_interval
+
+
+SOUND_EVENTS: Dict[str, SoundEvent] = {
+    "music": SoundEvent(MUSIC, "music"),
+    "shot": SoundEvent(SHOOT_SOUND, "weapons", min_interval=0.06),
+    "impact": SoundEvent("sounds/Impact audio.ogg", "impacts", min_interval=0.08),
+    "win": SoundEvent("sounds/Dota Rampage Sound.mp3", "stingers", min_interval=2.0),
+    "lose": SoundEvent("sounds/Rick and Morty Wrecked sound.mp3", "stingers", min_interval=2.0),
+}
+
+
+class AudioSystem:
+    def __init__(
+        self,
+        events: Dict[str, SoundEvent] = SOUND_EVENTS,
+        channels: Dict[str, int] = CATEGORY_CHANNELS,
+        on_music_end: Optional[Callable[[str], None]] = None,
+    ):
+        self.events = events
+        self.handles: Dict[str, SoundHandle] = {name: assets.sound(event.path, event.volume) for name, event in events.items()}
+        # Event name -> posts since the last update()
+        self.pending: Dict[str, int] = {}
+        self.last_played: Dict[str, float] = {}
+        self.stats = {"posted": 0, "played": 0, "limited": 0}
+        self.music: Optional[str] = None
+        self.on_music_end = on_music_end or self.play_music
+        self.channels: Dict[str, List[pygame.mixer.Channel]] = {}
+        self.next_channel: Dict[str, int] = {category: 0 for category in channels}
+        # Without a mixer (e.g. no audio device) everything is silently dropped
+        self.enabled = pygame.mixer.get_init() is not None
+        if not self.enabled:
+            logging.info("No audio mixer; sound is off")
+            return
+        reserved = sum(channels.values())
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), reserved + FREE_CHANNELS))
+        pygame.mixer.set_reserved(reserved)
+        first = 0
+        for category, count in channels.items():
+            self.channels[category] = [pygame.mixer.Channel(first + i) for i in range(count)]
+            first += count
+        if "music" in self.channels:
+            self.channels["music"][0].set_endevent(MUSIC_END_EVENT)
+
+    def preload(self):
+        # Decodes every sound in the background before its first event
+        assets.preload(self.handles.values())
+
+    def post(self, name: str):
+        self.pending[name] = self.pending.get(name, 0) + 1
+        self.stats["posted"] += 1
+
+    def update(self, now: Optional[float] = None):
+        if not self.pending:
+            return
+        now = time.monotonic() if now is None else now
+        for name in self.pending:
+            if now - self.last_played.get(name, -math.inf) < self.events[name].min_interval:
+                self.stats["limited"] += 1
+                continue
+            if self._play(name):
+                self.last_played[name] = now
+        self.pending.clear()
+
+    def _play(self, name: str) -> bool:
+        if not self.enabled:
+            return False
+        sound = self.handles[name].get()
+        if sound is None:
+            return False
+        category = self.events[name].category
+        channels = self.channels[category]
+        index = self.next_channel[category]
+        self.next_channel[category] = (index + 1) % len(channels)
+        channels[index].play(sound)
+        self.stats["played"] += 1
+        return True
+
+    def play_music(self, name: str = "music"):
+        self.music = name
+        self._play(name)
+
+    def stop_music(self):
+        self.music = None
+        for channel in self.channels.get("music", ()):
+            channel.stop()
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        # True if the event was ours
+        if event.type != MUSIC_END_EVENT:
+            return False
+        if self.music is not None:
+            self.on_music_end(self.music)
+        return True
+
+
+if __name__ == "__main__":
+    import os
+    import timeit
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.init()
+    audio = AudioSystem()
+    audio.preload()
+    for shots in (1, 10, 100, 1000):
+        def frame():
+            for _ in range(shots):
+                audio.post("shot")
+            audio.post("impact")
+            audio.update()
+        count = max(10, 20000 // shots)
+        print(f"{shots:>5} shots/frame: {timeit.timeit(frame, number=count) / count * 1e6:8.1f} us per frame")
+    print(audio.stats)
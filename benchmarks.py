@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+import numpy as np
+
+from bullet_pool import BulletPool
+from delta import SnapshotDecoder, SnapshotEncoder
+from game_server import GameServer, Room
+from physics import CarPhysics
+from protocol import FrameDecoder, encode_message
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT, CarBody, Projectile, Simulation, Vector2
+from spatial_hash import SpatialHash
+
+# Headless benchmarks for the hot paths.  Everything here runs on the
+# pygame-free core (simulation.CarBody / Projectile are what car.Car and
+# Bullet.Bullet extend), so no display or audio device is needed.
+#
+# Every case is seeded and also returns a checksum of what it computed, so a
+# baseline comparison catches behaviour changes as well as slowdowns.
+# Comparisons use each case's best sample: on a shared machine other work
+# only ever adds time, so the minimum moves far less between runs than the
+# median does.
+#
+#   python benchmarks.py                         run everything, print a table
+#   python benchmarks.py -o results.json         also write the results
+#   python benchmarks.py -b baseline.json        compare; exit 1 on regressions
+#   python benchmarks.py -k protocol -k delta    only cases whose name matches
+
+DEFAULT_REPEATS = 9
+DEFAULT_THRESHOLD = 0.15
+SEED = 1234
+# Ticks per call of server_authoritative_tick
+MATCH_TICKS = 60
+
+
+def checksum(*values) -> str:
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:12]
+
+
+class Case:
+    def __init__(self, name: str, setup: Callable[[random.Random], Tuple[Callable[[], Any], Callable[[], str]]], ops: int):
+        # setup(rng) builds the scenario and returns (run, digest): run is
+        # timed and performs `ops` operations per call, digest summarises the
+        # state after the first call and is not timed
+        self.name = name
+        self.setup = setup
+        self.ops = ops
+
+
+def random_cars(rng: random.Random, count: int) -> List[CarBody]:
+    cars = []
+    for _ in range(count):
+        car = CarBody(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), rng.uniform(0, 360))
+        car.acceleration = rng.choice((-1, 0, 1)) * car.max_acceleration
+        car.steering = rng.choice((-1, 0, 1)) * car.max_steering
+        cars.append(car)
+    return cars
+
+
+def random_state(rng: random.Random, bullets: int) -> Dict[str, Any]:
+    return {
+        "car": {"x": rng.uniform(0, SCREEN_WIDTH), "y": rng.uniform(0, SCREEN_HEIGHT), "angle": rng.uniform(0, 360), "health": rng.randrange(0, 101)},
+        "bullets": [
+            {"id": i, "x": rng.uniform(0, SCREEN_WIDTH), "y": rng.uniform(0, SCREEN_HEIGHT), "angle": rng.uniform(0, 360), "speed": 30}
+            for i in range(bullets)
+        ],
+    }
+
+
+# Physics
+
+def car_update(rng: random.Random):
+    cars = random_cars(rng, 1000)
+
+    def run():
+        for car in cars:
+            car.update(1 / 60)
+            car.wrap(SCREEN_WIDTH, SCREEN_HEIGHT)
+    return run, lambda: checksum([(round(c.position.x, 6), round(c.position.y, 6), round(c.angle, 6)) for c in cars])
+
+
+def car_physics(rng: random.Random):
+    # car_update's cars, stepped together
+    cars = random_cars(rng, 1000)
+    physics = CarPhysics(len(cars))
+    for index, car in enumerate(cars):
+        physics.load(index, car)
+
+    def run():
+        physics.advance(1 / 60, SCREEN_WIDTH, SCREEN_HEIGHT)
+    return run, lambda: checksum([(round(x, 6), round(y, 6), round(angle, 6)) for x, y, angle in zip(physics.x.tolist(), physics.y.tolist(), physics.angle.tolist())])
+
+
+def bullet_update(rng: random.Random):
+    bullets = [Projectile(Vector2(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)), rng.uniform(0, 360)) for _ in range(1000)]
+
+    def run():
+        for bullet in bullets:
+            bullet.update()
+    return run, lambda: checksum([(round(b.position.x, 6), round(b.position.y, 6)) for b in bullets])
+
+
+def bullet_pool_step(rng: random.Random):
+    pool = BulletPool(4096)
+    for _ in range(4000):
+        pool.spawn(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), rng.uniform(0, 360))
+
+    def run():
+        # No culling bounds, so every call does the same amount of work
+        pool.step(float("inf"), float("inf"))
+    return run, lambda: checksum(len(pool), np.round(pool.x[:pool.high], 6).tolist())
+
+
+# Collisions
+
+def collides_with(rng: random.Random):
+    cars = random_cars(rng, 10)
+    bullets = [Projectile(Vector2(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)), 0) for _ in range(100)]
+
+    def run():
+        return sum(bullet.collides_with(car) for bullet in bullets for car in cars)
+    return run, lambda: checksum(run())
+
+
+def bullet_pool_hits(rng: random.Random):
+    cars = random_cars(rng, 16)
+    car_x = np.array([car.position.x for car in cars])
+    car_y = np.array([car.position.y for car in cars])
+    radius = np.array([car.length / 2 for car in cars])
+    pool = BulletPool(4096)
+    for _ in range(4000):
+        pool.spawn(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), rng.uniform(0, 360), owner=rng.randrange(16))
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    def run():
+        grid.build(car_x, car_y, radius)
+        return pool.hits(car_x, car_y, radius, grid=grid)
+
+    def digest():
+        slots, targets = run()
+        return checksum(slots.tolist(), targets.tolist())
+    return run, digest
+
+
+# Serialization
+
+def car_serialize(rng: random.Random):
+    cars = random_cars(rng, 1000)
+
+    def run():
+        return [car.serialize() for car in cars]
+    return run, lambda: checksum(run())
+
+
+def car_deserialize(rng: random.Random):
+    cars = random_cars(rng, 1000)
+    states = [car.serialize() for car in random_cars(rng, 1000)]
+
+    def run():
+        for car, state in zip(cars, states):
+            car.deserialize(state)
+    return run, lambda: checksum([car.serialize() for car in cars])
+
+
+def message_round_trip(bullets: int):
+    def setup(rng: random.Random):
+        messages = [{"game_state": random_state(rng, bullets)} for _ in range(100)]
+
+        def run():
+            data = b"".join(encode_message(message) for message in messages)
+            return data, FrameDecoder().feed(data)
+
+        def digest():
+            data, decoded = run()
+            return checksum(hashlib.sha1(data).hexdigest(), decoded)
+        return run, digest
+    return setup
+
+
+def snapshot_round_trip(rng: random.Random):
+    simulation = Simulation(8)
+    for player_id in range(8):
+        simulation.apply_input(player_id, {"seq": 1, "throttle": 1, "steering": rng.choice((-1, 0, 1)), "shots": 20})
+    for _ in range(3):
+        simulation.step(1 / 60)
+    message = {"snapshot": simulation.snapshot()}
+
+    def run():
+        data = encode_message(message)
+        return data, FrameDecoder().feed(data)[0]
+
+    def digest():
+        data, decoded = run()
+        return checksum(hashlib.sha1(data).hexdigest(), decoded)
+    return run, digest
+
+
+def delta_round_trip(rng: random.Random):
+    states = [random_state(rng, 10) for _ in range(100)]
+    # Bullets flying straight along x, which deltas extrapolate instead of resending
+    first = [dict(bullet, angle=0) for bullet in states[0]["bullets"]]
+    for index, state in enumerate(states):
+        state["bullets"] = [dict(bullet, x=bullet["x"] + 30 * index) for bullet in first]
+
+    def run():
+        encoder, decoder = SnapshotEncoder(0), SnapshotDecoder()
+        size = 0
+        for seq, state in enumerate(states, 1):
+            message = encode_message({"state_delta": encoder.encode(seq, state)})
+            size += len(message)
+            decoded = decoder.decode(FrameDecoder().feed(message)[0]["state_delta"])
+            ack = decoder.take_ack()
+            if ack:
+                encoder.ack(ack)
+        return size, decoded
+
+    return run, lambda: checksum(run())
+
+
+# Server
+
+class BenchmarkClient:
+    # Stands in for game_server.ClientConnection without a socket
+    def __init__(self, addr):
+        self.addr = addr
+        self.room: Optional[Room] = None
+        self.player_id: Optional[int] = None
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.rtt: Optional[float] = None
+
+    def send(self, message: Dict[str, Any]):
+        self.send_encoded(message, encode_message(message))
+
+    def send_encoded(self, message: Dict[str, Any], data: bytes):
+        self.messages_out += 1
+        self.bytes_out += len(data)
+
+    def send_queue_bytes(self) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+
+def server_relay(rng: random.Random):
+    # Framed state_deltas from two clients through GameServer's dispatch path
+    server = GameServer()
+    clients = [BenchmarkClient(("bench", i)) for i in range(2)]
+    for client in clients:
+        server.matchmaker.assign(client)
+    frames = []
+    for client in clients:
+        encoder = SnapshotEncoder(client.player_id)
+        stream = b"".join(
+            encode_message({"state_delta": encoder.encode(seq, random_state(rng, 5))}) for seq in range(1, 101)
+        )
+        frames.append((client, stream))
+
+    def run():
+        for client, stream in frames:
+            client.room.state_decoders[client.player_id].reset()
+            for message in FrameDecoder().feed(stream):
+                server._handle_message(client, message)
+    return run, lambda: checksum([client.bytes_out for client in clients])
+
+
+def server_authoritative_tick(rng: random.Random):
+    room = Room(0, capacity=8, authoritative=True)
+    clients = [BenchmarkClient(("bench", i)) for i in range(8)]
+    for client in clients:
+        client.room = room
+        client.player_id = room.add_client(client)
+
+    def run():
+        # The same opening second of a match every call: a room left running
+        # piles up bullets and loses cars, so its tick cost drifts with how
+        # many calls calibration happened to pick
+        room.reset_game_state()
+        for tick in range(MATCH_TICKS):
+            for client in clients:
+                player_input = {"seq": tick + 1, "throttle": 1, "steering": 1, "shots": tick // 10}
+                room.process_game_state({"input": player_input}, client.player_id)
+            room.step_simulation(1 / 60)
+    return run, lambda: checksum(room.simulation.healths(), [client.bytes_out for client in clients])
+
+
+CASES = [
+    Case("car_update", car_update, 1000),
+    Case("car_physics", car_physics, 1000),
+    Case("bullet_update", bullet_update, 1000),
+    Case("bullet_pool_step", bullet_pool_step, 4000),
+    Case("collides_with", collides_with, 1000),
+    Case("bullet_pool_hits_grid", bullet_pool_hits, 4000),
+    Case("car_serialize", car_serialize, 1000),
+    Case("car_deserialize", car_deserialize, 1000),
+    Case("protocol_game_state_0_bullets", message_round_trip(0), 100),
+    Case("protocol_game_state_20_bullets", message_round_trip(20), 100),
+    Case("protocol_snapshot_8_players", snapshot_round_trip, 1),
+    Case("delta_round_trip", delta_round_trip, 100),
+    Case("server_relay_messages", server_relay, 200),
+    Case("server_authoritative_tick_8_players", server_authoritative_tick, MATCH_TICKS),
+]
+
+
+def measure(case: Case, repeats: int, min_time: float) -> Dict[str, Any]:
+    run, digest = case.setup(random.Random(SEED))
+    run()
+    result = digest()
+    # Calibrate so every sample is long enough for the timer
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        if time.perf_counter() - start >= min_time:
+            break
+        calls *= 2
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        samples.append((time.perf_counter() - start) / (calls * case.ops))
+    samples.sort()
+    median = samples[len(samples) // 2]
+    return {
+        "median_us": median * 1e6,
+        "min_us": samples[0] * 1e6,
+        "ops_per_sec": 1 / median,
+        "samples": repeats,
+        "calls_per_sample": calls,
+        "ops_per_call": case.ops,
+        # First-call result from a fresh seeded setup, so it's comparable across runs
+        "checksum": result,
+    }
+
+
+async def run_cases(cases: List[Case], repeats: int, min_time: float) -> Dict[str, Any]:
+    # Rooms schedule timers and tasks, so the cases run inside an event loop;
+    # Room's per-message logging is silenced so the terminal isn't the bottleneck
+    results = {}
+    for case in cases:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[case.name] = measure(case, repeats, min_time)
+        print(f"{case.name:<40} {results[case.name]['median_us']:>10.3f} us/op {results[case.name]['ops_per_sec']:>14,.0f} ops/s")
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    ok = True
+    print(f"\n{'case':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            print(f"{name:<40} {'-':>10} {current['min_us']:>10.3f} {'new':>8}")
+            continue
+        change = current["min_us"] / previous["min_us"] - 1
+        flags = []
+        if change > threshold:
+            flags.append("SLOWER")
+            ok = False
+        if current["checksum"] != previous["checksum"]:
+            flags.append("CHECKSUM CHANGED")
+            ok = False
+        print(f"{name:<40} {previous['min_us']:>10.3f} {current['min_us']:>10.3f} {change:>+8.1%} {' '.join(flags)}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Headless Road Rage Rampage benchmarks")
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("-b", "--baseline", help="compare against results JSON from an earlier run")
+    parser.add_argument("-t", "--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown before a case fails (default 0.15)")
+    parser.add_argument("-k", "--filter", action="append", help="only run cases whose name contains this")
+    parser.add_argument("-r", "--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per sample")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CASES if not args.filter or any(f in case.name for f in args.filter)]
+    results = asyncio.run(run_cases(cases, args.repeats, args.min_time))
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "numpy": np.__version__,
+            "seed": SEED,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 0 if compare(results, baseline, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
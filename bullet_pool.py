@@ -0,0 +1,221 @@
+import heapq
+
+import numpy as np
+from typing import List, Dict, Any, Iterable, Tuple
+
+from protocol import ANGLE_SCALE, POSITION_SCALE, SNAPSHOT_BULLET_DTYPE
+
+# Struct-of-arrays bullet storage.
+#
+# Bullets live in fixed-capacity NumPy arrays instead of one Projectile object
+# each.  Direction is precomputed at spawn, so a tick is a couple of array
+# adds, and bounds culling and hit tests run over every bullet in one pass.
+# Freed slots go back on a min-heap and the lowest is handed out first, so
+# steady-state firing allocates nothing and live bullets stay packed at the
+# bottom of the arrays: every per-tick pass stops at `high`, one past the
+# highest live slot.
+
+DEFAULT_CAPACITY = 4096
+NO_OWNER = 0xFF
+
+# protocol.SNAPSHOT_BULLET_STRUCT as records, so a pool can be written to
+# and read from the wire without touching individual bullets
+WIRE_DTYPE = SNAPSHOT_BULLET_DTYPE
+
+# Decoded bullets kept between packets (e.g. in prediction.SnapshotBuffer)
+RECORD_DTYPE = np.dtype([
+    ("x", "f8"),
+    ("y", "f8"),
+    ("angle", "f8"),
+    ("speed", "f8"),
+    ("id", "u2"),
+    ("owner", "u1"),
+])
+
+
+def bullet_records(bullets: List[Dict[str, Any]]) -> np.ndarray:
+    records = np.empty(len(bullets), dtype=RECORD_DTYPE)
+    for index, bullet in enumerate(bullets):
+        records[index] = (bullet["x"], bullet["y"], bullet["angle"], bullet["speed"], bullet.get("id", 0), bullet.get("owner", NO_OWNER))
+    return records
+
+
+class BulletPool:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+        self.angle = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.ids = np.zeros(capacity, dtype=np.uint16)
+        self.owner = np.full(capacity, NO_OWNER, dtype=np.uint8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # A heap, so the lowest free slot is handed out first
+        self.free: List[int] = list(range(capacity))
+        self.high = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.capacity - len(self.free)
+
+    def clear(self):
+        self.alive[:self.high] = False
+        self.free = list(range(self.capacity))
+        self.high = 0
+
+    def spawn(self, x: float, y: float, angle: float, speed: float = 30, bullet_id: int = 0, owner: int = NO_OWNER) -> int:
+        # Returns the slot, or -1 when the pool is full and the bullet is dropped
+        if not self.free:
+            self.dropped += 1
+            return -1
+        slot = heapq.heappop(self.free)
+        radians = np.radians(angle)
+        self.x[slot] = x
+        self.y[slot] = y
+        # Matches Projectile.update: y grows downwards on screen
+        self.dx[slot] = np.cos(radians) * speed
+        self.dy[slot] = -np.sin(radians) * speed
+        self.angle[slot] = angle
+        self.speed[slot] = speed
+        self.ids[slot] = bullet_id & 0xFFFF
+        self.owner[slot] = NO_OWNER if owner is None else owner
+        self.alive[slot] = True
+        if slot >= self.high:
+            self.high = slot + 1
+        return slot
+
+    def add(self, bullet) -> int:
+        # Takes a Projectile (e.g. the one Car.shoot returns)
+        return self.spawn(bullet.position.x, bullet.position.y, bullet.angle, bullet.speed, bullet.id, bullet.owner)
+
+    def kill(self, slots: Iterable[int]):
+        for slot in slots:
+            slot = int(slot)
+            if self.alive[slot]:
+                self.alive[slot] = False
+                heapq.heappush(self.free, slot)
+        high = self.high
+        while high and not self.alive[high - 1]:
+            high -= 1
+        self.high = high
+
+    def live_slots(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[:self.high])
+
+    def cull(self, screen_width: float, screen_height: float):
+        n = self.high
+        x, y = self.x[:n], self.y[:n]
+        out = self.alive[:n] & ((x < 0) | (x > screen_width) | (y < 0) | (y > screen_height))
+        self.kill(np.flatnonzero(out))
+
+    def update(self):
+        # Dead slots move too; that is cheaper than masking and harmless
+        n = self.high
+        self.x[:n] += self.dx[:n]
+        self.y[:n] += self.dy[:n]
+
+    def step(self, screen_width: float, screen_height: float):
+        # One tick in the same order as the list code: drop out-of-bounds, then move
+        self.cull(screen_width, screen_height)
+        self.update()
+
+    def advance(self, slots: np.ndarray, ticks: float):
+        self.x[slots] += self.dx[slots] * ticks
+        self.y[slots] += self.dy[slots] * ticks
+
+    def hits(self, car_x: np.ndarray, car_y: np.ndarray, radius: np.ndarray, targetable: np.ndarray = None, grid=None) -> Tuple[np.ndarray, np.ndarray]:
+        # First car (by index) each live bullet overlaps, skipping the bullet's
+        # owner and untargetable cars.  Returns (slots, car indices).  With a
+        # spatial_hash.SpatialHash built from the same cars, only bullets that
+        # share a cell with a car are tested, using wrapped distances.
+        slots = self.live_slots()
+        if not len(slots) or not len(car_x):
+            return slots[:0], slots[:0]
+        if grid is None:
+            distance_sq = (self.x[slots, None] - car_x[None, :]) ** 2 + (self.y[slots, None] - car_y[None, :]) ** 2
+            inside = distance_sq < (radius ** 2)[None, :]
+            inside &= self.owner[slots, None] != np.arange(len(car_x))[None, :]
+            if targetable is not None:
+                inside &= targetable[None, :]
+            hit = inside.any(axis=1)
+            return slots[hit], inside[hit].argmax(axis=1)
+
+        points, cars = grid.candidates(self.x[slots], self.y[slots])
+        candidates = slots[points]
+        dx, dy = grid.delta(self.x[candidates], self.y[candidates], car_x[cars], car_y[cars])
+        inside = dx * dx + dy * dy < radius[cars] ** 2
+        inside &= self.owner[candidates] != cars
+        if targetable is not None:
+            inside &= targetable[cars]
+        points, cars = points[inside], cars[inside]
+        order = np.lexsort((cars, points))
+        points, cars = points[order], cars[order]
+        _, first = np.unique(points, return_index=True)
+        return slots[points[first]], cars[first]
+
+    def serialize(self) -> bytes:
+        # Live bullets as packed SNAPSHOT_BULLET_STRUCT records
+        slots = self.live_slots()
+        records = np.empty(len(slots), dtype=WIRE_DTYPE)
+        records["owner"] = self.owner[slots]
+        records["id"] = self.ids[slots]
+        records["x"] = np.clip(np.round(self.x[slots] * POSITION_SCALE), -32768, 32767)
+        records["y"] = np.clip(np.round(self.y[slots] * POSITION_SCALE), -32768, 32767)
+        records["angle"] = np.round((self.angle[slots] % 360) * ANGLE_SCALE).astype(np.int64) & 0xFFFF
+        records["speed"] = np.clip(np.round(self.speed[slots]), 0, 255)
+        return records.tobytes()
+
+    def deserialize(self, data) -> int:
+        # Replaces the contents with records written by serialize(); returns the count
+        wire = np.frombuffer(data, dtype=WIRE_DTYPE)
+        records = np.empty(len(wire), dtype=RECORD_DTYPE)
+        records["x"] = wire["x"] / POSITION_SCALE
+        records["y"] = wire["y"] / POSITION_SCALE
+        records["angle"] = wire["angle"] / ANGLE_SCALE
+        records["speed"] = wire["speed"]
+        records["id"] = wire["id"]
+        records["owner"] = wire["owner"]
+        self.load(records)
+        return len(self)
+
+    def load(self, records: np.ndarray, ticks: float = 0.0):
+        # Replaces the contents with bullet_records() output moved `ticks` ahead
+        count = min(len(records), self.capacity)
+        self.dropped += len(records) - count
+        records = records[:count]
+        self.clear()
+        self.free = list(range(count, self.capacity))
+        self.high = count
+        radians = np.radians(records["angle"])
+        self.dx[:count] = np.cos(radians) * records["speed"]
+        self.dy[:count] = -np.sin(radians) * records["speed"]
+        self.x[:count] = records["x"] + self.dx[:count] * ticks
+        self.y[:count] = records["y"] + self.dy[:count] * ticks
+        self.angle[:count] = records["angle"]
+        self.speed[:count] = records["speed"]
+        self.ids[:count] = records["id"]
+        self.owner[:count] = records["owner"]
+        self.alive[:count] = True
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        # Bullet.serialize-style dicts for the delta codec
+        result = []
+        for slot in self.live_slots().tolist():
+            bullet = {
+                "id": int(self.ids[slot]),
+                "x": float(self.x[slot]),
+                "y": float(self.y[slot]),
+                "angle": float(self.angle[slot]),
+                "speed": float(self.speed[slot]),
+            }
+            if self.owner[slot] != NO_OWNER:
+                bullet["owner"] = int(self.owner[slot])
+            result.append(bullet)
+        return result
+
+    def load_dicts(self, bullets: Iterable[Dict[str, Any]]):
+        self.clear()
+        for bullet in bullets:
+            self.spawn(bullet["x"], bullet["y"], bullet["angle"], bullet["speed"], bullet.get("id", 0), bullet.get("owner", NO_OWNER))
@@ -0,0 +1,249 @@
+import math
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from protocol import (
+    ABSENT,
+    ANGLE_SCALE,
+    DELTA_CAR_FIELDS,
+    POSITION_SCALE,
+    quantize_angle,
+    quantize_position,
+)
+
+# Acknowledged-baseline snapshot deltas.
+#
+# Each sender keeps the snapshots it has sent; the receiver acks the ones it
+# applied and the sender diffs every new snapshot against the newest acked one.
+# Car fields are only sent when they differ from the baseline (as small zigzag
+# deltas), and bullets that are still flying in a straight line are not sent at
+# all: both sides extrapolate them from the baseline by the number of frames
+# between the two sequence numbers.  Snapshots are compared in the quantized
+# wire representation, so "unchanged" is exact.
+
+HISTORY_SIZE = 64
+ACK_INTERVAL = 2
+BULLET_TOLERANCE = POSITION_SCALE  # resend a bullet once prediction is off by more than 1 px
+ANGLE_INDEX = DELTA_CAR_FIELDS.index("angle")
+DEFAULT_CAR = (0, 0, 0, 0, ABSENT)
+
+BulletTuple = Tuple[int, int, int, int]
+
+
+class Snapshot:
+    __slots__ = ("seq", "car", "bullets")
+
+    def __init__(self, seq: int, car: Tuple[int, ...], bullets: Dict[int, BulletTuple]):
+        self.seq = seq
+        self.car = car
+        self.bullets = bullets
+
+
+def seq_newer(a: int, b: int) -> bool:
+    return 0 < ((a - b) & 0xFFFF) < 0x8000
+
+
+def quantize_car(state: Dict[str, Any]) -> Tuple[int, ...]:
+    car = state["car"]
+    other_car_health = state.get("other_car_health")
+    return (
+        quantize_position(car["x"]),
+        quantize_position(car["y"]),
+        quantize_angle(car["angle"]),
+        max(0, min(254, int(car["health"]))),
+        ABSENT if other_car_health is None else max(0, min(254, int(other_car_health))),
+    )
+
+
+def quantize_bullets(state: Dict[str, Any]) -> Dict[int, BulletTuple]:
+    return {
+        bullet.get("id", index) & 0xFFFF: (
+            quantize_position(bullet["x"]),
+            quantize_position(bullet["y"]),
+            quantize_angle(bullet["angle"]),
+            max(0, min(255, round(bullet["speed"]))),
+        )
+        for index, bullet in enumerate(state["bullets"])
+    }
+
+
+def predict_bullet(bullet: BulletTuple, steps: int) -> BulletTuple:
+    # Mirrors Bullet.update applied `steps` times, computed from the quantized baseline
+    x, y, angle, speed = bullet
+    radians = math.radians(angle / ANGLE_SCALE)
+    distance = speed * steps
+    return (
+        quantize_position(x / POSITION_SCALE + math.cos(radians) * distance),
+        quantize_position(y / POSITION_SCALE - math.sin(radians) * distance),
+        angle,
+        speed,
+    )
+
+
+def _field_delta(index: int, value: int, base: int) -> int:
+    if index == ANGLE_INDEX:
+        return ((value - base + 32768) & 0xFFFF) - 32768
+    return value - base
+
+
+def _apply_field_delta(index: int, base: int, delta: int) -> int:
+    if index == ANGLE_INDEX:
+        return (base + delta) & 0xFFFF
+    return base + delta
+
+
+def snapshot_to_state(snapshot: Snapshot) -> Dict[str, Any]:
+    x, y, angle, health, other_car_health = snapshot.car
+    state = {
+        "car": {
+            "x": x / POSITION_SCALE,
+            "y": y / POSITION_SCALE,
+            "angle": angle / ANGLE_SCALE,
+            "health": health,
+        },
+        "bullets": [
+            {"id": bullet_id, "x": bx / POSITION_SCALE, "y": by / POSITION_SCALE, "angle": ba / ANGLE_SCALE, "speed": speed}
+            for bullet_id, (bx, by, ba, speed) in snapshot.bullets.items()
+        ],
+    }
+    if other_car_health != ABSENT:
+        state["other_car_health"] = other_car_health
+    return state
+
+
+class SnapshotEncoder:
+    def __init__(self, player: int, history_size: int = HISTORY_SIZE):
+        self.player = player
+        self.history_size = history_size
+        self.history: "OrderedDict[int, Snapshot]" = OrderedDict()
+        self.acked: Optional[Snapshot] = None
+
+    def reset(self):
+        self.history.clear()
+        self.acked = None
+
+    def ack(self, ack: Dict[str, Any]):
+        if ack.get("keyframe"):
+            self.acked = None
+            return
+        snapshot = self.history.get(ack["seq"] & 0xFFFF)
+        if snapshot is not None and (self.acked is None or snapshot.seq > self.acked.seq):
+            self.acked = snapshot
+
+    def encode(self, seq: int, state: Dict[str, Any]) -> Dict[str, Any]:
+        base = self.acked
+        if base is not None and self.history.get(base.seq & 0xFFFF) is not base:
+            base = None
+        car = quantize_car(state)
+        bullets = quantize_bullets(state)
+
+        base_car = base.car if base else DEFAULT_CAR
+        car_delta = {
+            name: _field_delta(index, car[index], base_car[index])
+            for index, name in enumerate(DELTA_CAR_FIELDS)
+            if car[index] != base_car[index]
+        }
+
+        # What the receiver will hold after applying this delta; that, not the
+        # exact state, becomes the baseline for later deltas.
+        reconstructed: Dict[int, BulletTuple] = {}
+        changed: List[Tuple[int, int, int, int, int]] = []
+        removed: List[int] = []
+        if base is not None:
+            steps = seq - base.seq
+            for bullet_id, bullet in base.bullets.items():
+                current = bullets.get(bullet_id)
+                if current is None:
+                    removed.append(bullet_id)
+                    continue
+                predicted = predict_bullet(bullet, steps)
+                if (
+                    current[2:] == predicted[2:]
+                    and abs(current[0] - predicted[0]) <= BULLET_TOLERANCE
+                    and abs(current[1] - predicted[1]) <= BULLET_TOLERANCE
+                ):
+                    reconstructed[bullet_id] = predicted
+        for bullet_id, bullet in bullets.items():
+            if bullet_id not in reconstructed:
+                reconstructed[bullet_id] = bullet
+                changed.append((bullet_id,) + bullet)
+
+        self.history[seq & 0xFFFF] = Snapshot(seq, car, reconstructed)
+        self.history.move_to_end(seq & 0xFFFF)
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+        return {
+            "player": self.player,
+            "seq": seq & 0xFFFF,
+            "base": seq - base.seq if base else 0,
+            "car": car_delta,
+            "removed": removed,
+            "bullets": changed,
+        }
+
+
+class SnapshotDecoder:
+    def __init__(self, history_size: int = HISTORY_SIZE, ack_interval: int = ACK_INTERVAL):
+        self.history_size = history_size
+        self.ack_interval = ack_interval
+        self.history: "OrderedDict[int, Snapshot]" = OrderedDict()
+        self.latest_seq: Optional[int] = None
+        # Unwrapped sender frame number of the latest snapshot, for re-encoding relays
+        self.frame = 0
+        self.pending_ack: Optional[Dict[str, Any]] = None
+        self._unacked = 0
+
+    def reset(self):
+        self.history.clear()
+        self.latest_seq = None
+        self.frame = 0
+        self.pending_ack = None
+        self._unacked = 0
+
+    def take_ack(self) -> Optional[Dict[str, Any]]:
+        ack, self.pending_ack = self.pending_ack, None
+        return ack
+
+    def decode(self, delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Returns the full state, or None for stale deltas and for deltas whose
+        # baseline is gone; the latter queues a keyframe request in pending_ack.
+        seq = delta["seq"]
+        if delta["base"] and self.latest_seq is not None and not seq_newer(seq, self.latest_seq):
+            return None
+        if delta["base"]:
+            base = self.history.get((seq - delta["base"]) & 0xFFFF)
+            if base is None:
+                self.pending_ack = {"player": delta["player"], "seq": seq, "keyframe": True}
+                return None
+            car = list(base.car)
+            bullets = {bullet_id: predict_bullet(bullet, delta["base"]) for bullet_id, bullet in base.bullets.items()}
+        else:
+            # Keyframes are always accepted; an old sequence number means the
+            # sender restarted, so the baselines we hold are meaningless
+            if self.latest_seq is not None and not seq_newer(seq, self.latest_seq):
+                self.history.clear()
+            car = list(DEFAULT_CAR)
+            bullets = {}
+
+        for index, name in enumerate(DELTA_CAR_FIELDS):
+            if name in delta["car"]:
+                car[index] = _apply_field_delta(index, car[index], delta["car"][name])
+        for bullet_id in delta["removed"]:
+            bullets.pop(bullet_id, None)
+        for bullet_id, x, y, angle, speed in delta["bullets"]:
+            bullets[bullet_id] = (x, y, angle, speed)
+
+        snapshot = Snapshot(seq, tuple(car), bullets)
+        self.history[seq] = snapshot
+        self.history.move_to_end(seq)
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+        self.frame += max(1, (seq - self.latest_seq) & 0xFFFF) if self.latest_seq is not None else seq
+        self.latest_seq = seq
+
+        self._unacked += 1
+        if not delta["base"] or self._unacked >= self.ack_interval:
+            self._unacked = 0
+            self.pending_ack = {"player": delta["player"], "seq": seq, "keyframe": False}
+        return snapshot_to_state(snapshot)
@@ -1,52 +1,75 @@
+import numpy as np
 import pygame
-import socket
 import threading
-import pickle
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Tuple
+from assets import assets
+from audio import AudioSystem
 from car import Car
-from Bullet import Bullet
+from Bullet import draw_bullets
+from protocol import MAX_NAME_BYTES, ProtocolError, PROTOCOL_VERSION, encode_message
+from delta import SnapshotDecoder, SnapshotEncoder, seq_newer
+from prediction import InputPredictor, SnapshotBuffer
+from recording import RECORD_PLAYER, MatchRecorder, flush_recordings
+from bullet_pool import BulletPool, bullet_records
+from simulation import separate_cars
+from spatial_hash import SpatialHash
+from physics import FixedTimestep
+from profiler import FrameProfiler
+from renderer import DirtyRenderer, PerfOverlay, TextCache
+from sprites import CAR_IMAGE, CAR_SCALE, sprite_cache
+from transport import InboundQueue, connect
 
 import logging
 logging.basicConfig(level=logging.CRITICAL, format='%(asctime)s - %(levelname)s - %(message)s')
 
+FRAME_RATE = 60
+BACKGROUND_IMAGE = "images/1.png"
+TEXT_COLOUR = (255, 22, 93)
+# Never simulate more than this many ticks in one frame after a stall
+MAX_CATCHUP_TICKS = 5
+# Network ticks per second: everything queued in between goes out in one write
+SEND_RATE = 30
+
 class Game:
-    def __init__(self, host: str = "158.101.115.232", port: int = 12345): # Server: 158.101.115.232:12345
+    def __init__(self, host: str = "158.101.115.232", port: int = 12345, transport: str = "tcp", record: Optional[str] = None, profile: Optional[str] = None, send_rate: float = SEND_RATE, name: Optional[str] = None): # Server: 158.101.115.232:12345
+        self.running = True
+        self.send_rate = send_rate
+        # Frame timings are written here (CSV or JSON) when the game exits
+        self.profile_path = profile
+        # Optional local recording of everything sent and received, playable with replay.py
+        self.recorder = MatchRecorder(record, {"source": "client", "server": f"{host}:{port}", "transport": transport}, FRAME_RATE) if record else None
         self.initialize_pygame()
-        self.initialize_network(host, port)
         self.initialize_game_state()
-        self.running = True  
+        self.initialize_network(host, port, transport)
+        # The server keeps our stats under this name; without one, under our address
+        if name:
+            self.send_to_server({"player_name": name}, flush=True)
 
     def initialize_pygame(self):
         pygame.init()
         self.setup_display()
-        self.setup_audio()
-        self.setup_game_state()
-        self.setup_network(host, port)
 
     def setup_display(self):
         self.screen = pygame.display.set_mode((1366, 768))
-        #1 file
-        self.background = pygame.image.load('images/1.png').convert()
+        self.background = assets.image(BACKGROUND_IMAGE).convert()
+        self.renderer = DirtyRenderer(self.screen, self.background)
+        self.text_cache = TextCache()
         self.clock = pygame.time.Clock()
+        self.profiler = FrameProfiler(network=self.network_totals, keep_session=self.profile_path is not None)
+        self.perf_overlay = PerfOverlay(self.profiler)
         self.load_sounds()
+        # Build every car rotation now rather than hitching the first laps
+        sprite_cache.warm(CAR_IMAGE, CAR_SCALE)
 
     def load_sounds(self):
-        #4  files / 2 sounds
-        self.game_sound = self.load_sound('sounds/Music (1).wav', 0.5)
-        self.impact_sound = self.load_sound('sounds/Impact audio.ogg', 0.5)
-        self.win_sound = self.load_sound('sounds/Dota Rampage Sound.mp3', 0.5)
-        self.lose_sound = self.load_sound('sounds/Rick and Morty Wrecked sound.mp3', 0.5)
-
-    @staticmethod
-    def load_sound(path: str, volume: float) -> pygame.mixer.Sound:
-        sound = pygame.mixer.Sound(path)
-        sound.set_volume(volume)
-        return sound
-
-    def initialize_network(self, host: str, port: int):
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client.connect((host, port))
-        print(f"Connected to server at {host}:{port}")
+        # Shared handles; the sounds themselves are decoded in the background
+        self.audio = AudioSystem()
+        self.audio.preload()
+
+    def initialize_network(self, host: str, port: int, transport: str = "tcp"):
+        self.client = connect(host, port, transport)
+        print(f"Connected to server at {host}:{port} over {transport.upper()}")
         threading.Thread(target=self.handle_server, daemon=True).start()
 
     def initialize_game_state(self):
@@ -54,38 +77,104 @@ class Game:
         self.other_player_id: Optional[int] = None
         self.car1: Optional[Car] = None
         self.car2: Optional[Car] = None
-        self.bullets1: List[Bullet] = []
-        self.bullets2: List[Bullet] = []
+        self.bullets1 = BulletPool()
+        self.bullets2 = BulletPool()
+        self.collision_grid = SpatialHash(*self.screen.get_size())
         self.game_started = False
         self.waiting_for_player = True
         self.game_over = False
         self.winner = None
+        self.frame = 0
+        # Server-authoritative rooms: we send inputs and render the server's snapshots
+        self.authoritative = False
+        self.input_seq = 0
+        self.shots = 0
+        self.state_encoder = SnapshotEncoder(0)
+        self.state_decoder = SnapshotDecoder()
+        # Filled by the receive thread, applied by the main loop once per frame
+        self.inbound = InboundQueue()
+        self.coalesced_states = 0
+        # Remote car and bullets are rendered INTERPOLATION_DELAY in the past;
+        # in authoritative rooms the local car is predicted ahead of the server.
+        self.tick_rate = FRAME_RATE
+        self.remote_buffer = SnapshotBuffer(FRAME_RATE)
+        self.predictor = InputPredictor(FRAME_RATE)
+        # Our car and bullets move in whole ticks of the room's rate, never by frame time
+        self.timestep = FixedTimestep(1 / FRAME_RATE, MAX_CATCHUP_TICKS)
+        self.send_accumulator = 0.0
+        self.pending_shots = 0
+        # Own bullets fired locally that the server hasn't acked yet: (input seq, spawn state)
+        self.predicted_bullets: List[Tuple[int, Dict[str, Any]]] = []
+        self.snapshot_tick: Optional[int] = None
         logging.info("Game state initialized")
 
     def handle_server(self) -> None:
         logging.info("Server handling thread started")
         while True:
             try:
-                data = self.client.recv(1024)
-                if not data:
-                    logging.warning("Server closed the connection")
-                    break
-                decoded_data = pickle.loads(data)
-                logging.debug(f"Received data from server: {decoded_data}")
-                self.process_server_data(decoded_data)
-            except pickle.UnpicklingError as e:
-                logging.error(f"Error unpickling data: {e}", exc_info=True)
+                for decoded_data in self.client.receive():
+                    logging.debug(f"Received data from server: {decoded_data}")
+                    if self.recorder is not None:
+                        self.recorder.sent(self.recorded_player(decoded_data), encode_message(decoded_data))
+                    if "ping" in decoded_data:
+                        # Answered here rather than queued so the RTT excludes frame time
+                        self.send_to_server({"pong": decoded_data["ping"]}, flush=True)
+                    else:
+                        self.inbound.put(decoded_data)
+            except ConnectionError as e:
+                logging.warning(f"Connection lost: {e}")
+                break
+            except ProtocolError as e:
+                logging.error(f"Malformed data from server: {e}", exc_info=True)
+                break
             except Exception as e:
                 logging.error(f"Error in handle_server: {e}", exc_info=True)
                 break
         logging.info("handle_server thread exiting")
-        self.game_started = False
-        self.waiting_for_player = True
+        self.inbound.put({"connection_lost": True})
+
+    def network_totals(self) -> Tuple[int, int, float, int]:
+        client = self.client
+        return client.bytes_in, client.messages_in, client.decode_seconds, self.coalesced_states
+
+    def process_inbound(self):
+        # Everything received since the last frame, in arrival order, except
+        # that a run of states only applies the newest.  Every delta is still
+        # decoded, since each one moves the decoder's baseline along.
+        state = None
+        for message in self.inbound.drain():
+            if "state_delta" in message:
+                decoded = self.receive_state_delta(message["state_delta"])
+                if decoded is None:
+                    continue
+                message = {"game_state": decoded}
+            if "game_state" in message or "snapshot" in message:
+                if state is not None:
+                    self.coalesced_states += 1
+                state = message
+                continue
+            if state is not None:
+                self.process_server_data(state)
+                state = None
+            if "connection_lost" in message:
+                self.game_started = False
+                self.waiting_for_player = True
+            else:
+                self.process_server_data(message)
+        if state is not None:
+            self.process_server_data(state)
 
     def process_server_data(self, game_state: Dict[str, Any]):
+        # Pings are answered by handle_server and deltas decoded by process_inbound
         logging.debug(f"Processing server data: {game_state}")
         if "player_id" in game_state:
+            if game_state.get("protocol_version") != PROTOCOL_VERSION:
+                logging.error(f"Server speaks protocol {game_state.get('protocol_version')}, expected {PROTOCOL_VERSION}")
+                self.running = False
+                return
             logging.info(f"Received player_id: {game_state['player_id']}")
+            self.authoritative = game_state.get("authoritative", False)
+            self.tick_rate = game_state.get("tick_rate") or FRAME_RATE
             self.set_player_ids(game_state["player_id"])
             if game_state.get("game_started", False):
                 logging.info("Game already in progress, joining...")
@@ -100,6 +189,10 @@ class Game:
         elif "game_state" in game_state and self.car2:
             logging.debug("Updating other player state")
             self.update_other_player_state(game_state["game_state"])
+        elif "snapshot" in game_state and self.car1 and self.car2:
+            self.apply_snapshot(game_state["snapshot"])
+        elif "state_ack" in game_state:
+            self.state_encoder.ack(game_state["state_ack"])
         elif "hit" in game_state:
             logging.debug(f"Processing hit: {game_state['hit']}")
             self.process_hit(game_state["hit"])
@@ -110,14 +203,29 @@ class Game:
             logging.info("Game over received")
             self.game_over = True
             self.winner = game_state["winner"]
+            self.audio.post("win" if self.winner == self.player_id else "lose")
         logging.debug(f"After processing: game_started={self.game_started}, waiting_for_player={self.waiting_for_player}, game_over={self.game_over}")
 
     def set_player_ids(self, player_id: int):
         self.player_id = player_id
         self.other_player_id = 1 if player_id == 0 else 0
         logging.info(f"Player IDs set: self={self.player_id}, other={self.other_player_id}")
+        self.state_encoder = SnapshotEncoder(player_id)
+        self.state_decoder.reset()
+        self.remote_buffer = SnapshotBuffer(self.tick_rate)
+        self.predictor = InputPredictor(self.tick_rate)
+        self.timestep = FixedTimestep(1 / self.tick_rate, MAX_CATCHUP_TICKS)
+        self.reset_prediction()
         self.initialize_cars()
 
+    def reset_prediction(self):
+        self.remote_buffer.clear()
+        self.predictor.clear()
+        self.timestep.reset()
+        self.pending_shots = 0
+        self.predicted_bullets.clear()
+        self.snapshot_tick = None
+
     def reset_game(self, game_state: Dict[str, Any]):
         logging.info("Resetting game state")
         if "car_healths" in game_state:
@@ -133,6 +241,11 @@ class Game:
         
         self.bullets1.clear()
         self.bullets2.clear()
+        self.state_encoder.reset()
+        self.state_decoder.reset()
+        self.input_seq = 0
+        self.shots = 0
+        self.reset_prediction()
         self.initialize_cars()
         self.waiting_for_player = True
         self.game_started = False
@@ -150,12 +263,56 @@ class Game:
             self.car2 = Car(100, screen_height // 2, angle=0)
 
     def update_other_player_state(self, other_player_state: Dict[str, Any]):
-        self.car2.deserialize(other_player_state["car"])
-        self.bullets2 = [Bullet.deserialize(b) for b in other_player_state["bullets"]]
+        # Relayed states are stamped with the sender's frame counter
+        self.remote_buffer.push(self.state_decoder.frame, {
+            "car": other_player_state["car"],
+            "bullets": bullet_records(other_player_state["bullets"]),
+        }, time.monotonic())
         if "other_car_health" in other_player_state and self.car1:
             self.car1.health = other_player_state["other_car_health"]
             self.car1.health_bar.health = self.car1.health
 
+    def receive_state_delta(self, delta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        other_player_state = self.state_decoder.decode(delta)
+        ack = self.state_decoder.take_ack()
+        if ack:
+            self.send_to_server({"state_ack": ack})
+        return other_player_state
+
+    def apply_snapshot(self, snapshot: Dict[str, Any]):
+        tick = snapshot["tick"]
+        if self.snapshot_tick is not None:
+            tick = self.snapshot_tick + ((tick - self.snapshot_tick + 0x8000) & 0xFFFF) - 0x8000
+            if tick <= self.snapshot_tick:
+                return
+        self.snapshot_tick = tick
+        acked_seq = snapshot["acks"][self.player_id]
+        self.predictor.reconcile(self.car1, snapshot["cars"][self.player_id], acked_seq, *self.screen.get_size())
+        # The server's copies of our bullets are as old as acked_seq; bring
+        # them up to the predicted present and keep the ones it hasn't fired yet
+        ahead = len(self.predictor.pending)
+        self.predicted_bullets = [(seq, b) for seq, b in self.predicted_bullets if seq_newer(seq, acked_seq)]
+        self.bullets1.load(bullet_records([b for b in snapshot["bullets"] if b["owner"] == self.player_id]), ahead)
+        for seq, spawn in self.predicted_bullets:
+            slot = self.bullets1.spawn(spawn["x"], spawn["y"], spawn["angle"], spawn["speed"], spawn["id"], self.player_id)
+            if slot >= 0:
+                self.bullets1.advance(slot, ((self.input_seq - seq) & 0xFFFF) + 1)
+        self.bullets1.cull(*self.screen.get_size())
+        if snapshot["cars"][self.other_player_id] is None:
+            # Left out by the server's interest management
+            return
+        self.remote_buffer.push(tick, {
+            "car": snapshot["cars"][self.other_player_id],
+            "bullets": bullet_records([b for b in snapshot["bullets"] if b["owner"] != self.player_id]),
+        }, time.monotonic())
+
+    def update_remote_state(self):
+        state = self.remote_buffer.sample(time.monotonic(), *self.screen.get_size())
+        if state is None:
+            return
+        self.car2.deserialize(state["car"])
+        self.bullets2.load(state["bullets"], state["elapsed"])
+
     def process_hit(self, hit_data: Dict[str, Any]):
         target, new_health = hit_data["target"], hit_data["health"]
         car = self.car1 if target == self.player_id else self.car2
@@ -165,35 +322,64 @@ class Game:
 
     def run(self) -> None:
         logging.info("Game loop starting")
-        self.game_sound.play()
+        self.audio.play_music()
+        profiler = self.profiler
         while self.running:
+            profiler.begin_frame()
             dt = self.clock.tick(60) / 1000
-            if not pygame.mixer.get_busy():
-                self.game_sound.play()
+            profiler.lap("idle")
 
             if self.handle_events():
                 break
+            profiler.lap("events")
+            self.process_inbound()
+            profiler.lap("receive")
 
             if self.game_started and self.car1 and self.car2 and not self.game_over:
-                self.update_game_state(dt)
-                self.check_collisions()
-                self.send_game_state()
+                if self.authoritative:
+                    self.update_predicted_state(dt)
+                    profiler.lap("update")
+                else:
+                    self.update_game_state(dt)
+                    profiler.lap("update")
+                    self.check_collisions()
+                    profiler.lap("collisions")
+                self.update_remote_state()
+                profiler.lap("remote")
+
+            self.network_tick(dt)
+            profiler.lap("send")
+            # Everything this frame posted, played at most once per event
+            self.audio.update()
+            profiler.lap("audio")
 
             self.draw()
-            pygame.display.flip()
 
         logging.info("Game loop ending")
         pygame.quit()
         self.client.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            flush_recordings()
+        if self.profile_path is not None:
+            profiler.finish()
+            profiler.export(self.profile_path)
+            print(f"Wrote {len(profiler.session_frames())} frame timings to {self.profile_path}")
 
     def handle_events(self) -> bool:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False  
                 return True
+            if self.audio.handle_event(event):
+                continue
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.perf_overlay.toggle()
+            if event.type == pygame.VIDEOEXPOSE:
+                # The window contents were lost (e.g. un-minimised); redraw everything
+                self.renderer.invalidate()
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                font = pygame.font.Font(None, 36)
-                quit_text = font.render("Quiting the game...", True, (255, 22, 93))
+                quit_text = self.text_cache.render("Quiting the game...", 36, TEXT_COLOUR)
                 quit_text_rect = quit_text.get_rect(center=(self.screen.get_width() / 2 - 150, self.screen.get_height() / 2 + 100))
                 self.screen.blit(quit_text, quit_text_rect) #1 surface
                 self.running = False  # Pressing ESC also stops the game
@@ -216,7 +402,12 @@ class Game:
             elif event.key == pygame.K_d:
                 self.car1.steering = -self.car1.max_steering
             elif event.key == pygame.K_SPACE:
-                self.bullets1.append(self.car1.shoot())
+                if self.authoritative:
+                    # Fired on the next predicted tick, together with its input
+                    self.pending_shots += 1
+                else:
+                    self.bullets1.add(self.car1.shoot())
+                    self.audio.post("shot")
         elif event.type == pygame.KEYUP:
             if event.key in [pygame.K_w, pygame.K_s]:
                 self.car1.acceleration = 0
@@ -224,35 +415,112 @@ class Game:
                 self.car1.steering = 0
 
     def update_game_state(self, dt):
-        self.car1.update(dt)
-        self.bullets1 = [b for b in self.bullets1 if not b.is_out_of_bounds(*self.screen.get_size())]
-        for bullet in self.bullets1:
-            bullet.update()
+        # A frame number is a tick, so the other client's SnapshotBuffer can
+        # use it as time however fast this display runs
+        tick_dt = self.timestep.step_dt
+        for _ in range(self.timestep.advance(dt)):
+            self.frame += 1
+            self.car1.update(tick_dt)
+            self.car1.wrap(*self.screen.get_size())
+            self.bullets1.step(*self.screen.get_size())
 
     def check_collisions(self):
-        for bullet in self.bullets1[:]:
-            if bullet.collides_with(self.car2):
-                self.impact_sound.play()
-                self.send_hit_data()
-                self.bullets1.remove(bullet)
-
-    def send_hit_data(self):
-        hit_data = {"hit": {"target": self.other_player_id}}
+        car_x, car_y = np.array([self.car2.position.x]), np.array([self.car2.position.y])
+        hit_radius = np.array([self.car2.length / 2])
+        self.collision_grid.build(car_x, car_y, hit_radius)
+        hits, _ = self.bullets1.hits(car_x, car_y, hit_radius, grid=self.collision_grid)
+        for slot in hits.tolist():
+            self.audio.post("impact")
+            self.send_hit_data(slot)
+        self.bullets1.kill(hits)
+        # Only our own car is ours to move; the other client pushes theirs
+        dx, dy = self.collision_grid.delta(self.car1.position.x, self.car1.position.y, self.car2.position.x, self.car2.position.y)
+        if separate_cars(self.car1, self.car2, dx, dy, a_share=1.0):
+            self.car1.wrap(*self.screen.get_size())
+
+    def send_hit_data(self, slot: int):
+        # The server re-checks the hit against the target as we drew it
+        hit_data = {"hit": {
+            "target": self.other_player_id,
+            "bullet": int(self.bullets1.ids[slot]),
+            "x": float(self.bullets1.x[slot]),
+            "y": float(self.bullets1.y[slot]),
+            "delay": self.remote_buffer.delay,
+        }}
         self.send_to_server(hit_data)
 
+    def network_tick(self, dt: float):
+        # Relay rooms get our latest state once per network tick rather than
+        # every frame; inputs, hits and acks queued since the last tick go
+        # out in the same write
+        interval = 1 / self.send_rate
+        self.send_accumulator += dt
+        if self.send_accumulator < interval:
+            return
+        self.send_accumulator = min(self.send_accumulator - interval, interval)
+        if self.game_started and self.car1 and self.car2 and not self.game_over and not self.authoritative:
+            self.send_game_state()
+        try:
+            self.client.flush()
+        except Exception as e:
+            logging.error(f"Error sending data: {e}", exc_info=True)
+
     def send_game_state(self):
         game_state = {
-            "game_state": {
-                "car": self.car1.serialize(),
-                "bullets": [bullet.serialize() for bullet in self.bullets1],
-            }
+            "car": self.car1.serialize(),
+            "bullets": self.bullets1.to_dicts(),
         }
-        self.send_to_server(game_state)
+        self.send_to_server({"state_delta": self.state_encoder.encode(self.frame, game_state)})
         logging.debug("Sent game state to server")
 
-    def send_to_server(self, data):
+    def update_predicted_state(self, dt):
+        # One input per server tick, applied locally right away
+        for _ in range(self.timestep.advance(dt)):
+            self.predict_tick(self.timestep.step_dt)
+
+    def predict_tick(self, dt):
+        throttle = (self.car1.acceleration > 0) - (self.car1.acceleration < 0)
+        steering = (self.car1.steering > 0) - (self.car1.steering < 0)
+        self.input_seq = (self.input_seq + 1) & 0xFFFF
+        self.shots += self.pending_shots
+        self.send_input(throttle, steering)
+        # Same order as Simulation.step: move, fire, then advance bullets
+        self.predictor.record(self.input_seq, throttle, steering)
+        self.car1.update(dt)
+        self.car1.wrap(*self.screen.get_size())
+        for _ in range(self.pending_shots):
+            bullet = self.car1.shoot()
+            self.predicted_bullets.append((self.input_seq, bullet.serialize()))
+            self.bullets1.add(bullet)
+            self.audio.post("shot")
+        self.pending_shots = 0
+        self.bullets1.step(*self.screen.get_size())
+
+    def send_input(self, throttle: int, steering: int):
+        self.send_to_server({
+            "input": {
+                "seq": self.input_seq,
+                "throttle": throttle,
+                "steering": steering,
+                "shots": self.shots,
+            }
+        })
+
+    def recorded_player(self, message: Dict[str, Any]) -> int:
+        # The very first message is the one that tells us our id.  A client
+        # recording only ever holds our own traffic, so the id is just a tag
+        # and is folded into the kind byte's 6 bits for rooms of 64 or more
+        player_id = self.player_id if self.player_id is not None else message.get("player_id", 0)
+        return player_id & RECORD_PLAYER
+
+    def send_to_server(self, data, flush: bool = False):
+        # Queued until the next network tick unless flush is set
+        if self.recorder is not None:
+            self.recorder.received(self.recorded_player(data), encode_message(data))
         try:
-            self.client.send(pickle.dumps(data))
+            self.client.queue(data)
+            if flush:
+                self.client.flush()
         except Exception as e:
             logging.error(f"Error sending data: {e}", exc_info=True)
 
@@ -267,58 +535,82 @@ class Game:
         return False
 
     def draw(self):
-        self.screen.blit(self.background, (0, 0)) # 1 surface
         if self.waiting_for_player:
-            self.draw_waiting_message()
-            logging.debug("Drawing waiting message")
+            scene = "waiting"
         elif self.game_over:
-            self.draw_game_over_message()
-            logging.debug("Drawing game over message")
+            scene = ("game_over", self.winner)
         elif self.game_started:
+            scene = "playing"
+        else:
+            scene = None
+        self.renderer.begin_frame(scene)
+        # Static screens are drawn once, when the scene changes
+        if self.renderer.scene_changed:
+            if self.waiting_for_player:
+                self.draw_waiting_message()
+                logging.debug("Drawing waiting message")
+            elif self.game_over:
+                self.draw_game_over_message()
+                logging.debug("Drawing game over message")
+        if scene == "playing":
             self.draw_game_objects()
             logging.debug("Drawing game objects")
+        self.renderer.mark(self.perf_overlay.draw(self.screen, time.monotonic()))
+        self.profiler.lap("draw")
+        self.renderer.present()
+        self.profiler.lap("flip")
 
     def draw_game_over_message(self):
-        font = pygame.font.Font(None, 72)
+        width, height = self.screen.get_size()
         if self.winner == self.player_id:
-            self.win_sound.play()
-            text = font.render("RAMPAGE!", True, (255, 22, 93))
+            text = self.text_cache.render("RAMPAGE!", 72, TEXT_COLOUR)
         else:
-            self.lose_sound.play()
-            text = font.render("You Got RECT!", True, (255, 22, 93))
-        text_rect = text.get_rect(center=(self.screen.get_width() / 2, self.screen.get_height() / 2))
+            text = self.text_cache.render("You Got RECT!", 72, TEXT_COLOUR)
+        text_rect = text.get_rect(center=(width / 2, height / 2))
         self.screen.blit(text, text_rect) # 1 surface
 
-        font = pygame.font.Font(None, 36)
-        subtext = font.render("Waiting for new game...", True, (255, 22, 93))
-        subtext_rect = subtext.get_rect(center=(self.screen.get_width() / 2, self.screen.get_height() / 2 + 50))
+        subtext = self.text_cache.render("Waiting for new game...", 36, TEXT_COLOUR)
+        subtext_rect = subtext.get_rect(center=(width / 2, height / 2 + 50))
         self.screen.blit(subtext, subtext_rect) # 1 surface
-        escape_text = font.render("Press Escape to exit at any time", True, (255, 22, 93))
-        escape_text_rect = text.get_rect(center=(self.screen.get_width() / 2 - 50, self.screen.get_height() / 2 + 100))
+        escape_text = self.text_cache.render("Press Escape to exit at any time", 36, TEXT_COLOUR)
+        escape_text_rect = text.get_rect(center=(width / 2 - 50, height / 2 + 100))
         self.screen.blit(escape_text, escape_text_rect) #1 surface
-        shoot_text = font.render("Press WASD keys to move and Space to Shoot", True, (255, 22, 93))
-        shoot_text_rect = text.get_rect(center=(self.screen.get_width() / 2 - 150, self.screen.get_height() / 2 + 150))
+        shoot_text = self.text_cache.render("Press WASD keys to move and Space to Shoot", 36, TEXT_COLOUR)
+        shoot_text_rect = text.get_rect(center=(width / 2 - 150, height / 2 + 150))
         self.screen.blit(shoot_text, shoot_text_rect) #1 surface
 
     def draw_waiting_message(self):
-        font = pygame.font.Font(None, 36)
-        text = font.render("Waiting for other player...", True, (255, 22, 93))
-        text_rect = text.get_rect(center=(self.screen.get_width() / 2, self.screen.get_height() / 2))
+        width, height = self.screen.get_size()
+        text = self.text_cache.render("Waiting for other player...", 36, TEXT_COLOUR)
+        text_rect = text.get_rect(center=(width / 2, height / 2))
         self.screen.blit(text, text_rect) #1 surface
-        escape_text = font.render("Press Escape to exit at any time", True, (255, 22, 93))
-        escape_text_rect = text.get_rect(center=(self.screen.get_width() / 2 - 50, self.screen.get_height() / 2 + 50))
+        escape_text = self.text_cache.render("Press Escape to exit at any time", 36, TEXT_COLOUR)
+        escape_text_rect = text.get_rect(center=(width / 2 - 50, height / 2 + 50))
         self.screen.blit(escape_text, escape_text_rect) #1 surface
-        shoot_text = font.render("Press WASD keys to move and Space to shoot", True, (255, 22, 93))
-        shoot_text_rect = text.get_rect(center=(self.screen.get_width() / 2 - 150, self.screen.get_height() / 2 + 100))
+        shoot_text = self.text_cache.render("Press WASD keys to move and Space to shoot", 36, TEXT_COLOUR)
+        shoot_text_rect = text.get_rect(center=(width / 2 - 150, height / 2 + 100))
         self.screen.blit(shoot_text, shoot_text_rect) #1 surface
 
     def draw_game_objects(self):
-        self.car1.draw(self.screen)
-        self.car2.draw(self.screen)
-        for bullet in self.bullets1 + self.bullets2:
-            bullet.draw(self.screen)
-        self.car1.health_bar.draw(self.screen, self.car1.position.x, self.car1.position.y - 20)
-        self.car2.health_bar.draw(self.screen, self.car2.position.x, self.car2.position.y - 20)
+        mark = self.renderer.mark
+        mark(self.car1.draw(self.screen))
+        mark(self.car2.draw(self.screen))
+        for rect in draw_bullets(self.screen, self.bullets1):
+            mark(rect)
+        for rect in draw_bullets(self.screen, self.bullets2):
+            mark(rect)
+        mark(self.car1.health_bar.draw(self.screen, self.car1.position.x, self.car1.position.y - 20))
+        mark(self.car2.health_bar.draw(self.screen, self.car2.position.x, self.car2.position.y - 20))
 
 if __name__ == "__main__":
-    Game().run()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Road Rage Rampage")
+    parser.add_argument("--record", metavar="PATH", help="record this session to PATH (see replay.py)")
+    parser.add_argument("--profile", metavar="PATH", help="write per-frame timings to PATH (.csv or .json) on exit; F3 shows them live")
+    parser.add_argument("--send-rate", type=float, default=SEND_RATE, help=f"network ticks per second (default {SEND_RATE})")
+    parser.add_argument("--name", help="player name the server keeps your stats under")
+    args = parser.parse_args()
+    if args.name is not None and len(args.name.encode("utf-8")) > MAX_NAME_BYTES:
+        parser.error(f"--name is limited to {MAX_NAME_BYTES} bytes")
+    Game(record=args.record, profile=args.profile, send_rate=args.send_rate, name=args.name).run()
\ No newline at end of file
@@ -1,137 +1,896 @@
-import socket
-import threading
-import pickle
+import asyncio
+import logging
+import os
+import time
 import traceback
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from delta import SnapshotDecoder, SnapshotEncoder
+from interest import InterestManager
+from lag_compensation import REWIND_WINDOW, StateHistory, check_hit
+from metrics import METRICS_PORT, Registry, SampledLog, serve_metrics
+from protocol import MAX_PLAYERS_PER_ROOM, SPECTATOR, FrameDecoder, ProtocolError, encode_message
+from recording import MAX_RECORDED_PLAYERS, RECORDING_EXTENSION, MatchRecorder, flush_recordings
+from simulation import Simulation
+from spectators import SPECTATE_TIMEOUT, Spectator, SpectatorFeed
+from stats import StatsStore
+from transport import UdpServerProtocol, UdpSession
 
-class GameServer:
-    def __init__(self, host: str = "localhost", port: int = 12345):
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.bind((host, port))
-        self.clients: List[socket.socket] = []
-        self.game_states: List[Dict[str, Any]] = [None, None]
-        self.car_healths: List[int] = [100, 100]
+logger = logging.getLogger("game_server")
+
+# How often every client is pinged for an RTT sample
+PING_INTERVAL = 1.0
+# Received messages logged per structured log record
+MESSAGE_LOG_SAMPLE = 1000
+# Traffic counted on every client connection
+CLIENT_COUNTERS = ("messages_in", "bytes_in", "messages_out", "bytes_out")
+# Clients number bullets from 0 again after a game_reset; until a state with
+# an id below this arrives, states are taken for the previous match's
+FRESH_BULLET_IDS = 64
+
+
+class ServerMetrics:
+    # Server-wide instruments.  Per-client counts live on the connection
+    # objects (see ClientConnection) and are read when metrics are scraped.
+    def __init__(self, registry: Optional[Registry] = None):
+        self.registry = registry or Registry()
+        registry = self.registry
+        self.connections = registry.counter("game_server_connections_total", "Clients accepted")
+        self.disconnections = registry.counter("game_server_disconnections_total", "Clients gone, for any reason")
+        self.protocol_errors = registry.counter("game_server_protocol_errors_total", "Clients dropped for malformed frames")
+        self.message_seconds = registry.histogram("game_server_message_seconds", "Time to handle one received message")
+        self.tick_seconds = registry.histogram("game_server_tick_seconds", "Authoritative simulation step time, including broadcasts")
+        self.rtt_seconds = registry.histogram("game_server_rtt_seconds", "Ping/pong round trip per client")
+        self.hits_rejected = registry.counter("game_server_hits_rejected_total", "Client-reported hits that failed the rewind check")
+        self.spectator_connections = registry.counter("game_server_spectator_connections_total", "Spectators accepted")
+        self.spectators_dropped = registry.counter("game_server_spectators_dropped_total", "Spectators disconnected for not keeping up")
+        self.spectator_states_skipped = registry.counter("game_server_spectator_states_skipped_total", "States a lagging spectator skipped")
+        self.message_log = SampledLog(logger, MESSAGE_LOG_SAMPLE)
+        # Traffic of clients that have already left, so totals never go backwards
+        self.closed_totals = dict.fromkeys(CLIENT_COUNTERS, 0)
+
+    def retire(self, client):
+        for name in CLIENT_COUNTERS:
+            self.closed_totals[name] += getattr(client, name)
+
+
+class ClientConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.room: Optional["Room"] = None
+        self.player_id: Optional[int] = None
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.rtt: Optional[float] = None
+        self.ping_nonce = 0
+        self.ping_sent_at: Optional[float] = None
+        # From the client's player_name message; stats are kept under it
+        self.name: Optional[str] = None
+
+    def send(self, message: Dict[str, Any]):
+        try:
+            self.send_encoded(message, encode_message(message))
+        except Exception as e:
+            print(f"Error sending to client {self.addr}: {e}")
+
+    def send_encoded(self, message: Dict[str, Any], data: bytes):
+        # For callers that already encoded the message, e.g. once for a whole room
+        try:
+            self.messages_out += 1
+            self.bytes_out += len(data)
+            self.writer.write(data)
+        except Exception as e:
+            print(f"Error sending to client {self.addr}: {e}")
+
+    def send_queue_bytes(self) -> int:
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def close(self):
+        self.writer.close()
+
+
+def stats_name(client) -> str:
+    # Clients that never sent a player_name share their address's record
+    return client.name or f"guest@{client.addr[0]}"
+
+
+class Room:
+    def __init__(
+        self,
+        room_id: int,
+        capacity: int = 2,
+        restart_delay: float = 5.0,
+        authoritative: bool = False,
+        tick_rate: int = 60,
+        snapshot_rate: int = 20,
+        metrics: Optional[ServerMetrics] = None,
+        record_dir: Optional[str] = None,
+        interest_radius: Optional[float] = None,
+        rewind_window: float = REWIND_WINDOW,
+        stats: Optional[StatsStore] = None,
+    ):
+        if not 1 <= capacity <= MAX_PLAYERS_PER_ROOM:
+            raise ValueError(f"a room holds 1 to {MAX_PLAYERS_PER_ROOM} players, not {capacity}")
+        self.room_id = room_id
+        self.metrics = metrics or ServerMetrics()
+        self.capacity = capacity
+        self.restart_delay = restart_delay
+        # Authoritative rooms simulate the match from player inputs instead of relaying client state
+        self.authoritative = authoritative
+        self.tick_rate = tick_rate
+        # Clients interpolate between snapshots, so they can go out far less often than ticks
+        self.snapshot_interval = max(1, round(tick_rate / snapshot_rate))
+        self.simulation: Optional[Simulation] = Simulation(capacity) if authoritative else None
+        self._simulation_task: Optional[asyncio.Task] = None
+        # One slot per player_id so a reconnecting player takes over the free id
+        self.clients: List[Optional[ClientConnection]] = [None] * capacity
+        self.game_states: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.car_healths: List[int] = [100] * capacity
+        # Snapshot deltas: one decoder per sender, one encoder per (sender, recipient) stream
+        self.state_decoders: List[SnapshotDecoder] = [SnapshotDecoder() for _ in range(capacity)]
+        self.state_encoders: Dict[Tuple[int, int], SnapshotEncoder] = {}
+        # Large rooms only send each client the cars near it at full rate
+        self.interest: Optional[InterestManager] = InterestManager.for_room(capacity, interest_radius)
+        # Where relayed cars were, for checking client-reported hits
+        self.history: Optional[StateHistory] = None if authoritative else StateHistory(capacity, tick_rate, rewind_window)
         self.game_started: bool = False
-        self.lock = threading.Lock()
+        self._restart_handle: Optional[asyncio.TimerHandle] = None
+        # Every match is recorded to its own file in record_dir, if set
+        self.record_dir = record_dir
+        self.recorder: Optional[MatchRecorder] = None
+        self.matches = 0
+        # Read-only viewers, fed the stream encoded once (see spectators.py)
+        self.spectators = SpectatorFeed(states_skipped=self.metrics.spectator_states_skipped)
+        # Relay rooms: never acked, so every state goes to spectators as a keyframe
+        self.spectator_encoders: Dict[int, SnapshotEncoder] = {}
+        # Per-player totals of the match in progress, handed to stats when it ends
+        self.stats = stats
+        self.match_started = 0.0
+        self.match_hits: List[int] = [0] * capacity
+        self.match_shots: List[int] = [0] * capacity
+        # Relay rooms: the newest bullet id seen from each player, for counting
+        # shots; None until their ids have restarted for this match
+        self.last_bullet_ids: List[Optional[int]] = [None] * capacity
 
-    def start(self) -> None:
-        self.server.listen()
-        print(f"Server started on {self.server.getsockname()}")
-        while True:
-            client, addr = self.server.accept()
-            self._handle_new_connection(client, addr)
-
-    def _handle_new_connection(self, client: socket.socket, addr):
-        with self.lock:
-            if len(self.clients) < 2:
-                self.clients.append(client)
-                threading.Thread(target=self.handle_client, args=(client,)).start()
-                print(f"New connection from {addr}")
-                if len(self.clients) == 2 and not self.game_started:
-                    self.start_game()
-            else:
-                print(f"Rejected connection from {addr}: game is full")
-                client.close()
+    @property
+    def player_count(self) -> int:
+        return sum(1 for client in self.clients if client is not None)
+
+    def is_full(self) -> bool:
+        return self.player_count == self.capacity
+
+    def is_empty(self) -> bool:
+        return self.player_count == 0
+
+    def add_client(self, client: ClientConnection) -> int:
+        player_id = self.clients.index(None)
+        self.clients[player_id] = client
+        client.room = self
+        client.player_id = player_id
+        self._send_initial_data(client, player_id)
+        if self.is_full() and not self.game_started:
+            self.start_game()
+        return player_id
+
+    def remove_client(self, client: ClientConnection):
+        if self.game_started:
+            # Abandoned: the time, hits and shots count, the result does not
+            self._record_match(None)
+        player_id = client.player_id
+        self.clients[player_id] = None
+        self.game_states[player_id] = None
+        self.state_decoders[player_id].reset()
+        if self.interest is not None:
+            self.interest.remove(player_id)
+        if self.history is not None:
+            self.history.remove(player_id)
+        for source, recipient in list(self.state_encoders):
+            if player_id in (source, recipient):
+                del self.state_encoders[(source, recipient)]
+        client.room = None
+        if not self.is_full():
+            self.game_started = False
+            self._cancel_restart()
+            self._stop_recording()
+            print(f"Room {self.room_id}: waiting for players to reconnect...")
+
+    def add_spectator(self, spectator: Spectator):
+        frames = [encode_message(self._initial_message(SPECTATOR))]
+        # Where the match is now, like a joining player gets
+        if self.game_started and self.authoritative:
+            frames.append(encode_message({"snapshot": self.simulation.snapshot()}))
+        elif self.game_started:
+            frames += [self._spectator_state(player_id, game_state) for player_id, game_state in enumerate(self.game_states) if game_state]
+        self.spectators.add(spectator, *frames)
 
     def start_game(self):
+        self._restart_handle = None
+        if not self.is_full():
+            return
         self.game_started = True
+        self._start_recording()
         self.reset_game_state()
         self.broadcast({"game_start": True})
-        print("Game started!")
+        if self.authoritative:
+            self._simulation_task = asyncio.get_running_loop().create_task(self._run_simulation())
+        print(f"Room {self.room_id}: game started!")
+
+    def _start_recording(self):
+        if self.record_dir is None:
+            return
+        if self.capacity > MAX_RECORDED_PLAYERS:
+            print(f"Room {self.room_id}: not recording: recordings hold at most {MAX_RECORDED_PLAYERS} players")
+            return
+        self._stop_recording()
+        self.matches += 1
+        path = os.path.join(self.record_dir, f"room{self.room_id}-{time.strftime('%Y%m%d-%H%M%S')}-{self.matches}{RECORDING_EXTENSION}")
+        metadata = {
+            "room": self.room_id,
+            "capacity": self.capacity,
+            "authoritative": self.authoritative,
+            "tick_rate": self.tick_rate,
+            "snapshot_interval": self.snapshot_interval,
+        }
+        try:
+            self.recorder = MatchRecorder(path, metadata, self.tick_rate)
+        except OSError as e:
+            print(f"Room {self.room_id}: not recording: {e}")
+            return
+        # Players were told their ids before the match; replays need them too
+        for player_id in range(self.capacity):
+            self.recorder.sent(player_id, encode_message(self._initial_message(player_id)))
+        print(f"Room {self.room_id}: recording to {path}")
+
+    def close(self):
+        # Server shutdown: a match still running keeps what was recorded so far
+        self.game_started = False
+        self._cancel_restart()
+        self._stop_recording()
+
+    def _stop_recording(self):
+        if self.recorder is None:
+            return
+        recorder, self.recorder = self.recorder, None
+        recorder.close()
+        print(f"Room {self.room_id}: recorded {recorder.records} messages ({recorder.size} bytes) to {recorder.path}")
 
     def reset_game_state(self):
-        self.car_healths = [100, 100]
-        self.game_states = [None, None]
+        self.car_healths = [100] * self.capacity
+        self.game_states = [None] * self.capacity
+        self.match_started = time.monotonic()
+        self.match_hits = [0] * self.capacity
+        self.match_shots = [0] * self.capacity
+        self.last_bullet_ids = [None] * self.capacity
+        self.state_encoders.clear()
+        for decoder in self.state_decoders:
+            decoder.reset()
+        if self.simulation is not None:
+            self.simulation.reset()
+        if self.history is not None:
+            self.history.reset()
         self.broadcast({"game_reset": True, "car_healths": self.car_healths})
-        print("Game state reset!")
+        print(f"Room {self.room_id}: game state reset!")
 
-    def handle_client(self, client: socket.socket):
-        player_id = len(self.clients) - 1
-        try:
-            self._send_initial_data(client, player_id)
-            while True:
-                data = client.recv(4096)
-                if not data:
-                    break
-                self._process_game_state(pickle.loads(data), player_id)
-        except Exception as e:
-            print(f"Error handling client {player_id}: {e}")
-            traceback.print_exc()
-        finally:
-            self._handle_client_disconnect(client, player_id)
+    def _initial_message(self, player_id: int) -> Dict[str, Any]:
+        return {
+            "player_id": player_id,
+            "game_started": self.game_started,
+            "authoritative": self.authoritative,
+            "tick_rate": self.tick_rate if self.authoritative else 0,
+        }
 
-    def _send_initial_data(self, client: socket.socket, player_id: int):
-        initial_message = {"player_id": player_id, "game_started": self.game_started}
-        client.send(pickle.dumps(initial_message))
-        print(f"Sent player_id {player_id} and game_started status to client")
+    def _send_initial_data(self, client: ClientConnection, player_id: int):
+        self._send(client, self._initial_message(player_id))
+        print(f"Room {self.room_id}: sent player_id {player_id} and game_started status to client")
         if self.game_started:
             self.send_current_game_state(client, player_id)
 
-    def _process_game_state(self, game_state: Dict[str, Any], player_id: int):
-        print(f"Received from client {player_id}: {game_state}")
+    def process_game_state(self, game_state: Dict[str, Any], player_id: int):
+        if self.metrics.message_log.sample():
+            self.metrics.message_log.log("message", room=self.room_id, player=player_id, type=next(iter(game_state), None))
+        if self.authoritative:
+            # Client-reported hits and positions are not trusted; only inputs count
+            if "input" in game_state and self.game_started:
+                self.simulation.apply_input(player_id, game_state["input"])
+            return
         if "hit" in game_state:
-            self._handle_hit(game_state["hit"])
+            self._handle_hit(game_state["hit"], player_id)
+        elif "state_delta" in game_state:
+            self._receive_state_delta(game_state["state_delta"], player_id)
+        elif "state_ack" in game_state:
+            ack = game_state["state_ack"]
+            encoder = self.state_encoders.get((ack["player"], player_id))
+            if encoder is not None:
+                encoder.ack(ack)
         elif "game_state" in game_state:
+            self.state_decoders[player_id].frame += 1
             self._update_game_state(game_state["game_state"], player_id)
         self._check_game_over()
 
-    def _handle_hit(self, hit_data: Dict[str, Any]):
+    def _handle_hit(self, hit_data: Dict[str, Any], shooter: int):
         target = hit_data["target"]
+        reason = self._check_hit(hit_data, shooter)
+        if reason is not None:
+            self.metrics.hits_rejected.inc()
+            # Clients can send these at any rate, so they are sampled, not printed
+            if self.metrics.message_log.sample():
+                self.metrics.message_log.log("hit_rejected", room=self.room_id, shooter=shooter, target=target, reason=reason)
+            return
         self.car_healths[target] = max(0, self.car_healths[target] - 10)
-        print(f"Player {target} hit! New health: {self.car_healths[target]}")
+        self.match_hits[shooter] += 1
+        print(f"Room {self.room_id}: player {target} hit! New health: {self.car_healths[target]}")
         self.broadcast({"hit": {"target": target, "health": self.car_healths[target]}})
 
+    def _check_hit(self, hit_data: Dict[str, Any], shooter: int) -> Optional[str]:
+        target = hit_data["target"]
+        if target == shooter or not 0 <= target < self.capacity or self.clients[target] is None:
+            return "bad target"
+        # The target as the shooter drew it: see lag_compensation.py
+        now = time.monotonic()
+        view_time = now - (self.clients[shooter].rtt or 0.0) - hit_data.get("delay", 0.0)
+        if now - view_time > self.history.window:
+            return "outside window"
+        return check_hit(self.history, target, self.game_states[shooter], hit_data, view_time)
+
+    def _receive_state_delta(self, delta: Dict[str, Any], player_id: int):
+        delta["player"] = player_id
+        decoder = self.state_decoders[player_id]
+        new_state = decoder.decode(delta)
+        ack = decoder.take_ack()
+        if ack:
+            self._send(self.clients[player_id], {"state_ack": ack})
+        if new_state is not None:
+            self._update_game_state(new_state, player_id)
+
     def _update_game_state(self, new_state: Dict[str, Any], player_id: int):
         self.game_states[player_id] = new_state
         self.car_healths[player_id] = new_state["car"]["health"]
-        self.send_game_state_to_other_player(player_id)
+        car = new_state["car"]
+        self.history.record(player_id, car["x"], car["y"], car["angle"])
+        if self.interest is not None:
+            self.interest.move(player_id, car["x"], car["y"])
+        self.send_game_state_to_other_players(player_id)
+        if self.spectators:
+            self.spectators.publish(self._spectator_state(player_id, new_state), state=player_id)
+        if self.stats is not None:
+            self._count_shots(player_id, new_state)
+
+    def _count_shots(self, player_id: int, state: Dict[str, Any]):
+        # Bullet ids count up from 0 each match (mod 2^16), so the newest id
+        # seen gives the shots fired, including bullets that hit between states
+        bullets = state.get("bullets", ())
+        last = self.last_bullet_ids[player_id]
+        if last is None:
+            # Still in flight from before the reset, or no shots yet
+            if not any(bullet.get("id", 0) < FRESH_BULLET_IDS for bullet in bullets):
+                return
+            last = -1
+        fired = 0
+        for bullet in bullets:
+            ahead = (bullet.get("id", last) - last) & 0xFFFF
+            if ahead < 0x8000:
+                fired = max(fired, ahead)
+        if fired:
+            self.match_shots[player_id] += fired
+            self.last_bullet_ids[player_id] = (last + fired) & 0xFFFF
+
+    async def _run_simulation(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        while self.game_started:
+            self.step_simulation(interval)
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -5 * interval:
+                # Fell far behind (e.g. a long GC pause): skip ahead instead of bursting ticks
+                next_tick = loop.time()
+            await asyncio.sleep(max(0.0, delay))
+
+    def step_simulation(self, dt: float):
+        start = time.perf_counter()
+        self._step_simulation(dt)
+        self.metrics.tick_seconds.observe(time.perf_counter() - start)
+
+    def _step_simulation(self, dt: float):
+        for hit in self.simulation.step(dt):
+            target = hit["target"]
+            self.car_healths[target] = hit["health"]
+            self.match_hits[hit["shooter"]] += 1
+            self.broadcast({"hit": {"target": target, "health": hit["health"]}})
+        if self.simulation.tick % self.snapshot_interval == 0:
+            self._broadcast_snapshot()
+        self._check_game_over()
+
+    def _broadcast_snapshot(self):
+        snapshot = self.simulation.snapshot()
+        if self.interest is None:
+            self.broadcast({"snapshot": snapshot}, state="snapshot")
+            return
+        for player_id, client in enumerate(self.clients):
+            if client is not None:
+                car = snapshot["cars"][player_id]
+                self.interest.move(player_id, car["x"], car["y"])
+        self.interest.refresh()
+        for player_id, client in enumerate(self.clients):
+            if client is not None:
+                self._send(client, {"snapshot": self.interest.filter_snapshot(player_id, snapshot)})
+        if self.spectators:
+            self.spectators.publish(encode_message({"snapshot": snapshot}), state="snapshot")
 
     def _check_game_over(self):
-        if min(self.car_healths) <= 0:
-            winner = 1 if self.car_healths[0] <= 0 else 0
+        alive = [player_id for player_id, health in enumerate(self.car_healths) if health > 0]
+        if self.game_started and len(alive) <= 1:
+            winner = alive[0] if alive else self.capacity - 1
             self.broadcast({"game_over": True, "winner": winner})
+            self._record_match(winner)
+            self._stop_recording()
             self.game_started = False
-            threading.Timer(5.0, self.start_game).start()
+            self._restart_handle = asyncio.get_running_loop().call_later(self.restart_delay, self.start_game)
 
-    def _handle_client_disconnect(self, client: socket.socket, player_id: int):
-        print(f"Closing connection with client {player_id}")
-        client.close()
-        with self.lock:
-            self.clients.remove(client)
-            self.game_states[player_id] = None
-        if len(self.clients) < 2:
-            self.game_started = False
-            print("Waiting for players to reconnect...")
+    def _record_match(self, winner: Optional[int]):
+        # Only buffered here; StatsStore writes from its own thread
+        if self.stats is None:
+            return
+        seconds = time.monotonic() - self.match_started
+        shots = self.simulation.shots_fired if self.authoritative else self.match_shots
+        for player_id, client in enumerate(self.clients):
+            if client is None:
+                continue
+            self.stats.add(
+                stats_name(client),
+                matches=int(winner is not None),
+                wins=int(player_id == winner),
+                losses=int(winner is not None and player_id != winner),
+                hits=self.match_hits[player_id],
+                shots=shots[player_id],
+                seconds=seconds,
+            )
 
-    def broadcast(self, message: Dict[str, Any]):
+    def _cancel_restart(self):
+        if self._restart_handle is not None:
+            self._restart_handle.cancel()
+            self._restart_handle = None
+
+    def broadcast(self, message: Dict[str, Any], state: Optional[str] = None):
+        data = encode_message(message)
         for client in self.clients:
-            try:
-                client.send(pickle.dumps(message))
-            except Exception as e:
-                print(f"Error broadcasting to client: {e}")
-
-    def send_game_state_to_other_player(self, player_id: int):
-        other_player_id = 1 - player_id
-        if other_player_id < len(self.clients):
-            other_client = self.clients[other_player_id]
-            game_state = self.game_states[player_id]
-            game_state["car"]["health"] = self.car_healths[player_id]
+            if client is not None:
+                client.send_encoded(message, data)
+        if self.recorder is not None:
+            self.recorder.broadcast(data)
+        if self.spectators:
+            self.spectators.publish(data, state)
+
+    def _spectator_state(self, player_id: int, game_state: Dict[str, Any]) -> bytes:
+        encoder = self.spectator_encoders.get(player_id)
+        if encoder is None:
+            encoder = self.spectator_encoders[player_id] = SnapshotEncoder(player_id)
+        return encode_message({"state_delta": encoder.encode(self.state_decoders[player_id].frame, game_state)})
+
+    def _send(self, client: ClientConnection, message: Dict[str, Any]):
+        data = encode_message(message)
+        client.send_encoded(message, data)
+        if self.recorder is not None:
+            self.recorder.sent(client.player_id, data)
+
+    def send_game_state_to_other_players(self, player_id: int):
+        game_state = self.game_states[player_id]
+        game_state["car"]["health"] = self.car_healths[player_id]
+        interest = self.interest
+        if interest is not None:
+            interest.refresh()
+        for other_player_id, other_client in enumerate(self.clients):
+            if other_player_id == player_id or other_client is None:
+                continue
+            if interest is not None and not interest.should_send(other_player_id, player_id):
+                continue
             game_state["other_car_health"] = self.car_healths[other_player_id]
-            self._send_to_client(other_client, {"game_state": game_state})
+            state = game_state if interest is None else interest.filter_state(other_player_id, game_state)
+            self._send_state(other_client, player_id, other_player_id, state)
 
-    def send_current_game_state(self, client: socket.socket, player_id: int):
-        other_player_id = 1 - player_id
-        if self.game_states[other_player_id]:
-            game_state = self.game_states[other_player_id]
+    def send_current_game_state(self, client: ClientConnection, player_id: int):
+        if self.authoritative:
+            self._send(client, {"snapshot": self.simulation.snapshot()})
+            return
+        for other_player_id, game_state in enumerate(self.game_states):
+            if other_player_id == player_id or not game_state:
+                continue
             game_state["car"]["health"] = self.car_healths[other_player_id]
             game_state["other_car_health"] = self.car_healths[player_id]
-            self._send_to_client(client, {"game_state": game_state})
+            # A (re)joining player has no baseline: start the stream with a keyframe
+            self.state_encoders.pop((other_player_id, player_id), None)
+            self._send_state(client, other_player_id, player_id, game_state)
+
+    def _send_state(self, client: ClientConnection, source: int, recipient: int, game_state: Dict[str, Any]):
+        encoder = self.state_encoders.get((source, recipient))
+        if encoder is None:
+            encoder = self.state_encoders[(source, recipient)] = SnapshotEncoder(source)
+        self._send(client, {"state_delta": encoder.encode(self.state_decoders[source].frame, game_state)})
+
+
+class Matchmaker:
+    def __init__(
+        self,
+        players_per_room: int = 2,
+        authoritative: bool = False,
+        tick_rate: int = 60,
+        snapshot_rate: int = 20,
+        metrics: Optional[ServerMetrics] = None,
+        record_dir: Optional[str] = None,
+        interest_radius: Optional[float] = None,
+        rewind_window: float = REWIND_WINDOW,
+        stats: Optional[StatsStore] = None,
+    ):
+        # Rooms are created on demand; fail here rather than at the first connection
+        if not 1 <= players_per_room <= MAX_PLAYERS_PER_ROOM:
+            raise ValueError(f"a room holds 1 to {MAX_PLAYERS_PER_ROOM} players, not {players_per_room}")
+        self.players_per_room = players_per_room
+        self.metrics = metrics or ServerMetrics()
+        self.authoritative = authoritative
+        self.tick_rate = tick_rate
+        self.snapshot_rate = snapshot_rate
+        self.record_dir = record_dir
+        self.interest_radius = interest_radius
+        self.rewind_window = rewind_window
+        self.stats = stats
+        self.rooms: Dict[int, Room] = {}
+        self._next_room_id = 0
+
+    def assign(self, client: ClientConnection, room_id: Optional[int] = None) -> Room:
+        # room_id places the client in that room, creating it if need be;
+        # the sharded server's acceptor picks rooms itself
+        if room_id is None:
+            room = self._find_open_room()
+            room_id = self._next_room_id
+        else:
+            room = self.rooms.get(room_id)
+        if room is None:
+            room = Room(
+                room_id,
+                self.players_per_room,
+                authoritative=self.authoritative,
+                tick_rate=self.tick_rate,
+                snapshot_rate=self.snapshot_rate,
+                metrics=self.metrics,
+                record_dir=self.record_dir,
+                interest_radius=self.interest_radius,
+                rewind_window=self.rewind_window,
+                stats=self.stats,
+            )
+            self.rooms[room_id] = room
+            self._next_room_id = max(self._next_room_id, room_id + 1)
+            print(f"Created room {room.room_id} ({len(self.rooms)} active)")
+        room.add_client(client)
+        return room
+
+    def release(self, client: ClientConnection):
+        room = client.room
+        if room is None:
+            return
+        room.remove_client(client)
+        if room.is_empty():
+            del self.rooms[room.room_id]
+            room.spectators.close()
+            print(f"Closed room {room.room_id} ({len(self.rooms)} active)")
+
+    def watch(self, room_id: Optional[int] = None) -> Optional[Room]:
+        # The room a spectator asked for; without one, the oldest match in progress
+        if room_id is not None:
+            return self.rooms.get(room_id)
+        rooms = sorted(self.rooms.values(), key=lambda room: (not room.game_started, room.room_id))
+        return rooms[0] if rooms else None
+
+    def _find_open_room(self) -> Optional[Room]:
+        # Fill the most populated open room first so waiting players get a match quickly
+        best = None
+        for room in self.rooms.values():
+            if room.is_full():
+                continue
+            if best is None or room.player_count > best.player_count:
+                best = room
+        return best
+
+
+class GameServer:
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 12345,
+        players_per_room: int = 2,
+        transport: str = "tcp",
+        authoritative: bool = False,
+        tick_rate: int = 60,
+        snapshot_rate: int = 20,
+        metrics_port: Optional[int] = METRICS_PORT,
+        record_dir: Optional[str] = None,
+        interest_radius: Optional[float] = None,
+        rewind_window: float = REWIND_WINDOW,
+        spectator_port: Optional[int] = None,
+        stats_path: Optional[str] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.transport = transport
+        # TCP only; None means no spectators
+        self.spectator_port = spectator_port
+        self.metrics = ServerMetrics()
+        if record_dir is not None:
+            os.makedirs(record_dir, exist_ok=True)
+        # Match results per player, written behind the game (see stats.py)
+        self.stats: Optional[StatsStore] = StatsStore(stats_path) if stats_path is not None else None
+        self.matchmaker = Matchmaker(
+            players_per_room, authoritative, tick_rate, snapshot_rate, self.metrics, record_dir, interest_radius, rewind_window, self.stats
+        )
+        self.clients: List[ClientConnection] = []
+        self.spectators: List[Spectator] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.spectator_server: Optional[asyncio.AbstractServer] = None
+        self.udp_transport: Optional[asyncio.DatagramTransport] = None
+        # None disables the HTTP endpoint; metrics are still recorded
+        self.metrics_port = metrics_port
+        self.metrics_server: Optional[asyncio.AbstractServer] = None
+        self._register_collectors()
 
-    def _send_to_client(self, client: socket.socket, message: Dict[str, Any]):
+    def start(self) -> None:
         try:
-            client.send(pickle.dumps(message))
+            asyncio.run(self.serve_forever())
+        finally:
+            for room in self.matchmaker.rooms.values():
+                room.close()
+            flush_recordings()
+            if self.stats is not None:
+                self.stats.close()
+
+    def _register_collectors(self):
+        registry = self.metrics.registry
+        registry.collect("game_server_clients", "gauge", "Connected clients", lambda: [({}, len(self.clients))])
+        registry.collect("game_server_rooms", "gauge", "Open rooms", lambda: [({}, len(self.matchmaker.rooms))])
+        registry.collect("game_server_spectators", "gauge", "Connected spectators", lambda: [({}, len(self.spectators))])
+        if self.stats is not None:
+            registry.collect("game_server_stats_pending", "gauge", "Players with stats not yet written", lambda: [({}, len(self.stats.pending))])
+            registry.collect("game_server_stats_batches_total", "counter", "Stats transactions written", lambda: [({}, self.stats.batches)])
+        for name, help_text in (
+            ("messages_in", "Messages received"),
+            ("bytes_in", "Bytes received"),
+            ("messages_out", "Messages sent"),
+            ("bytes_out", "Bytes sent"),
+        ):
+            registry.collect(f"game_server_{name}_total", "counter", f"{help_text}, all clients", self._total_collector(name))
+            registry.collect(f"game_server_client_{name}_total", "counter", f"{help_text} per connected client", self._client_collector(name))
+        registry.collect(
+            "game_server_client_send_queue_bytes", "gauge", "Bytes queued for sending per client",
+            lambda: [(self._client_labels(client), client.send_queue_bytes()) for client in self.clients],
+        )
+        registry.collect(
+            "game_server_client_rtt_seconds", "gauge", "Latest ping/pong round trip per client",
+            lambda: [(self._client_labels(client), client.rtt) for client in self.clients if client.rtt is not None],
+        )
+
+    def _total_collector(self, name: str):
+        return lambda: [({}, self.metrics.closed_totals[name] + sum(getattr(client, name) for client in self.clients))]
+
+    def _client_collector(self, name: str):
+        return lambda: [(self._client_labels(client), getattr(client, name)) for client in self.clients]
+
+    @staticmethod
+    def _client_labels(client) -> Dict[str, Any]:
+        host, port = client.addr[:2]
+        room = client.room.room_id if client.room is not None else ""
+        return {"client": f"{host}:{port}", "room": room, "player": "" if client.player_id is None else client.player_id}
+
+    async def _start_background(self):
+        asyncio.get_running_loop().create_task(self._ping_clients())
+        if self.metrics_port is None:
+            return
+        try:
+            self.metrics_server = await serve_metrics(self.metrics.registry, port=self.metrics_port)
+            print(f"Metrics on http://127.0.0.1:{self.metrics_port}/metrics")
+        except OSError as e:
+            print(f"Metrics endpoint disabled: {e}")
+
+    async def _ping_clients(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            now = time.monotonic()
+            for client in self.clients:
+                client.ping_nonce = (client.ping_nonce + 1) & 0xFFFFFFFF
+                client.ping_sent_at = now
+                client.send({"ping": client.ping_nonce})
+
+    def _receive_pong(self, client, nonce: int):
+        # Only the latest ping counts; a late pong for an older one is ignored
+        if nonce == client.ping_nonce and client.ping_sent_at is not None:
+            client.rtt = time.monotonic() - client.ping_sent_at
+            client.ping_sent_at = None
+            self.metrics.rtt_seconds.observe(client.rtt)
+
+    async def serve_forever(self) -> None:
+        await self._start_background()
+        if self.transport == "udp":
+            await self.serve_udp_forever()
+            return
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=1024)
+        print(f"Server started on {self.server.sockets[0].getsockname()}")
+        if self.spectator_port is not None:
+            self.spectator_server = await asyncio.start_server(self.handle_spectator, self.host, self.spectator_port, backlog=1024)
+            print(f"Spectators on {self.spectator_server.sockets[0].getsockname()}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def serve_udp_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: UdpServerProtocol(self._handle_udp_connect, self._handle_udp_message, self._handle_client_disconnect),
+            local_addr=(self.host, self.port),
+        )
+        print(f"UDP server started on {self.udp_transport.get_extra_info('sockname')}")
+        try:
+            await asyncio.Future()
+        finally:
+            self.udp_transport.close()
+
+    def _handle_udp_connect(self, client: UdpSession):
+        self.clients.append(client)
+        self.metrics.connections.inc()
+        print(f"New UDP connection from {client.addr}")
+        self.matchmaker.assign(client)
+
+    def _handle_udp_message(self, client: UdpSession, message: Dict[str, Any]):
+        # Datagrams arrive already unpacked; recordings get the frame back
+        room = client.room
+        if room is not None and room.recorder is not None:
+            room.recorder.received(client.player_id, encode_message(message))
+        self._handle_message(client, message)
+
+    def _handle_message(self, client, message: Dict[str, Any]):
+        start = time.perf_counter()
+        client.messages_in += 1
+        if "pong" in message:
+            self._receive_pong(client, message["pong"])
+        elif "player_name" in message:
+            client.name = message["player_name"].strip() or None
+            print(f"Client {client.addr} is {stats_name(client)}")
+        elif client.room is not None:
+            client.room.process_game_state(message, client.player_id)
+        self.metrics.message_seconds.observe(time.perf_counter() - start)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, room_id: Optional[int] = None):
+        client = ClientConnection(reader, writer)
+        self.clients.append(client)
+        self.metrics.connections.inc()
+        print(f"New connection from {client.addr}")
+        decoder = FrameDecoder()
+        try:
+            self.matchmaker.assign(client, room_id)
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                client.bytes_in += len(data)
+                recorder = client.room.recorder if client.room is not None else None
+                decoder.keep_frames = recorder is not None
+                messages = decoder.feed(data)
+                if recorder is not None and decoder.frames:
+                    # Whole frames only, so a recording never starts mid-message
+                    recorder.received(client.player_id, decoder.frames)
+                for message in messages:
+                    self._handle_message(client, message)
+        except ProtocolError as e:
+            self.metrics.protocol_errors.inc()
+            print(f"Dropping client {client.addr}: {e}")
         except Exception as e:
-            print(f"Error sending to client: {e}")
+            print(f"Error handling client {client.addr}: {e}")
+            traceback.print_exc()
+        finally:
+            self._handle_client_disconnect(client)
+
+    async def handle_spectator(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        spectator = Spectator(reader, writer)
+        try:
+            room_id = await asyncio.wait_for(self._read_spectate(reader), SPECTATE_TIMEOUT)
+            room = self.matchmaker.watch(room_id)
+            if room is None:
+                print(f"Spectator {spectator.addr}: no room {'open' if room_id is None else room_id}")
+                return
+            self.spectators.append(spectator)
+            self.metrics.spectator_connections.inc()
+            room.add_spectator(spectator)
+            print(f"Spectator {spectator.addr} watching room {room.room_id} ({len(room.spectators)} watching)")
+            # Nothing else is expected from a spectator; this only notices it leaving
+            while await reader.read(4096):
+                pass
+        except (asyncio.TimeoutError, ProtocolError) as e:
+            print(f"Dropping spectator {spectator.addr}: {e or 'no spectate request'}")
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            spectator.close()
+            if spectator in self.spectators:
+                self.spectators.remove(spectator)
+                if spectator.drop_reason is not None:
+                    self.metrics.spectators_dropped.inc()
+                    print(f"Dropped spectator {spectator.addr}: {spectator.drop_reason}")
+
+    async def _read_spectate(self, reader: asyncio.StreamReader) -> Optional[int]:
+        decoder = FrameDecoder()
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                raise ConnectionError("closed before spectate")
+            messages = decoder.feed(data)
+            if messages:
+                if "spectate" not in messages[0]:
+                    raise ProtocolError(f"expected spectate, got {list(messages[0])}")
+                return messages[0]["spectate"]
+
+    def _handle_client_disconnect(self, client):
+        print(f"Closing connection with client {client.addr}")
+        self.matchmaker.release(client)
+        if client in self.clients:
+            self.clients.remove(client)
+            self.metrics.disconnections.inc()
+            self.metrics.retire(client)
+        client.close()
+
 
 if __name__ == "__main__":
-    GameServer().start()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Road Rage Rampage game server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--transport", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("--authoritative", action="store_true", help="simulate matches on the server")
+    parser.add_argument("--players-per-room", type=int, default=2)
+    parser.add_argument("--interest-radius", type=float, help="only send cars and bullets within this many px of each client")
+    parser.add_argument("--rewind-window", type=float, default=REWIND_WINDOW, help="oldest view, in seconds, a relay client's hit is checked against")
+    parser.add_argument("--record", metavar="DIR", help="record every match to DIR (see replay.py)")
+    parser.add_argument("--spectator-port", type=int, help="accept read-only spectators on this port (TCP only, see spectators.py)")
+    parser.add_argument("--stats", metavar="PATH", help="keep per-player match stats in this SQLite file (see stats.py)")
+    parser.add_argument("--workers", type=int, default=0, help="spread rooms over this many processes (TCP only, see sharding.py)")
+    args = parser.parse_args()
+    if not 1 <= args.players_per_room <= MAX_PLAYERS_PER_ROOM:
+        parser.error(f"--players-per-room must be 1 to {MAX_PLAYERS_PER_ROOM}")
+    if args.record is not None and args.players_per_room > MAX_RECORDED_PLAYERS:
+        parser.error(f"--record holds at most {MAX_RECORDED_PLAYERS} players per room")
+    if args.spectator_port is not None and args.transport != "tcp":
+        parser.error("--spectator-port needs --transport tcp")
+
+    # Sampled per-message records go to stderr as JSON lines
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.workers:
+        if args.transport != "tcp":
+            parser.error("--workers needs --transport tcp")
+        if args.spectator_port is not None:
+            parser.error("--spectator-port is not available with --workers")
+        from sharding import ShardedServer
+
+        ShardedServer(
+            args.host,
+            args.port,
+            args.workers,
+            args.players_per_room,
+            authoritative=args.authoritative,
+            record_dir=args.record,
+            interest_radius=args.interest_radius,
+            rewind_window=args.rewind_window,
+            stats_path=args.stats,
+        ).start()
+    else:
+        GameServer(
+            args.host,
+            args.port,
+            args.players_per_room,
+            transport=args.transport,
+            authoritative=args.authoritative,
+            record_dir=args.record,
+            interest_radius=args.interest_radius,
+            rewind_window=args.rewind_window,
+            spectator_port=args.spectator_port,
+            stats_path=args.stats,
+        ).start()
@@ -5,5 +5,6 @@ class HealthBar:
         self.health = max_health
 
     def draw(self, screen, x, y):
-        pygame.draw.rect(screen, (0, 255, 0), (x, y, 100, 10))
-        pygame.draw.rect(screen, '#FF165D', (x, y, 100 * (self.health / self.max_health), 10))
\ No newline at end of file
+        rect = pygame.draw.rect(screen, (0, 255, 0), (x, y, 100, 10))
+        pygame.draw.rect(screen, '#FF165D', (x, y, 100 * (self.health / self.max_health), 10))
+        return rect
\ No newline at end of file
@@ -0,0 +1,166 @@
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bullet_pool import WIRE_DTYPE
+from protocol import POSITION_SCALE
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH
+
+# Interest management for rooms with many cars.
+#
+# Each client gets every update for the FULL_RATE_SLOTS cars nearest to it,
+# every 2nd update for the next FULL_RATE_SLOTS, every 4th for the next, and
+# so on up to every MAX_INTERVAL-th.  The rates form a geometric series, so a
+# client receives about 2 * FULL_RATE_SLOTS + N / MAX_INTERVAL car updates
+# per tick instead of N - 1.  Snapshot bullets go out with their owner's car,
+# except that bullets within BULLET_RADIUS of the client always do.  An
+# optional radius drops cars and bullets beyond it entirely.  Distances are
+# measured the short way round the wrapped playfield, like SpatialHash.delta.
+#
+# The ranking is an N x N sort, so it is only redone every refresh_interval
+# seconds; the per-message check is two list lookups and an increment.
+#
+#   python interest.py   prints per-client update counts by room size
+
+FULL_RATE_SLOTS = 4
+# At 60 Hz the furthest cars still update about twice a second
+MAX_INTERVAL = 32
+REFRESH_INTERVAL = 0.25
+# Bullets this close may be about to hit the client, whoever fired them
+BULLET_RADIUS = 300.0
+
+
+class InterestManager:
+    def __init__(
+        self,
+        capacity: int,
+        radius: Optional[float] = None,
+        width: float = SCREEN_WIDTH,
+        height: float = SCREEN_HEIGHT,
+        full_rate_slots: int = FULL_RATE_SLOTS,
+        max_interval: int = MAX_INTERVAL,
+        refresh_interval: float = REFRESH_INTERVAL,
+    ):
+        self.capacity = capacity
+        self.radius = radius
+        self.width = width
+        self.height = height
+        self.full_rate_slots = full_rate_slots
+        self.max_interval = max_interval
+        self.refresh_interval = refresh_interval
+        self.positions = np.zeros((capacity, 2))
+        self.present = np.zeros(capacity, dtype=bool)
+        # [recipient][source]: send every n-th update, 0 = never
+        self.intervals: List[List[int]] = [[0] * capacity for _ in range(capacity)]
+        # [recipient][source]: updates skipped since the last one sent
+        self.skipped: List[List[int]] = [[0] * capacity for _ in range(capacity)]
+        self.refreshed_at = -math.inf
+
+    @classmethod
+    def for_room(cls, capacity: int, radius: Optional[float] = None) -> Optional["InterestManager"]:
+        # Small rooms send everything anyway; don't pay for the bookkeeping
+        if radius is None and capacity - 1 <= FULL_RATE_SLOTS:
+            return None
+        return cls(capacity, radius)
+
+    def move(self, player_id: int, x: float, y: float):
+        self.positions[player_id] = (x, y)
+        self.present[player_id] = True
+
+    def remove(self, player_id: int):
+        self.present[player_id] = False
+        for row in self.skipped:
+            row[player_id] = 0
+        self.skipped[player_id] = [0] * self.capacity
+
+    def refresh(self, now: Optional[float] = None, force: bool = False):
+        now = time.monotonic() if now is None else now
+        if not force and now - self.refreshed_at < self.refresh_interval:
+            return
+        self.refreshed_at = now
+        # [recipient, source] wrapped offsets
+        delta = self.positions[None, :, :] - self.positions[:, None, :]
+        size = np.array([self.width, self.height])
+        delta = (delta + size / 2) % size - size / 2
+        distance = np.hypot(delta[..., 0], delta[..., 1])
+        eligible = self.present[None, :] & self.present[:, None]
+        np.fill_diagonal(eligible, False)
+        if self.radius is not None:
+            eligible &= distance <= self.radius
+        distance = np.where(eligible, distance, np.inf)
+        # rank[r, s] = how many sources are nearer to r than s is
+        rank = np.empty(distance.shape, dtype=np.int64)
+        order = np.argsort(distance, axis=1, kind="stable")
+        np.put_along_axis(rank, order, np.arange(self.capacity)[None, :], axis=1)
+        band = np.minimum(rank // self.full_rate_slots, 30)
+        intervals = np.minimum(2 ** band, self.max_interval)
+        self.intervals = np.where(eligible, intervals, 0).tolist()
+
+    def should_send(self, recipient: int, source: int) -> bool:
+        interval = self.intervals[recipient][source]
+        if not interval:
+            return False
+        skipped = self.skipped[recipient]
+        skipped[source] += 1
+        if skipped[source] < interval:
+            return False
+        skipped[source] = 0
+        return True
+
+    def _near(self, recipient: int, x: np.ndarray, y: np.ndarray, radius: float) -> np.ndarray:
+        cx, cy = self.positions[recipient]
+        dx = (x - cx + self.width / 2) % self.width - self.width / 2
+        dy = (y - cy + self.height / 2) % self.height - self.height / 2
+        return dx * dx + dy * dy <= radius * radius
+
+    def filter_state(self, recipient: int, state: Dict[str, Any]) -> Dict[str, Any]:
+        # Relayed game_state with only the bullets inside the recipient's radius
+        bullets = state["bullets"]
+        if self.radius is None or not bullets:
+            return state
+        x = np.array([bullet["x"] for bullet in bullets])
+        y = np.array([bullet["y"] for bullet in bullets])
+        near = self._near(recipient, x, y, self.radius)
+        if near.all():
+            return state
+        return dict(state, bullets=[bullet for bullet, keep in zip(bullets, near.tolist()) if keep])
+
+    def filter_snapshot(self, recipient: int, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        # Per-recipient copy of a Simulation.snapshot(): cars this client is
+        # not due an update for become None, and so do their far bullets
+        cars = [
+            car if source == recipient or self.should_send(recipient, source) else None
+            for source, car in enumerate(snapshot["cars"])
+        ]
+        bullets = snapshot["bullets"]
+        if len(bullets):
+            records = np.frombuffer(bullets, dtype=WIRE_DTYPE)
+            x = records["x"] / POSITION_SCALE
+            y = records["y"] / POSITION_SCALE
+            due = np.array([car is not None for car in cars])
+            keep = due[records["owner"]] | self._near(recipient, x, y, BULLET_RADIUS)
+            if self.radius is not None:
+                keep &= self._near(recipient, x, y, self.radius)
+            if not keep.all():
+                bullets = records[keep].tobytes()
+        return dict(snapshot, cars=cars, bullets=bullets)
+
+
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(1)
+    print(f"{'players':>8} {'updates/client/tick':>20} {'of':>4}   (radius none, full-rate slots {FULL_RATE_SLOTS}, max interval {MAX_INTERVAL})")
+    for players in (2, 4, 8, 16, 32, 64, 128, 250):
+        interest = InterestManager(players)
+        for player_id in range(players):
+            interest.move(player_id, rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT))
+        interest.refresh(force=True)
+        ticks = 64
+        sent = sum(
+            interest.should_send(recipient, source)
+            for _ in range(ticks) for recipient in range(players) for source in range(players)
+        )
+        print(f"{players:>8} {sent / ticks / players:>20.2f} {players - 1:>4}")
@@ -0,0 +1,179 @@
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from prediction import lerp_angle, lerp_wrapped
+from simulation import CAR_LENGTH, SCREEN_HEIGHT, SCREEN_WIDTH
+
+# Server-side checks for the hits relay clients report.
+#
+# A relay client tests its own bullets against the other cars as it drew
+# them: interpolated SnapshotBuffer.delay behind its clock, from states the
+# server relayed half an RTT earlier.  Its hit reaches the server another
+# half RTT later, so the shooter was looking at the target as the server had
+# it at
+#
+#   view time = received - rtt - claimed delay
+#
+# StateHistory keeps where every car was at each tick of the last `window`
+# seconds.  Ticks live in a fixed ring (slot = tick % size) stamped with the
+# tick they hold, so recording and lookups are O(1) and memory is bounded
+# whatever the match length; a slot stamped with another tick means that
+# moment has left the window.  check_hit rewinds the target to the view time
+# and re-runs Projectile.collides_with with the bullet where the shooter says
+# it was, after checking that matches where the shooter last reported it.
+# Both distances are taken the short way round the wrapped playfield, as the
+# client's own hit test does.
+#
+#   python lag_compensation.py   times record() and check_hit()
+
+# Default rewind window; hits claiming an older view are rejected
+REWIND_WINDOW = 0.5
+# Slack on the target's hit radius for interpolation and RTT jitter
+HIT_TOLERANCE = 16.0
+# A bullet may have moved this many frames past its last reported position:
+# the frames between the shooter's network ticks (game.SEND_RATE, down to
+# 20 Hz) plus the one it hit in
+BULLET_SLACK_FRAMES = 4
+BULLET_SPEED = 30
+# Projectile.collides_with's hit radius
+CAR_HALF_LENGTH = CAR_LENGTH / 2
+
+
+class StateHistory:
+    def __init__(
+        self,
+        capacity: int,
+        tick_rate: int = 60,
+        window: float = REWIND_WINDOW,
+        width: float = SCREEN_WIDTH,
+        height: float = SCREEN_HEIGHT,
+    ):
+        self.capacity = capacity
+        self.tick_rate = tick_rate
+        self.window = window
+        self.width = width
+        self.height = height
+        self.size = math.ceil(window * tick_rate) + 2
+        # [slot, player] -> x, y, angle
+        self.cars = np.zeros((self.size, capacity, 3))
+        self.present = np.zeros((self.size, capacity), dtype=bool)
+        self.ticks = np.full(self.size, -1, dtype=np.int64)
+        self.start = time.monotonic()
+        # Newest tick written
+        self.tick = -1
+
+    def reset(self, now: Optional[float] = None):
+        self.start = time.monotonic() if now is None else now
+        self.present[:] = False
+        self.ticks[:] = -1
+        self.tick = -1
+
+    def tick_at(self, when: float) -> float:
+        return (when - self.start) * self.tick_rate
+
+    def record(self, player_id: int, x: float, y: float, angle: float, now: Optional[float] = None):
+        tick = int(self.tick_at(time.monotonic() if now is None else now))
+        if tick > self.tick:
+            self._advance(tick)
+        slot = self.tick % self.size
+        self.cars[slot, player_id] = (x, y, angle)
+        self.present[slot, player_id] = True
+
+    def remove(self, player_id: int):
+        if self.tick >= 0:
+            self.present[self.tick % self.size, player_id] = False
+
+    def _advance(self, tick: int):
+        # Cars that sent nothing since keep their last position in the new slots
+        slots = np.arange(max(self.tick + 1, tick - self.size + 1), tick + 1)
+        if self.tick >= 0:
+            previous = self.tick % self.size
+            cars, present = self.cars[previous].copy(), self.present[previous].copy()
+            self.cars[slots % self.size] = cars
+            self.present[slots % self.size] = present
+        self.ticks[slots % self.size] = slots
+        self.tick = tick
+
+    def _at_tick(self, player_id: int, tick: int) -> Optional[np.ndarray]:
+        slot = tick % self.size
+        if tick < 0 or self.ticks[slot] != tick or not self.present[slot, player_id]:
+            return None
+        return self.cars[slot, player_id]
+
+    def lookup(self, player_id: int, when: float) -> Optional[Tuple[float, float, float]]:
+        # (x, y, angle) of the car at `when`, interpolated between ticks
+        tick = min(self.tick_at(when), self.tick)
+        base = math.floor(tick)
+        older = self._at_tick(player_id, base)
+        if older is None:
+            return None
+        x, y, angle = older.tolist()
+        fraction = tick - base
+        newer = self._at_tick(player_id, base + 1) if fraction else None
+        if newer is None:
+            return x, y, angle
+        next_x, next_y, next_angle = newer.tolist()
+        return (
+            lerp_wrapped(x, next_x, fraction, self.width),
+            lerp_wrapped(y, next_y, fraction, self.height),
+            lerp_angle(angle, next_angle, fraction) % 360,
+        )
+
+
+def check_hit(
+    history: StateHistory,
+    target: int,
+    shooter_state: Optional[Dict[str, Any]],
+    hit: Dict[str, Any],
+    view_time: float,
+) -> Optional[str]:
+    # None if the claimed hit holds up, otherwise why it was rejected
+    if shooter_state is None or "bullet" not in hit:
+        return "no claim"
+    rewound = history.lookup(target, view_time)
+    if rewound is None:
+        return "outside window"
+    bullet = next((b for b in shooter_state["bullets"] if b.get("id") == hit["bullet"]), None)
+    if bullet is not None:
+        origin, reach = bullet, bullet["speed"] * BULLET_SLACK_FRAMES
+    else:
+        # Fired and landed since the shooter's last report: it left the muzzle
+        origin = shooter_state["car"]
+        reach = CAR_HALF_LENGTH + BULLET_SPEED * BULLET_SLACK_FRAMES
+    if _wrapped_distance(history, origin["x"], origin["y"], hit["x"], hit["y"]) > reach:
+        return "bullet mismatch"
+    # Projectile.collides_with, but the short way round like the client's
+    # BulletPool.hits, so a car straddling an edge can still be hit
+    x, y, _ = rewound
+    if _wrapped_distance(history, x, y, hit["x"], hit["y"]) >= CAR_HALF_LENGTH + HIT_TOLERANCE:
+        return "miss"
+    return None
+
+
+def _wrapped_distance(history: StateHistory, ax: float, ay: float, bx: float, by: float) -> float:
+    # As SpatialHash.delta: b - a along the shortest way round the playfield
+    dx = (bx - ax + history.width / 2) % history.width - history.width / 2
+    dy = (by - ay + history.height / 2) % history.height - history.height / 2
+    return math.hypot(dx, dy)
+
+
+if __name__ == "__main__":
+    import timeit
+
+    capacity = 32
+    history = StateHistory(capacity)
+    now = history.start
+    for tick in range(history.size * 4):
+        for player_id in range(capacity):
+            history.record(player_id, player_id * 40.0, tick % SCREEN_HEIGHT, 0.0, now + tick / history.tick_rate)
+    now += history.size * 4 / history.tick_rate
+    state = {"car": {"x": 0.0, "y": 0.0, "angle": 0.0, "health": 100}, "bullets": [{"id": 3, "x": 40.0, "y": 10.0, "angle": 0.0, "speed": 30}]}
+    hit = {"target": 1, "bullet": 3, "x": 40.0, "y": 10.0, "delay": 0.1}
+    count = 20000
+    record = timeit.timeit(lambda: history.record(5, 1.0, 2.0, 3.0, now), number=count) / count
+    check = timeit.timeit(lambda: check_hit(history, 1, state, hit, now - 0.2), number=count) / count
+    print(f"{capacity} players, {history.size} ticks kept ({history.cars.nbytes + history.present.nbytes + history.ticks.nbytes} bytes)")
+    print(f"record {record * 1e6:.2f} us, check_hit {check * 1e6:.2f} us")
@@ -0,0 +1,758 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bullet_pool import BulletPool
+from delta import SnapshotDecoder, SnapshotEncoder, seq_newer
+from protocol import MAX_PLAYERS_PER_ROOM, PROTOCOL_VERSION, FrameDecoder, ProtocolError, encode_message
+from simulation import CarBody, SCREEN_HEIGHT, SCREEN_WIDTH, spawn_point
+from transport import (
+    CONNECT_RETRY_INTERVAL,
+    CONNECTION_TIMEOUT,
+    PACKET_ACCEPT,
+    PACKET_CONNECT,
+    PACKET_DATA,
+    PACKET_DISCONNECT,
+    UdpConnection,
+)
+
+# Synthetic clients for GameServer capacity testing.
+#
+# Every bot speaks the same protocol as Game: relay rooms get state_delta
+# frames (plus the odd hit) exactly like Game.send_game_state and
+# send_hit_data, authoritative rooms get sequenced inputs like
+# Game.send_input, and incoming messages are handled the way
+# Game.process_server_data does.  All bots share one asyncio loop and one
+# ticker, so a single process drives hundreds to thousands of connections.
+#
+# End-to-end latency is measured in process.  Relay mode: the time from a bot
+# encoding a delta to its room mate receiving the relayed copy; each bot
+# carries a stationary marker bullet encoding its index so the receiver can
+# find the sender.  Authoritative mode: the time from sending an input to the
+# first snapshot that acknowledges it, which includes waiting for the tick
+# and the snapshot interval.
+#
+#   python loadgen.py --serve --bots 200 --duration 30
+#   python loadgen.py --host 10.0.0.5 --bots 1000 --ramp 10 --churn 0.01 -o load.json
+#
+# --spectators adds read-only viewers on the server's spectator port, all
+# watching the oldest match; --slow-spectators of them never read, to check
+# that a stuck viewer costs the players nothing.
+#
+# The "lag" column is how late the bot ticker runs.  Once it is consistently
+# above one send interval the generator, not the server, is the bottleneck:
+# lower --rate or split the bots over several machines.
+
+SEND_RATE = 60
+REPORT_INTERVAL = 1.0
+RECONNECT_DELAY = 1.0
+# Bullet id reserved for the stream marker; the bot index is stored in its
+# position, which survives quantization for indices below MARKER_GRID ** 2
+MARKER_BULLET_ID = 0xFFFF
+MARKER_GRID = 4096
+# Send times kept per bot, enough for a few seconds of relay queueing
+SENT_HISTORY = 512
+LATENCY_SAMPLES = 100_000
+
+COUNTERS = (
+    "connects",
+    "connect_failures",
+    "disconnects",
+    "server_drops",
+    "messages_sent",
+    "bytes_sent",
+    "messages_received",
+    "bytes_received",
+    "state_deltas",
+    "snapshots",
+    "hits_sent",
+    "hits_received",
+    "games_started",
+    "games_over",
+    "dropped_frames",
+    "baseline_misses",
+    "malformed_frames",
+    "version_mismatches",
+    "unmatched_latency",
+    "ticker_overruns",
+    "spectator_connects",
+    "spectator_drops",
+    "spectator_bytes",
+)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Reservoir:
+    # Uniform sample of an unbounded stream, so percentiles stay cheap at any rate
+    def __init__(self, capacity: int = LATENCY_SAMPLES, seed: int = 0):
+        self.capacity = capacity
+        self.values: List[float] = []
+        self.seen = 0
+        self.rng = random.Random(seed)
+
+    def add(self, value: float):
+        self.seen += 1
+        if len(self.values) < self.capacity:
+            self.values.append(value)
+        else:
+            index = self.rng.randrange(self.seen)
+            if index < self.capacity:
+                self.values[index] = value
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.values)
+        return {
+            "count": self.seen,
+            "p50": percentile(ordered, 0.50),
+            "p90": percentile(ordered, 0.90),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else float("nan"),
+        }
+
+
+class Stats:
+    def __init__(self, seed: int = 0):
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.latency = Reservoir(seed=seed)
+        self.connect_time = Reservoir(seed=seed + 1)
+        # Raw samples since the last interval report
+        self.recent_latency: List[float] = []
+        self.max_lag = 0.0
+
+    def add(self, name: str, amount: int = 1):
+        self.counts[name] += amount
+
+    def add_latency(self, value: float):
+        self.latency.add(value)
+        if len(self.recent_latency) < LATENCY_SAMPLES:
+            self.recent_latency.append(value)
+
+
+# Scripted drivers: (bot, seconds since game start) -> (throttle, steering)
+def _drive_circle(bot: "Bot", t: float) -> Tuple[int, int]:
+    return 1, 1
+
+
+def _drive_zigzag(bot: "Bot", t: float) -> Tuple[int, int]:
+    return 1, 1 if int(t) % 2 else -1
+
+
+def _drive_random(bot: "Bot", t: float) -> Tuple[int, int]:
+    if t >= bot.next_change:
+        bot.next_change = t + bot.rng.uniform(0.25, 2.0)
+        bot.controls = (bot.rng.choice((1, 1, 0, -1)), bot.rng.choice((-1, 0, 0, 1)))
+    return bot.controls
+
+
+SCRIPTS: Dict[str, Callable[["Bot", float], Tuple[int, int]]] = {
+    "random": _drive_random,
+    "circle": _drive_circle,
+    "zigzag": _drive_zigzag,
+}
+
+
+class BotDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, bot: "Bot"):
+        self.bot = bot
+        self.accepted = asyncio.get_running_loop().create_future()
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, addr):
+        self.bot.receive_datagram(data, self)
+
+    def error_received(self, exc):
+        # ICMP port unreachable while the server is down; the handshake retries
+        pass
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+class Bot:
+    def __init__(self, index: int, generator: "LoadGenerator"):
+        self.index = index
+        self.generator = generator
+        self.config = generator.config
+        self.stats = generator.stats
+        self.rng = random.Random(generator.config.seed * 1_000_003 + index)
+        self.drive = SCRIPTS[self.config.script]
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.datagram: Optional[asyncio.DatagramTransport] = None
+        self.connection: Optional[UdpConnection] = None
+        self.connected = False
+        self.leaving = False
+        self.marker = {
+            "id": MARKER_BULLET_ID,
+            "x": float(index % MARKER_GRID),
+            "y": float(index // MARKER_GRID),
+            "angle": 0.0,
+            "speed": 0,
+        }
+        self.sent_at: Dict[int, float] = {}
+        self.reset_session()
+
+    def reset_session(self):
+        self.player_id: Optional[int] = None
+        self.authoritative = False
+        self.tick_rate = SEND_RATE
+        self.game_started = False
+        self.encoder: Optional[SnapshotEncoder] = None
+        # One per relayed sender; rooms can hold more than two players
+        self.decoders: Dict[int, SnapshotDecoder] = {}
+        self.reset_game()
+
+    def reset_game(self):
+        self.frame = 0
+        self.input_seq = 0
+        self.shots = 0
+        self.tick_accumulator = 0.0
+        self.started_at = time.monotonic()
+        self.next_change = 0.0
+        self.controls = (0, 0)
+        self.sent_at.clear()
+        self.last_seqs: Dict[int, int] = {}
+        self.last_ack: Optional[int] = None
+        self.last_tick: Optional[int] = None
+        self.tick_step: Optional[int] = None
+        if self.encoder is not None:
+            self.encoder.reset()
+        self.decoders.clear()
+        x, y, angle = spawn_point(self.player_id or 0, 2)
+        self.car = CarBody(x, y, angle=angle)
+        self.bullets = BulletPool(256)
+
+    # Connection handling
+
+    async def run(self, start_delay: float):
+        await asyncio.sleep(start_delay)
+        while self.generator.running:
+            self.leaving = False
+            self.reset_session()
+            started = time.monotonic()
+            try:
+                if self.config.transport == "udp":
+                    await self._udp_session(started)
+                else:
+                    await self._tcp_session(started)
+            except (OSError, asyncio.TimeoutError, ConnectionError):
+                if not self.connected:
+                    self.stats.add("connect_failures")
+                elif not self.leaving:
+                    self.stats.add("server_drops")
+            finally:
+                self.connected = False
+                self.writer = None
+                self.connection = None
+            if not self.leaving and self.generator.running:
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_connected(self, started: float):
+        self.connected = True
+        self.stats.add("connects")
+        self.stats.connect_time.add(time.monotonic() - started)
+
+    async def _tcp_session(self, started: float):
+        reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.config.host, self.config.port), CONNECTION_TIMEOUT
+        )
+        self._on_connected(started)
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    if not self.leaving:
+                        self.stats.add("server_drops")
+                    return
+                self.stats.add("bytes_received", len(data))
+                try:
+                    messages = decoder.feed(data)
+                except ProtocolError:
+                    # A byte stream cannot resynchronize after a bad frame
+                    self.stats.add("malformed_frames")
+                    self.leave()
+                    return
+                now = time.monotonic()
+                for message in messages:
+                    self.handle(message, now)
+        finally:
+            self.writer.close()
+
+    async def _udp_session(self, started: float):
+        loop = asyncio.get_running_loop()
+        self.datagram, protocol = await loop.create_datagram_endpoint(
+            lambda: BotDatagramProtocol(self), remote_addr=(self.config.host, self.config.port)
+        )
+        try:
+            deadline = started + CONNECTION_TIMEOUT
+            connect = bytes((PACKET_CONNECT, PROTOCOL_VERSION))
+            while not protocol.accepted.done():
+                if time.monotonic() > deadline:
+                    raise ConnectionError("No answer from UDP server")
+                self.datagram.sendto(connect)
+                await asyncio.wait([protocol.accepted], timeout=CONNECT_RETRY_INTERVAL)
+            self._on_connected(started)
+            await protocol.closed
+        finally:
+            self.datagram.close()
+            self.datagram = None
+
+    def receive_datagram(self, data: bytes, protocol: BotDatagramProtocol):
+        if not data:
+            return
+        now = time.monotonic()
+        self.stats.add("bytes_received", len(data))
+        if self.connection is None:
+            if data[0] not in (PACKET_ACCEPT, PACKET_DATA):
+                return
+            self.connection = UdpConnection(self._send_datagram, now)
+            if not protocol.accepted.done():
+                protocol.accepted.set_result(None)
+            if data[0] == PACKET_ACCEPT:
+                return
+        if data[0] == PACKET_ACCEPT:
+            return
+        try:
+            messages = self.connection.receive_datagram(data, now)
+        except ProtocolError:
+            self.stats.add("malformed_frames")
+            return
+        for message in messages:
+            self.handle(message, now)
+        if self.connection.closed and not self.leaving:
+            self.stats.add("server_drops")
+            self.datagram.close()
+
+    def _send_datagram(self, data: bytes):
+        self.stats.add("bytes_sent", len(data))
+        self.datagram.sendto(data)
+
+    def send(self, message: Dict[str, Any]):
+        self.stats.add("messages_sent")
+        if self.connection is not None:
+            self.connection.queue(message)
+            return
+        if self.writer is not None:
+            data = encode_message(message)
+            self.stats.add("bytes_sent", len(data))
+            self.writer.write(data)
+
+    def leave(self):
+        # Voluntary disconnect, e.g. for churn; run() reconnects straight away
+        self.leaving = True
+        self.stats.add("disconnects")
+        if self.datagram is not None:
+            self.datagram.sendto(bytes((PACKET_DISCONNECT,)))
+            self.datagram.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+    # Incoming messages, dispatched like Game.process_server_data
+
+    def handle(self, message: Dict[str, Any], now: float):
+        self.stats.add("messages_received")
+        if "state_delta" in message:
+            self.receive_state_delta(message["state_delta"], now)
+        elif "player_id" in message:
+            if message.get("protocol_version") != PROTOCOL_VERSION:
+                self.stats.add("version_mismatches")
+                self.leave()
+                return
+            self.player_id = message["player_id"]
+            if self.config.stats:
+                self.send({"player_name": f"bot{self.index}"})
+            self.authoritative = message.get("authoritative", False)
+            self.tick_rate = message.get("tick_rate") or SEND_RATE
+            self.encoder = SnapshotEncoder(self.player_id)
+            self.reset_game()
+            self.game_started = message.get("game_started", False)
+        elif "game_start" in message:
+            self.stats.add("games_started")
+            self.game_started = True
+            self.started_at = now
+        elif "snapshot" in message:
+            self.receive_snapshot(message["snapshot"], now)
+        elif "ping" in message:
+            self.send({"pong": message["ping"]})
+        elif "state_ack" in message:
+            if self.encoder is not None:
+                self.encoder.ack(message["state_ack"])
+        elif "hit" in message:
+            self.stats.add("hits_received")
+            # The relay takes each player's health from its own reports, as with Game.process_hit
+            if message["hit"]["target"] == self.player_id and "health" in message["hit"]:
+                self.car.health = message["hit"]["health"]
+        elif "game_reset" in message:
+            self.reset_game()
+            self.game_started = False
+        elif "game_over" in message:
+            self.stats.add("games_over")
+            self.game_started = False
+
+    def receive_state_delta(self, delta: Dict[str, Any], now: float):
+        self.stats.add("state_deltas")
+        decoder = self.decoders.get(delta["player"])
+        if decoder is None:
+            decoder = self.decoders[delta["player"]] = SnapshotDecoder()
+        state = decoder.decode(delta)
+        ack = decoder.take_ack()
+        if ack:
+            self.send({"state_ack": ack})
+            if ack["keyframe"]:
+                self.stats.add("baseline_misses")
+        if state is None:
+            return
+        sender = None
+        for bullet in state["bullets"]:
+            if bullet["id"] == MARKER_BULLET_ID:
+                sender = round(bullet["x"]) + round(bullet["y"]) * MARKER_GRID
+                break
+        seq = delta["seq"]
+        last_seq = self.last_seqs.get(delta["player"])
+        if last_seq is not None and seq_newer(seq, last_seq):
+            # Includes frames the server's interest management chose not to send
+            self.stats.add("dropped_frames", ((seq - last_seq) & 0xFFFF) - 1)
+        self.last_seqs[delta["player"]] = seq
+        bot = self.generator.bots[sender] if sender is not None and sender < len(self.generator.bots) else None
+        sent = bot.sent_at.get(seq) if bot is not None else None
+        if sent is None:
+            self.stats.add("unmatched_latency")
+        else:
+            self.stats.add_latency(now - sent)
+
+    def receive_snapshot(self, snapshot: Dict[str, Any], now: float):
+        self.stats.add("snapshots")
+        tick = snapshot["tick"]
+        if self.last_tick is not None and seq_newer(tick, self.last_tick):
+            # Snapshots go out every N ticks; the smallest gap seen is N
+            gap = (tick - self.last_tick) & 0xFFFF
+            self.tick_step = gap if self.tick_step is None else min(self.tick_step, gap)
+            self.stats.add("dropped_frames", gap // self.tick_step - 1)
+        self.last_tick = tick
+        if self.player_id is None or self.player_id >= len(snapshot["acks"]):
+            return
+        ack = snapshot["acks"][self.player_id]
+        if self.last_ack is None or seq_newer(ack, self.last_ack):
+            self.last_ack = ack
+            sent = self.sent_at.get(ack)
+            if sent is not None:
+                self.stats.add_latency(now - sent)
+
+    # Outgoing traffic, called by the shared ticker
+
+    def tick(self, now: float, dt: float):
+        if not self.connected or self.leaving:
+            return
+        if self.config.churn and self.rng.random() < self.config.churn * dt:
+            self.leave()
+            return
+        if self.game_started and self.player_id is not None:
+            throttle, steering = self.drive(self, now - self.started_at)
+            if self.authoritative:
+                self.send_inputs(throttle, steering, dt, now)
+            else:
+                self.send_state(throttle, steering, dt, now)
+        if self.connection is not None:
+            self.connection.flush(now)
+            if self.connection.is_timed_out(now):
+                self.stats.add("server_drops")
+                self.datagram.close()
+
+    def _fire(self, dt: float) -> int:
+        fire_rate = self.config.fire_rate * dt
+        shots = int(fire_rate)
+        return shots + (self.rng.random() < fire_rate - shots)
+
+    def send_inputs(self, throttle: int, steering: int, dt: float, now: float):
+        # One input per server tick, like Game.update_predicted_state
+        self.tick_accumulator += dt * self.tick_rate
+        while self.tick_accumulator >= 1:
+            self.tick_accumulator -= 1
+            self.input_seq = (self.input_seq + 1) & 0xFFFF
+            self.shots += self._fire(1 / self.tick_rate)
+            self.send({"input": {"seq": self.input_seq, "throttle": throttle, "steering": steering, "shots": self.shots}})
+            self._remember(self.input_seq, now)
+
+    def send_state(self, throttle: int, steering: int, dt: float, now: float):
+        car = self.car
+        car.acceleration = throttle * car.max_acceleration
+        car.steering = steering * car.max_steering
+        car.update(dt)
+        car.wrap(SCREEN_WIDTH, SCREEN_HEIGHT)
+        for _ in range(self._fire(dt)):
+            self.bullets.add(car.shoot())
+        self.bullets.step(SCREEN_WIDTH, SCREEN_HEIGHT)
+        self.frame += 1
+        game_state = {"car": car.serialize(), "bullets": self.bullets.to_dicts() + [self.marker]}
+        self.send({"state_delta": self.encoder.encode(self.frame, game_state)})
+        self._remember(self.frame & 0xFFFF, now)
+        if self.config.hit_rate and self.rng.random() < self.config.hit_rate * dt:
+            self.stats.add("hits_sent")
+            self.send({"hit": {"target": 1 - self.player_id if self.player_id < 2 else 0}})
+
+    def _remember(self, seq: int, now: float):
+        self.sent_at[seq] = now
+        if len(self.sent_at) > SENT_HISTORY:
+            del self.sent_at[next(iter(self.sent_at))]
+
+
+async def spectate(generator: "LoadGenerator", slow: bool):
+    # One viewer: counts what arrives, or with `slow` never reads at all
+    config, stats = generator.config, generator.stats
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(config.host, config.spectator_port), CONNECTION_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        stats.add("connect_failures")
+        return
+    stats.add("spectator_connects")
+    try:
+        writer.write(encode_message({"spectate": None}))
+        while generator.running:
+            if slow:
+                await asyncio.sleep(0.1)
+                continue
+            data = await reader.read(65536)
+            if not data:
+                # Rooms close, and their viewers with them, as the bots leave
+                if generator.running:
+                    stats.add("spectator_drops")
+                return
+            stats.add("spectator_bytes", len(data))
+    except (OSError, ConnectionError):
+        stats.add("spectator_drops")
+    finally:
+        writer.close()
+
+
+class LoadGenerator:
+    def __init__(self, config: argparse.Namespace):
+        self.config = config
+        self.stats = Stats(config.seed)
+        self.bots = [Bot(index, self) for index in range(config.bots)]
+        self.running = False
+
+    async def run(self) -> Dict[str, Any]:
+        self.running = True
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        ramp = self.config.ramp
+        tasks = [loop.create_task(bot.run(ramp * index / max(1, len(self.bots)))) for index, bot in enumerate(self.bots)]
+        if self.config.spectators:
+            # Once the first rooms have started
+            await asyncio.sleep(min(ramp, self.config.duration / 4))
+            tasks += [
+                loop.create_task(spectate(self, index < self.config.slow_spectators)) for index in range(self.config.spectators)
+            ]
+        ticker = loop.create_task(self._tick_loop())
+        reports = []
+        previous = dict(self.stats.counts)
+        last_report = started
+        try:
+            deadline = started + self.config.duration
+            while time.monotonic() < deadline:
+                await asyncio.sleep(min(self.config.report_interval, max(0.0, deadline - time.monotonic())))
+                now = time.monotonic()
+                report = self._interval(now - started, now - last_report, previous)
+                reports.append(report)
+                previous = dict(self.stats.counts)
+                last_report = now
+                self.stats.recent_latency = []
+                self.stats.max_lag = 0.0
+                if not self.config.quiet:
+                    print(format_interval(report), flush=True)
+        finally:
+            self.running = False
+            ticker.cancel()
+            for bot in self.bots:
+                if bot.connected and not bot.leaving:
+                    bot.leave()
+            await asyncio.gather(ticker, *tasks, return_exceptions=True)
+        return self.summary(time.monotonic() - started, reports)
+
+    async def _tick_loop(self):
+        interval = 1 / self.config.rate
+        next_tick = time.monotonic()
+        last = next_tick
+        while self.running:
+            now = time.monotonic()
+            dt, last = now - last, now
+            for bot in self.bots:
+                bot.tick(now, dt or interval)
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                self.stats.add("ticker_overruns")
+                self.stats.max_lag = max(self.stats.max_lag, -delay)
+                if delay < -5 * interval:
+                    next_tick = time.monotonic()
+            await asyncio.sleep(max(0.0, delay))
+
+    def _interval(self, elapsed: float, span: float, previous: Dict[str, int]) -> Dict[str, Any]:
+        span = max(span, 1e-9)
+        delta = {name: self.stats.counts[name] - previous[name] for name in COUNTERS}
+        ordered = sorted(self.stats.recent_latency)
+        return {
+            "elapsed": elapsed,
+            "connected": sum(bot.connected for bot in self.bots),
+            "sent_per_s": delta["messages_sent"] / span,
+            "sent_bytes_per_s": delta["bytes_sent"] / span,
+            "received_per_s": delta["messages_received"] / span,
+            "received_bytes_per_s": delta["bytes_received"] / span,
+            "latency_p50": percentile(ordered, 0.50),
+            "latency_p99": percentile(ordered, 0.99),
+            "dropped_frames": delta["dropped_frames"],
+            "malformed_frames": delta["malformed_frames"],
+            "connects": delta["connects"],
+            "disconnects": delta["disconnects"] + delta["server_drops"],
+            "max_lag": self.stats.max_lag,
+        }
+
+    def summary(self, elapsed: float, reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+        counts = self.stats.counts
+        return {
+            "config": {key: value for key, value in vars(self.config).items() if key not in ("output", "quiet")},
+            "protocol_version": PROTOCOL_VERSION,
+            "elapsed": elapsed,
+            "counts": dict(counts),
+            "rates": {
+                "sent_per_s": counts["messages_sent"] / elapsed,
+                "sent_bytes_per_s": counts["bytes_sent"] / elapsed,
+                "received_per_s": counts["messages_received"] / elapsed,
+                "received_bytes_per_s": counts["bytes_received"] / elapsed,
+                "connects_per_s": counts["connects"] / elapsed,
+                "disconnects_per_s": (counts["disconnects"] + counts["server_drops"]) / elapsed,
+            },
+            "latency": self.stats.latency.summary(),
+            "connect_time": self.stats.connect_time.summary(),
+            "intervals": reports,
+        }
+
+
+def format_interval(report: Dict[str, Any]) -> str:
+    return (
+        f"[{report['elapsed']:6.1f}s] bots {report['connected']:>5}"
+        f"  sent {report['sent_per_s']:>8.0f}/s {report['sent_bytes_per_s'] / 1e6:6.2f} MB/s"
+        f"  recv {report['received_per_s']:>8.0f}/s {report['received_bytes_per_s'] / 1e6:6.2f} MB/s"
+        f"  latency p50 {report['latency_p50'] * 1e3:6.1f} p99 {report['latency_p99'] * 1e3:6.1f} ms"
+        f"  dropped {report['dropped_frames']:>4} malformed {report['malformed_frames']:>3}"
+        f"  churn +{report['connects']}/-{report['disconnects']}"
+        f"  lag {report['max_lag'] * 1e3:5.1f} ms"
+    )
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    counts = summary["counts"]
+    rates = summary["rates"]
+    latency = summary["latency"]
+    connect = summary["connect_time"]
+    print(f"\n{summary['config']['bots']} bots for {summary['elapsed']:.1f}s over {summary['config']['transport']}")
+    print(f"  sent       {rates['sent_per_s']:>10.0f} msg/s {rates['sent_bytes_per_s'] / 1e6:8.2f} MB/s")
+    print(f"  fan-out    {rates['received_per_s']:>10.0f} msg/s {rates['received_bytes_per_s'] / 1e6:8.2f} MB/s")
+    print(
+        f"  latency    p50 {latency['p50'] * 1e3:.2f}  p90 {latency['p90'] * 1e3:.2f}"
+        f"  p99 {latency['p99'] * 1e3:.2f}  max {latency['max'] * 1e3:.2f} ms ({latency['count']} samples)"
+    )
+    print(f"  connect    p50 {connect['p50'] * 1e3:.2f}  p99 {connect['p99'] * 1e3:.2f} ms")
+    for name in COUNTERS:
+        if name not in ("messages_sent", "bytes_sent", "messages_received", "bytes_received"):
+            print(f"  {name:<18} {counts[name]:>10}")
+
+
+def _serve(
+    host: str,
+    port: int,
+    transport: str,
+    authoritative: bool,
+    players_per_room: int,
+    workers: int = 0,
+    spectator_port: Optional[int] = None,
+    stats_path: Optional[str] = None,
+):
+    # Keep the server's connection chatter out of the report
+    from game_server import GameServer
+    from sharding import ShardedServer
+
+    # At the descriptor level, so a sharded server's worker processes inherit it
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    if workers:
+        ShardedServer(host, port, workers, players_per_room, authoritative=authoritative, stats_path=stats_path).start()
+    else:
+        GameServer(host, port, players_per_room, transport, authoritative, spectator_port=spectator_port, stats_path=stats_path).start()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Drive a GameServer with synthetic clients")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--transport", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("-n", "--bots", type=int, default=100)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which bots connect")
+    parser.add_argument("--rate", type=float, default=SEND_RATE, help="client frames per second")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="random")
+    parser.add_argument("--fire-rate", type=float, default=2.0, help="shots per bot per second")
+    parser.add_argument("--hit-rate", type=float, default=0.0, help="unverifiable relay hit messages per bot per second (the server rejects them; see lag_compensation.py)")
+    parser.add_argument("--churn", type=float, default=0.0, help="disconnect/reconnect probability per bot per second")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+    parser.add_argument("--serve", action="store_true", help="start a local GameServer in a child process")
+    parser.add_argument("--authoritative", action="store_true", help="with --serve: run authoritative rooms")
+    parser.add_argument("--players-per-room", type=int, default=2, help="with --serve")
+    parser.add_argument("--workers", type=int, default=0, help="with --serve: sharded server with this many worker processes")
+    parser.add_argument("--spectators", type=int, default=0, help="read-only viewers (TCP; the server needs a spectator port)")
+    parser.add_argument("--slow-spectators", type=int, default=0, help="of the spectators, how many never read")
+    parser.add_argument("--spectator-port", type=int, help="default: --port + 1")
+    parser.add_argument("--stats", metavar="PATH", help="bots send names (bot0, bot1, ...); with --serve, the server keeps stats in PATH")
+    parser.add_argument("-o", "--output", help="write the summary as JSON")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no per-interval lines")
+    config = parser.parse_args(argv)
+    if not 1 <= config.players_per_room <= MAX_PLAYERS_PER_ROOM:
+        parser.error(f"--players-per-room must be 1 to {MAX_PLAYERS_PER_ROOM}")
+    if config.bots > MARKER_GRID ** 2:
+        parser.error(f"at most {MARKER_GRID ** 2} bots")
+    if config.spectator_port is None:
+        config.spectator_port = config.port + 1
+    if config.spectators and (config.transport != "tcp" or config.workers):
+        parser.error("--spectators needs --transport tcp and no --workers")
+
+    server = None
+    if config.serve:
+        server = multiprocessing.Process(
+            target=_serve,
+            args=(
+                config.host, config.port, config.transport, config.authoritative, config.players_per_room, config.workers,
+                config.spectator_port if config.spectators else None, config.stats,
+            ),
+            # Daemonic processes may not start children, which a sharded server does
+            daemon=not config.workers,
+        )
+        server.start()
+        time.sleep(0.5)
+    try:
+        summary = asyncio.run(LoadGenerator(config).run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    print_summary(summary)
+    if config.output:
+        with open(config.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["counts"]["connects"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import heapq
+import random
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from transport import UdpConnection
+
+# Simulated network for exercising transport.UdpConnection without sockets.
+# Both endpoints run on a virtual clock, so a scenario with seconds of latency
+# finishes instantly and is reproducible for a given seed.
+#
+#   python loopback.py   runs a matrix of link conditions and prints the results
+
+
+class LinkConditions:
+    def __init__(self, loss: float = 0.0, reorder: float = 0.0, latency: float = 0.0, jitter: float = 0.0, duplicate: float = 0.0):
+        self.loss = loss
+        self.reorder = reorder
+        self.latency = latency
+        self.jitter = jitter
+        self.duplicate = duplicate
+
+    def __repr__(self):
+        return (
+            f"loss={self.loss:.0%} reorder={self.reorder:.0%} latency={self.latency * 1000:.0f}ms"
+            f" jitter={self.jitter * 1000:.0f}ms dup={self.duplicate:.0%}"
+        )
+
+
+class LossyLink:
+    # One direction of a link: drops, delays, duplicates and reorders datagrams
+    def __init__(self, conditions: LinkConditions, rng: random.Random):
+        self.conditions = conditions
+        self.rng = rng
+        self.in_flight: List[Tuple[float, int, bytes]] = []
+        self._counter = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, data: bytes, now: float):
+        self.sent += 1
+        copies = 2 if self.rng.random() < self.conditions.duplicate else 1
+        for _ in range(copies):
+            if self.rng.random() < self.conditions.loss:
+                self.dropped += 1
+                continue
+            delay = self.conditions.latency + self.rng.uniform(0, self.conditions.jitter)
+            if self.rng.random() < self.conditions.reorder:
+                # Hold this datagram back long enough for later ones to overtake it
+                delay += self.conditions.latency + 0.05
+            self._counter += 1
+            heapq.heappush(self.in_flight, (now + delay, self._counter, data))
+
+    def receive_due(self, now: float) -> List[bytes]:
+        due = []
+        while self.in_flight and self.in_flight[0][0] <= now:
+            due.append(heapq.heappop(self.in_flight)[2])
+        return due
+
+
+class LoopbackHarness:
+    def __init__(self, conditions: LinkConditions, seed: int = 1, tick: float = 1 / 60):
+        self.rng = random.Random(seed)
+        self.tick = tick
+        self.now = 0.0
+        self.uplink = LossyLink(conditions, self.rng)
+        self.downlink = LossyLink(conditions, self.rng)
+        self.client = UdpConnection(lambda data: self.uplink.send(data, self.now), self.now)
+        self.server = UdpConnection(lambda data: self.downlink.send(data, self.now), self.now)
+        self.client_received: List[Tuple[float, Dict[str, Any]]] = []
+        self.server_received: List[Tuple[float, Dict[str, Any]]] = []
+
+    def step(self, client_outbox: Optional[List[Dict[str, Any]]] = None, server_outbox: Optional[List[Dict[str, Any]]] = None):
+        self.now += self.tick
+        for data in self.uplink.receive_due(self.now):
+            for message in self.server.receive_datagram(data, self.now):
+                self.server_received.append((self.now, message))
+        for data in self.downlink.receive_due(self.now):
+            for message in self.client.receive_datagram(data, self.now):
+                self.client_received.append((self.now, message))
+        for message in client_outbox or ():
+            self.client.queue(message)
+        for message in server_outbox or ():
+            self.server.queue(message)
+        self.client.flush(self.now)
+        self.server.flush(self.now)
+
+
+def run_scenario(
+    conditions: LinkConditions,
+    seconds: float = 20.0,
+    seed: int = 1,
+    event_interval: int = 15,
+    drain_seconds: float = 5.0,
+    on_step: Optional[Callable[[LoopbackHarness], None]] = None,
+) -> Dict[str, Any]:
+    # Server streams a snapshot every tick and a reliable hit event every
+    # event_interval ticks; the client streams acks back like Game does.
+    harness = LoopbackHarness(conditions, seed)
+    ticks = int(seconds / harness.tick)
+    event_sent_at: Dict[int, float] = {}
+    for tick in range(ticks):
+        server_outbox = [{"state_ack": {"player": 0, "seq": tick & 0xFFFF, "keyframe": False}}]
+        if tick % event_interval == 0:
+            event_id = len(event_sent_at)
+            event_sent_at[event_id] = harness.now + harness.tick
+            server_outbox.append({"hit": {"target": event_id % 250, "health": event_id // 250 % 250}})
+        client_outbox = [{"state_ack": {"player": 1, "seq": tick & 0xFFFF, "keyframe": False}}]
+        harness.step(client_outbox, server_outbox)
+        if on_step:
+            on_step(harness)
+    for _ in range(int(drain_seconds / harness.tick)):
+        harness.step()
+
+    events = [(at, m["hit"]) for at, m in harness.client_received if "hit" in m]
+    event_ids = [hit["health"] * 250 + hit["target"] for _, hit in events]
+    states = [m["state_ack"]["seq"] for _, m in harness.client_received if "state_ack" in m]
+    latencies = sorted(at - event_sent_at[event_id] for (at, _), event_id in zip(events, event_ids))
+    return {
+        "conditions": repr(conditions),
+        "events_sent": len(event_sent_at),
+        "events_delivered": len(events),
+        "events_in_order": event_ids == list(range(len(event_sent_at))),
+        "event_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+        "event_latency_max": latencies[-1] if latencies else None,
+        "states_sent": ticks,
+        "states_delivered": len(states),
+        "states_monotonic": all(((b - a) & 0xFFFF) < 0x8000 and a != b for a, b in zip(states, states[1:])),
+        "retransmits": harness.server.stats["retransmits"],
+        "datagrams_dropped": harness.uplink.dropped + harness.downlink.dropped,
+    }
+
+
+SCENARIOS = [
+    LinkConditions(),
+    LinkConditions(loss=0.05, latency=0.03),
+    LinkConditions(loss=0.2, latency=0.05, jitter=0.02),
+    LinkConditions(reorder=0.2, latency=0.04, jitter=0.03),
+    LinkConditions(loss=0.1, reorder=0.1, latency=0.1, jitter=0.05, duplicate=0.05),
+    LinkConditions(loss=0.4, latency=0.15, jitter=0.05),
+]
+
+
+if __name__ == "__main__":
+    for conditions in SCENARIOS:
+        result = run_scenario(conditions)
+        ok = result["events_delivered"] == result["events_sent"] and result["events_in_order"] and result["states_monotonic"]
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {result['conditions']}: "
+            f"events {result['events_delivered']}/{result['events_sent']} "
+            f"(p50 {result['event_latency_p50'] * 1000:.0f}ms, max {result['event_latency_max'] * 1000:.0f}ms), "
+            f"states {result['states_delivered']}/{result['states_sent']}, retransmits {result['retransmits']}"
+        )
@@ -0,0 +1,205 @@
+import asyncio
+import bisect
+import json
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Lightweight server metrics.
+#
+# Instruments are plain Python objects updated in place, so recording is an
+# attribute add or a bisect; nothing is formatted until a scrape.  Values
+# that already live elsewhere (per-client byte counts, send-queue depth) are
+# read at scrape time by collectors instead of being mirrored on every
+# message.  Registry.render() produces the Prometheus text exposition format,
+# and serve_metrics() exposes it over HTTP on the server's own event loop.
+#
+#   curl -s localhost:9100/metrics
+
+METRICS_PORT = 9100
+# Seconds; tick and handler times sit at the low end, RTTs further up
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+# (labels, value) pairs of one metric family
+Samples = List[Tuple[Dict[str, Any], float]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def lines(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value)}"]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def lines(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value)}"]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # Per-bucket (not cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= target and seen:
+                return bound
+        return math.nan
+
+    def lines(self) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+        # (name, kind, help, callable returning samples)
+        self.collectors: List[Tuple[str, str, str, Callable[[], Samples]]] = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def collect(self, name: str, kind: str, help_text: str, samples: Callable[[], Samples]):
+        # Labelled values computed on demand, e.g. one series per connected client
+        self.collectors.append((name, kind, help_text, samples))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        out = []
+        for metric in self.metrics:
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines())
+        for name, kind, help_text, samples in self.collectors:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples():
+                out.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(out) + "\n"
+
+
+class SampledLog:
+    # Structured (JSON) log of high-rate events, keeping one in `every`.  Each
+    # record carries how many events it stands for, so totals can be rebuilt.
+    # Callers test sample() first so skipped events cost one increment:
+    #
+    #   if log.sample():
+    #       log.log("message", room=room_id, ...)
+    def __init__(self, logger: logging.Logger, every: int = 1000, level: int = logging.INFO):
+        self.logger = logger
+        self.every = max(1, every)
+        self.level = level
+        self.seen = 0
+
+    def sample(self) -> bool:
+        self.seen += 1
+        return not self.seen % self.every and self.logger.isEnabledFor(self.level)
+
+    def log(self, event: str, **fields: Any):
+        fields["event"] = event
+        fields["sample_rate"] = self.every
+        fields["time"] = round(time.time(), 3)
+        self.logger.log(self.level, json.dumps(fields, default=str, separators=(",", ":")))
+
+
+async def serve_metrics(registry: Registry, host: str = "127.0.0.1", port: int = METRICS_PORT) -> asyncio.AbstractServer:
+    # Just enough HTTP/1.0 for a Prometheus scrape or curl
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+            method, path = (request.split(b"\r\n", 1)[0].split(b" ") + [b"", b""])[:2]
+            if method != b"GET":
+                status, body = "405 Method Not Allowed", b""
+            elif path.split(b"?")[0] in (b"/metrics", b"/"):
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
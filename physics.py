@@ -0,0 +1,216 @@
+import math
+from typing import Callable, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Fixed-timestep car physics for many cars at once.
+#
+# CarPhysics holds every car of a room as parallel arrays (struct of arrays)
+# and steps them with the same arithmetic, in the same order, as
+# CarBody.update and CarBody.wrap, so a predicting client running CarBody
+# agrees with a server running CarPhysics.  A step only ever sees a fixed dt:
+# FixedTimestep turns whatever time the caller's frames took into a whole
+# number of steps and carries the remainder over, so the same stream of
+# inputs, one per step, always produces the same cars whatever the frame
+# rate, which is what replays and reconciliation depend on.
+#
+# Steps take an optional index array so the server can move only the cars
+# that have an input queued for this round.  Small batches are cheaper one
+# car at a time on plain floats, which gives the same results bit for bit.
+#
+#   python physics.py   times CarPhysics.step against CarBody.update
+
+# Steps run per FixedTimestep.advance() at most; a longer stall is dropped, not replayed
+MAX_SUBSTEPS = 5
+# Below this many cars NumPy's per-call overhead outweighs the batching, so
+# advance() runs the same arithmetic per car instead
+BATCH_MIN_CARS = 12
+
+Cars = Optional[Union[np.ndarray, Sequence[int]]]
+# (ax, ay, bx, by) -> wrap-corrected b - a, like SpatialHash.delta
+Delta = Callable[[float, float, float, float], Tuple[float, float]]
+
+
+class FixedTimestep:
+    def __init__(self, step_dt: float, max_steps: int = MAX_SUBSTEPS):
+        self.step_dt = step_dt
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def reset(self):
+        self.accumulator = 0.0
+
+    def advance(self, dt: float) -> int:
+        # How many fixed steps `dt` of wall time is worth
+        self.accumulator = min(self.accumulator + dt, self.max_steps * self.step_dt)
+        steps = 0
+        while self.accumulator >= self.step_dt:
+            self.accumulator -= self.step_dt
+            steps += 1
+        return steps
+
+    @property
+    def alpha(self) -> float:
+        # How far into the next step we are, for interpolated drawing
+        return self.accumulator / self.step_dt
+
+
+class CarPhysics:
+    def __init__(self, count: int, length: float = 150, max_steering: float = 1, max_acceleration: float = 450.0):
+        self.count = count
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        # Velocity in the car's frame: vx along the heading
+        self.vx = np.zeros(count)
+        self.vy = np.zeros(count)
+        self.angle = np.zeros(count)
+        self.steering = np.zeros(count)
+        self.acceleration = np.zeros(count)
+        self.length = np.full(count, float(length))
+        self.radius = self.length / 4
+        self.max_steering = np.full(count, float(max_steering))
+        self.max_acceleration = np.full(count, float(max_acceleration))
+
+    def place(self, car: int, x: float, y: float, angle: float):
+        self.x[car], self.y[car], self.angle[car] = x, y, angle
+        self.vx[car] = self.vy[car] = 0.0
+        self.steering[car] = self.acceleration[car] = 0.0
+
+    def load(self, car: int, body):
+        # Copies a CarBody into slot `car`
+        self.x[car], self.y[car] = body.position.x, body.position.y
+        self.vx[car], self.vy[car] = body.velocity.x, body.velocity.y
+        self.angle[car] = body.angle
+        self.steering[car] = body.steering
+        self.acceleration[car] = body.acceleration
+
+    def store(self, car: int, body):
+        body.position.x, body.position.y = float(self.x[car]), float(self.y[car])
+        body.velocity.x, body.velocity.y = float(self.vx[car]), float(self.vy[car])
+        body.angle = float(self.angle[car])
+
+    def control(self, cars: Cars, throttle, steering):
+        # Inputs are -1, 0 or 1, scaled like Simulation did per CarBody
+        self.acceleration[cars] = np.asarray(throttle) * self.max_acceleration[cars]
+        self.steering[cars] = np.asarray(steering) * self.max_steering[cars]
+
+    def step(self, dt: float, cars: Cars = None):
+        index = slice(None) if cars is None else cars
+        max_acceleration = self.max_acceleration[index]
+        vx = np.maximum(-max_acceleration, np.minimum(self.vx[index] + self.acceleration[index] * dt, max_acceleration))
+        vy = self.vy[index]
+        steering = self.steering[index]
+        # Straight ahead turns on an infinite radius, i.e. not at all
+        turning_radius = np.divide(self.length[index], np.tan(steering), out=np.full(vx.shape, np.inf), where=steering != 0)
+        angular_velocity = vx / turning_radius
+        radians = np.radians(-self.angle[index])
+        cos, sin = np.cos(radians), np.sin(radians)
+        self.x[index] = self.x[index] + (vx * cos - vy * sin) * dt
+        self.y[index] = self.y[index] + (vx * sin + vy * cos) * dt
+        self.angle[index] = (self.angle[index] + np.degrees(angular_velocity) * dt) % 360
+        self.vx[index] = vx
+
+    def wrap(self, width: float, height: float, cars: Cars = None):
+        index = slice(None) if cars is None else cars
+        x, y = self.x[index], self.y[index]
+        self.x[index] = np.where(x > width, 0.0, np.where(x < 0, width, x))
+        self.y[index] = np.where(y > height, 0.0, np.where(y < 0, height, y))
+
+    def advance(self, dt: float, width: float, height: float, cars: Cars = None):
+        # step() then wrap(), per car on plain floats for small batches
+        if (self.count if cars is None else len(cars)) >= BATCH_MIN_CARS:
+            index = None if cars is None else np.asarray(cars)
+            self.step(dt, index)
+            self.wrap(width, height, index)
+            return
+        for car in range(self.count) if cars is None else cars:
+            self._advance_one(int(car), dt, width, height)
+
+    def _advance_one(self, car: int, dt: float, width: float, height: float):
+        # CarBody.update and CarBody.wrap, line for line
+        max_acceleration = float(self.max_acceleration[car])
+        vx = max(-max_acceleration, min(float(self.vx[car]) + float(self.acceleration[car]) * dt, max_acceleration))
+        vy = float(self.vy[car])
+        steering = float(self.steering[car])
+        angular_velocity = vx / (float(self.length[car]) / math.tan(steering)) if steering else 0
+        radians = math.radians(-float(self.angle[car]))
+        cos, sin = math.cos(radians), math.sin(radians)
+        x = float(self.x[car]) + (vx * cos - vy * sin) * dt
+        y = float(self.y[car]) + (vx * sin + vy * cos) * dt
+        if x > width:
+            x = 0.0
+        elif x < 0:
+            x = width
+        if y > height:
+            y = 0.0
+        elif y < 0:
+            y = height
+        self.x[car], self.y[car], self.vx[car] = x, y, vx
+        self.angle[car] = (float(self.angle[car]) + math.degrees(angular_velocity) * dt) % 360
+
+    def separate_pairs(self, pairs: Iterable[Tuple[int, int]], delta: Delta, width: float, height: float) -> bool:
+        # simulation.separate_cars and CarBody.wrap for each pair in turn, so
+        # later pairs see earlier pushes; a Python loop over plain floats,
+        # as there are few pairs and each one is a handful of operations
+        x, y, vx, radius = self.x.tolist(), self.y.tolist(), self.vx.tolist(), self.radius.tolist()
+        moved = False
+        for a, b in pairs:
+            dx, dy = delta(x[a], y[a], x[b], y[b])
+            distance = math.hypot(dx, dy)
+            overlap = radius[a] + radius[b] - distance
+            if overlap <= 0:
+                continue
+            if distance == 0:
+                dx, dy, distance = 1.0, 0.0, 1.0
+            nx, ny = dx / distance * overlap, dy / distance * overlap
+            for car, share in ((a, -0.5), (b, 0.5)):
+                x[car] += nx * share
+                y[car] += ny * share
+                vx[car] = 0.0
+                if x[car] > width:
+                    x[car] = 0.0
+                elif x[car] < 0:
+                    x[car] = width
+                if y[car] > height:
+                    y[car] = 0.0
+                elif y[car] < 0:
+                    y[car] = height
+            moved = True
+        if moved:
+            self.x[:], self.y[:], self.vx[:] = x, y, vx
+        return moved
+
+
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    from simulation import SCREEN_HEIGHT, SCREEN_WIDTH, CarBody
+
+    rng = random.Random(1)
+    print(f"{'cars':>6} {'CarBody':>12} {'CarPhysics':>12}   max drift after 600 steps")
+    for count in (2, 8, 32, 128, 250, 1000):
+        bodies = [CarBody(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), rng.uniform(0, 360)) for _ in range(count)]
+        physics = CarPhysics(count)
+        for car, body in enumerate(bodies):
+            body.acceleration = rng.choice((-1, 0, 1)) * body.max_acceleration
+            body.steering = rng.choice((-1, 0, 1)) * body.max_steering
+            physics.load(car, body)
+
+        def scalar():
+            for body in bodies:
+                body.update(1 / 60)
+                body.wrap(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+        def batched():
+            physics.advance(1 / 60, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+        for _ in range(600):
+            scalar()
+            batched()
+        drift = max(max(abs(body.position.x - physics.x[car]), abs(body.position.y - physics.y[car])) for car, body in enumerate(bodies))
+        number = max(1, 20000 // count)
+        print(
+            f"{count:>6} {timeit.timeit(scalar, number=number) / number * 1e6:>9.1f} us"
+            f" {timeit.timeit(batched, number=number) / number * 1e6:>9.1f} us   {drift:.2e} px"
+        )
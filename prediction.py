@@ -0,0 +1,120 @@
+import math
+from collections import deque
+from typing import Dict, Any, Optional
+
+from delta import seq_newer
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT
+
+# Client-side smoothing.
+#
+# Remote entities are rendered from a ring buffer of timestamped snapshots at
+# a point slightly in the past, so there are (almost) always two snapshots to
+# interpolate between even at 10-20 updates per second.  The local car is
+# predicted: every input is applied immediately and remembered until the
+# server acks it, then replayed on top of the authoritative state.
+
+INTERPOLATION_DELAY = 0.1
+BUFFER_SIZE = 64
+
+
+def lerp_wrapped(a: float, b: float, t: float, size: float) -> float:
+    # A jump of more than half the screen is the car wrapping around the edge
+    difference = b - a
+    if abs(difference) > size / 2:
+        difference -= math.copysign(size, difference)
+    return (a + difference * t) % size
+
+
+def lerp_angle(a: float, b: float, t: float) -> float:
+    difference = (b - a + 180) % 360 - 180
+    return a + difference * t
+
+
+def interpolate_car(a: Dict[str, Any], b: Dict[str, Any], t: float, width: float = SCREEN_WIDTH, height: float = SCREEN_HEIGHT) -> Dict[str, Any]:
+    car = dict(b if t >= 0.5 else a)
+    car["x"] = lerp_wrapped(a["x"], b["x"], t, width)
+    car["y"] = lerp_wrapped(a["y"], b["y"], t, height)
+    car["angle"] = lerp_angle(a["angle"], b["angle"], t)
+    return car
+
+
+class SnapshotBuffer:
+    # Holds (remote tick, state) pairs and samples them on the local clock.
+    # remote tick -> local time is estimated from arrival times, tracking the
+    # fastest arrivals so network jitter only ever adds delay.
+    def __init__(self, tick_rate: float, delay: float = INTERPOLATION_DELAY, capacity: int = BUFFER_SIZE):
+        self.tick_rate = tick_rate
+        self.delay = delay
+        self.snapshots: deque = deque(maxlen=capacity)
+        self.clock_offset: Optional[float] = None
+
+    def clear(self):
+        self.snapshots.clear()
+        self.clock_offset = None
+
+    def push(self, tick: int, state: Dict[str, Any], now: float):
+        if self.snapshots and tick <= self.snapshots[-1][0]:
+            return
+        offset = now - tick / self.tick_rate
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        else:
+            # Drift slowly upwards so a lucky early packet doesn't pin us forever
+            self.clock_offset += (offset - self.clock_offset) * 0.01
+        self.snapshots.append((tick, state))
+
+    def render_tick(self, now: float) -> Optional[float]:
+        if self.clock_offset is None:
+            return None
+        return (now - self.clock_offset - self.delay) * self.tick_rate
+
+    def sample(self, now: float, width: float = SCREEN_WIDTH, height: float = SCREEN_HEIGHT) -> Optional[Dict[str, Any]]:
+        if not self.snapshots:
+            return None
+        render_tick = self.render_tick(now)
+        older = self.snapshots[0]
+        newer = None
+        for entry in self.snapshots:
+            if entry[0] <= render_tick:
+                older = entry
+            else:
+                newer = entry
+                break
+        tick, state = older
+        if newer is None or render_tick < tick:
+            car = state["car"]
+        else:
+            t = (render_tick - tick) / (newer[0] - tick)
+            car = interpolate_car(state["car"], newer[1]["car"], t, width, height)
+        # Bullets fly in straight lines, so they are extrapolated from the older
+        # snapshot rather than interpolated; the caller applies `elapsed`
+        return {"car": car, "bullets": state["bullets"], "elapsed": max(0.0, render_tick - tick)}
+
+
+class InputPredictor:
+    def __init__(self, tick_rate: float):
+        self.tick_dt = 1 / tick_rate
+        # (seq, throttle, steering) for every input the server has not acked yet
+        self.pending: deque = deque()
+
+    def clear(self):
+        self.pending.clear()
+
+    def record(self, seq: int, throttle: int, steering: int):
+        self.pending.append((seq, throttle, steering))
+
+    def acknowledge(self, acked_seq: int):
+        while self.pending and not seq_newer(self.pending[0][0], acked_seq):
+            self.pending.popleft()
+
+    def reconcile(self, car, server_state: Dict[str, Any], acked_seq: int, width: float = SCREEN_WIDTH, height: float = SCREEN_HEIGHT):
+        # Rewind to the server's state for acked_seq and replay what it hasn't seen yet
+        self.acknowledge(acked_seq)
+        acceleration, steering = car.acceleration, car.steering
+        car.deserialize(server_state)
+        for _, throttle, steer in self.pending:
+            car.acceleration = throttle * car.max_acceleration
+            car.steering = steer * car.max_steering
+            car.update(self.tick_dt)
+            car.wrap(width, height)
+        car.acceleration, car.steering = acceleration, steering
@@ -0,0 +1,152 @@
+import csv
+import json
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Per-phase frame timing for the client.
+#
+# Game.run calls begin_frame() at the top of every loop and lap(phase) after
+# each part of it; a lap charges the time since the previous lap to that
+# phase, so the phases of a frame add up to the whole frame.  Each finished
+# frame is one row of a fixed ring of FRAME_HISTORY rows, together with what
+# the receive thread took in since the previous frame (bytes, messages, time
+# spent decoding them, and states skipped because a newer one came in the
+# same frame).  The overhead is one perf_counter() and a list add per lap.
+#
+# With keep_session, every full ring is also copied aside, so export() can
+# write the whole session rather than the last FRAME_HISTORY frames.  Times
+# are exported in milliseconds.
+#
+#   python game.py --profile session.csv    (or .json), F3 toggles the overlay
+#   python profiler.py session.csv          p50/p99/max of every column
+
+PHASES = ("idle", "events", "receive", "update", "collisions", "send", "remote", "audio", "draw", "flip")
+NETWORK_COLUMNS = ("net_bytes", "net_messages", "net_decode_ms", "net_coalesced")
+FRAME_HISTORY = 600
+
+# () -> running totals of (bytes, messages, decode seconds, coalesced states)
+NetworkTotals = Callable[[], Tuple[int, int, float, int]]
+
+
+class FrameProfiler:
+    def __init__(
+        self,
+        phases: Sequence[str] = PHASES,
+        capacity: int = FRAME_HISTORY,
+        network: Optional[NetworkTotals] = None,
+        keep_session: bool = False,
+    ):
+        self.phases = tuple(phases)
+        self.phase_index: Dict[str, int] = {name: index for index, name in enumerate(self.phases)}
+        self.columns = ("frame_ms",) + tuple(f"{phase}_ms" for phase in self.phases) + NETWORK_COLUMNS
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(self.columns)))
+        # Frames recorded since the start
+        self.count = 0
+        self.network = network
+        self.network_totals = (0, 0, 0.0, 0)
+        self.session: Optional[List[np.ndarray]] = [] if keep_session else None
+        self.current = [0.0] * len(self.phases)
+        self.started: Optional[float] = None
+        self.last = 0.0
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.started is not None:
+            self._end_frame(now)
+        self.started = self.last = now
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.current[self.phase_index[phase]] += now - self.last
+        self.last = now
+
+    def finish(self):
+        # Records the frame in progress, e.g. before exporting at exit
+        if self.started is not None:
+            self._end_frame(time.perf_counter())
+            self.started = None
+
+    def _end_frame(self, now: float):
+        network = [0, 0, 0.0, 0]
+        if self.network is not None:
+            totals = self.network()
+            network = [total - previous for total, previous in zip(totals, self.network_totals)]
+            self.network_totals = totals
+        received, messages, decode, coalesced = network
+        self.samples[self.count % self.capacity] = (
+            [(now - self.started) * 1000] + [seconds * 1000 for seconds in self.current] + [received, messages, decode * 1000, coalesced]
+        )
+        self.count += 1
+        if self.session is not None and self.count % self.capacity == 0:
+            self.session.append(self.samples.copy())
+        self.current = [0.0] * len(self.phases)
+
+    def frames(self) -> np.ndarray:
+        # The last FRAME_HISTORY frames, oldest first
+        if self.count <= self.capacity:
+            return self.samples[:self.count]
+        split = self.count % self.capacity
+        return np.concatenate((self.samples[split:], self.samples[:split]))
+
+    def column(self, name: str, last: Optional[int] = None) -> np.ndarray:
+        values = self.frames()[:, self.columns.index(name)]
+        return values if last is None else values[-last:]
+
+    def percentiles(self, quantiles: Sequence[float] = (50, 99)) -> np.ndarray:
+        # [quantile, column]
+        frames = self.frames()
+        if not len(frames):
+            return np.zeros((len(quantiles), len(self.columns)))
+        return np.percentile(frames, quantiles, axis=0)
+
+    def session_frames(self) -> np.ndarray:
+        if self.session is None:
+            return self.frames()
+        return np.concatenate(self.session + [self.samples[:self.count % self.capacity]])
+
+    def export(self, path: str):
+        frames = self.session_frames()
+        if path.endswith(".json"):
+            summary = summarize(self.columns, frames)
+            with open(path, "w") as f:
+                json.dump({"columns": self.columns, "summary": summary, "frames": np.round(frames, 4).tolist()}, f)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                writer.writerows(np.round(frames, 4).tolist())
+
+
+def summarize(columns: Sequence[str], frames: np.ndarray) -> Dict[str, Dict[str, float]]:
+    if not len(frames):
+        return {}
+    p50, p99 = np.percentile(frames, (50, 99), axis=0)
+    return {
+        name: {"p50": float(p50[i]), "p99": float(p99[i]), "max": float(frames[:, i].max()), "mean": float(frames[:, i].mean())}
+        for i, name in enumerate(columns)
+    }
+
+
+def load(path: str) -> Tuple[List[str], np.ndarray]:
+    if path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        return data["columns"], np.array(data["frames"], dtype=float).reshape(-1, len(data["columns"]))
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    return rows[0], np.array(rows[1:], dtype=float).reshape(-1, len(rows[0]))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python profiler.py SESSION.csv|SESSION.json")
+    columns, frames = load(sys.argv[1])
+    print(f"{sys.argv[1]}: {len(frames)} frames")
+    print(f"{'column':<16} {'p50':>9} {'p99':>9} {'max':>9} {'mean':>9}")
+    for name, stats in summarize(columns, frames).items():
+        print(f"{name:<16} {stats['p50']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f} {stats['mean']:>9.3f}")
@@ -0,0 +1,659 @@
+import struct
+from operator import itemgetter
+from typing import List, Dict, Any, Callable, Tuple
+
+import numpy as np
+
+# Wire format
+# -----------
+# frame   := varint(len(payload) + 1) | u8 message type | payload
+# All integers are little-endian.  Bump PROTOCOL_VERSION whenever a message
+# type is added or a payload layout changes; it is sent in the player_id
+# handshake so clients can refuse to talk to a mismatched server.
+#
+# Quantization (error bounds are for values inside the representable range)
+#   position: int16, 1/8 px        -> |error| <= 1/16 px, range +/-4096 px
+#   angle:    uint16, 360/65536 deg -> |error| <= 0.0028 deg, wrapped to [0, 360)
+#   health:   uint8, exact for 0..254 (255 marks "absent" where optional)
+#   speed:    uint8, exact for whole px/frame in 0..255
+#   velocity: int16, 1/8 px/s (snapshot cars only, for client-side prediction)
+#
+# state_delta messages carry the same quantized integers, but car fields are
+# zigzag varints relative to the acknowledged baseline (see delta.py) and
+# sequence numbers are 16-bit and wrap.
+#
+# Long bullet lists are quantized and packed as NumPy records, a field at a
+# time for the whole list, rather than bullet by bullet; the bytes are the
+# same either way.
+#
+# snapshot cars are positional (index = player id) but may be left out for
+# interest management: a bitmask of ceil(count / 8) bytes follows the car
+# count, and only the cars whose bit is set are packed.  Absent cars decode
+# as None.
+#
+# hit messages from relay clients carry the claim the server checks (see
+# lag_compensation.py): the bullet's id and position when it hit, and how far
+# behind its own clock the shooter was drawing the target, in milliseconds.
+#
+# spectate is the only message a spectator sends: the room it wants to watch,
+# or SPECTATE_ANY.  The server answers with a player_id message carrying
+# SPECTATOR as the id, then streams the room (see spectators.py).
+#
+# player_name is optional, sent by a client once after connecting: up to
+# MAX_NAME_BYTES of UTF-8, the name its stats are kept under (see stats.py).
+
+PROTOCOL_VERSION = 9
+
+POSITION_SCALE = 8
+ANGLE_SCALE = 65536 / 360
+ABSENT = 0xFF
+SPECTATOR = 0xFF
+SPECTATE_ANY = 0xFFFF
+# Player ids and bullet owners are u8 fields and 0xFF is taken by ABSENT/SPECTATOR
+MAX_PLAYERS_PER_ROOM = 0xFF - 1
+MAX_FRAME_SIZE = 1 << 20
+MAX_NAME_BYTES = 32
+
+CAR_STRUCT = struct.Struct("<hhHB")     # x, y, angle, health
+BULLET_STRUCT = struct.Struct("<hhHB")  # x, y, angle, speed
+DELTA_BULLET_STRUCT = struct.Struct("<HhhHB")  # id, x, y, angle, speed
+SNAPSHOT_BULLET_STRUCT = struct.Struct("<BHhhHB")  # owner, id, x, y, angle, speed
+HIT_CLAIM_STRUCT = struct.Struct("<HhhH")  # bullet id, x, y, view delay ms
+INPUT_STRUCT = struct.Struct("<HbbH")  # seq, throttle, steering, shots
+SNAPSHOT_CAR_EXTRA_STRUCT = struct.Struct("<hH")  # velocity, last applied input seq
+DELTA_CAR_FIELDS = ("x", "y", "angle", "health", "other_car_health")
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+
+# The bullet structs as NumPy records, for packing whole lists at once
+BULLET_DTYPE = np.dtype([("x", "<i2"), ("y", "<i2"), ("angle", "<u2"), ("speed", "u1")])
+SNAPSHOT_BULLET_DTYPE = np.dtype([("owner", "u1"), ("id", "<u2"), ("x", "<i2"), ("y", "<i2"), ("angle", "<u2"), ("speed", "u1")])
+# Shorter lists are cheaper one bullet at a time than through NumPy's
+# per-call overhead.  Decoding breaks even later, as it builds a dict per
+# bullet either way.
+BULK_PACK_MIN_BULLETS = 16
+BULK_UNPACK_MIN_BULLETS = 64
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def quantize_position(value: float) -> int:
+    return max(-32768, min(32767, round(value * POSITION_SCALE)))
+
+
+def dequantize_position(value: int) -> float:
+    return value / POSITION_SCALE
+
+
+def quantize_angle(angle: float) -> int:
+    return round((angle % 360) * ANGLE_SCALE) & 0xFFFF
+
+
+def dequantize_angle(value: int) -> float:
+    return value / ANGLE_SCALE
+
+
+def _clamp_u8(value: int) -> int:
+    return max(0, min(254, int(value)))
+
+
+def encode_varint(value: int) -> bytes:
+    # Most lengths and counts fit in one byte
+    if 0 <= value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buffer, offset: int) -> Tuple[int, int]:
+    # Returns (value, new_offset); new_offset is -1 if the varint is incomplete
+    if offset < len(buffer) and buffer[offset] < 0x80:
+        return buffer[offset], offset + 1
+    value = 0
+    shift = 0
+    while offset < len(buffer):
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+        if shift > 28:
+            raise ProtocolError("Varint too long")
+    return 0, -1
+
+
+def encode_zigzag(value: int) -> bytes:
+    return encode_varint(value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def decode_zigzag(buffer, offset: int) -> Tuple[int, int]:
+    value, offset = decode_varint(buffer, offset)
+    if offset < 0:
+        raise ProtocolError("Truncated varint")
+    return (value >> 1) ^ -(value & 1), offset
+
+
+def _read_varint(buffer, offset: int) -> Tuple[int, int]:
+    value, offset = decode_varint(buffer, offset)
+    if offset < 0:
+        raise ProtocolError("Truncated varint")
+    return value, offset
+
+
+# Entity layouts
+
+def pack_car(car: Dict[str, Any]) -> bytes:
+    return CAR_STRUCT.pack(
+        quantize_position(car["x"]),
+        quantize_position(car["y"]),
+        quantize_angle(car["angle"]),
+        _clamp_u8(car["health"]),
+    )
+
+
+def unpack_car(payload, offset: int = 0) -> Dict[str, Any]:
+    x, y, angle, health = CAR_STRUCT.unpack_from(payload, offset)
+    return {
+        "x": dequantize_position(x),
+        "y": dequantize_position(y),
+        "angle": dequantize_angle(angle),
+        "health": health,
+    }
+
+
+def pack_bullet(bullet: Dict[str, Any]) -> bytes:
+    return BULLET_STRUCT.pack(
+        quantize_position(bullet["x"]),
+        quantize_position(bullet["y"]),
+        quantize_angle(bullet["angle"]),
+        max(0, min(255, round(bullet["speed"]))),
+    )
+
+
+def unpack_bullet(payload, offset: int = 0) -> Dict[str, Any]:
+    x, y, angle, speed = BULLET_STRUCT.unpack_from(payload, offset)
+    return {
+        "x": dequantize_position(x),
+        "y": dequantize_position(y),
+        "angle": dequantize_angle(angle),
+        "speed": speed,
+    }
+
+
+_QUANTIZE_FIELD = {
+    "x": lambda values: np.minimum(np.maximum(np.rint(values * POSITION_SCALE), -32768), 32767),
+    "y": lambda values: np.minimum(np.maximum(np.rint(values * POSITION_SCALE), -32768), 32767),
+    "angle": lambda values: np.rint(np.mod(values, 360) * ANGLE_SCALE).astype(np.int64) & 0xFFFF,
+    "speed": lambda values: np.minimum(np.maximum(np.rint(values), 0), 255),
+    "id": lambda values: values.astype(np.int64) & 0xFFFF,
+    "owner": lambda values: values,
+}
+
+
+def pack_records(bullets: List[Dict[str, Any]], dtype: np.dtype) -> bytes:
+    # The whole list quantized one field at a time, byte for byte what
+    # packing it one bullet at a time gives
+    records = np.empty(len(bullets), dtype=dtype)
+    for name in dtype.names:
+        records[name] = _QUANTIZE_FIELD[name](np.fromiter(map(itemgetter(name), bullets), np.float64, len(bullets)))
+    return records.tobytes()
+
+
+def unpack_columns(payload, offset: int, count: int, dtype: np.dtype) -> Dict[str, list]:
+    # Field -> dequantized values of `count` packed records
+    records = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+    columns = {name: records[name].tolist() for name in dtype.names}
+    for name, scale in (("x", POSITION_SCALE), ("y", POSITION_SCALE), ("angle", ANGLE_SCALE)):
+        columns[name] = (records[name] / scale).tolist()
+    return columns
+
+
+def pack_bullets(bullets: List[Dict[str, Any]]) -> bytes:
+    if len(bullets) >= BULK_PACK_MIN_BULLETS:
+        return encode_varint(len(bullets)) + pack_records(bullets, BULLET_DTYPE)
+    buffer = bytearray(encode_varint(len(bullets)))
+    offset = len(buffer)
+    buffer.extend(bytes(len(bullets) * BULLET_STRUCT.size))
+    pack_into = BULLET_STRUCT.pack_into
+    for bullet in bullets:
+        pack_into(
+            buffer, offset,
+            max(-32768, min(32767, round(bullet["x"] * POSITION_SCALE))),
+            max(-32768, min(32767, round(bullet["y"] * POSITION_SCALE))),
+            round((bullet["angle"] % 360) * ANGLE_SCALE) & 0xFFFF,
+            max(0, min(255, round(bullet["speed"]))),
+        )
+        offset += BULLET_STRUCT.size
+    return bytes(buffer)
+
+
+def unpack_bullets(payload, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+    count, offset = decode_varint(payload, offset)
+    end = offset + count * BULLET_STRUCT.size
+    if offset < 0 or end > len(payload):
+        raise ProtocolError("Truncated bullet list")
+    if count >= BULK_UNPACK_MIN_BULLETS:
+        columns = unpack_columns(payload, offset, count, BULLET_DTYPE)
+        bullets = [
+            {"x": x, "y": y, "angle": angle, "speed": speed}
+            for x, y, angle, speed in zip(columns["x"], columns["y"], columns["angle"], columns["speed"])
+        ]
+        return bullets, end
+    bullets = [
+        {"x": x / POSITION_SCALE, "y": y / POSITION_SCALE, "angle": angle / ANGLE_SCALE, "speed": speed}
+        for x, y, angle, speed in BULLET_STRUCT.iter_unpack(payload[offset:end])
+    ]
+    return bullets, end
+
+
+# Message payloads
+
+PLAYER_FLAG_GAME_STARTED = 1
+PLAYER_FLAG_AUTHORITATIVE = 2
+
+
+def _encode_player_id(message: Dict[str, Any]) -> bytes:
+    flags = (
+        (PLAYER_FLAG_GAME_STARTED if message.get("game_started") else 0)
+        | (PLAYER_FLAG_AUTHORITATIVE if message.get("authoritative") else 0)
+    )
+    return bytes((PROTOCOL_VERSION, message["player_id"], flags, message.get("tick_rate", 0)))
+
+
+def _decode_player_id(payload) -> Dict[str, Any]:
+    # Only the version byte is guaranteed to keep its place across versions
+    version, player_id, flags = struct.unpack_from("<BBB", payload)
+    return {
+        "player_id": player_id,
+        "game_started": bool(flags & PLAYER_FLAG_GAME_STARTED),
+        "authoritative": bool(flags & PLAYER_FLAG_AUTHORITATIVE),
+        "tick_rate": payload[3] if len(payload) > 3 else 0,
+        "protocol_version": version,
+    }
+
+
+def _encode_game_start(message: Dict[str, Any]) -> bytes:
+    return b""
+
+
+def _decode_game_start(payload) -> Dict[str, Any]:
+    return {"game_start": True}
+
+
+def _encode_game_state(message: Dict[str, Any]) -> bytes:
+    state = message["game_state"]
+    other_car_health = state.get("other_car_health")
+    return (
+        pack_car(state["car"])
+        + U8.pack(ABSENT if other_car_health is None else _clamp_u8(other_car_health))
+        + pack_bullets(state["bullets"])
+    )
+
+
+def _decode_game_state(payload) -> Dict[str, Any]:
+    state = {"car": unpack_car(payload)}
+    other_car_health, = U8.unpack_from(payload, CAR_STRUCT.size)
+    if other_car_health != ABSENT:
+        state["other_car_health"] = other_car_health
+    state["bullets"], _ = unpack_bullets(payload, CAR_STRUCT.size + U8.size)
+    return {"game_state": state}
+
+
+def _encode_hit(message: Dict[str, Any]) -> bytes:
+    hit = message["hit"]
+    health = hit.get("health")
+    payload = bytes((hit["target"], ABSENT if health is None else _clamp_u8(health)))
+    if "bullet" in hit:
+        payload += HIT_CLAIM_STRUCT.pack(
+            hit["bullet"] & 0xFFFF,
+            quantize_position(hit["x"]),
+            quantize_position(hit["y"]),
+            max(0, min(0xFFFF, round(hit["delay"] * 1000))),
+        )
+    return payload
+
+
+def _decode_hit(payload) -> Dict[str, Any]:
+    target, health = struct.unpack_from("<BB", payload)
+    hit = {"target": target}
+    if health != ABSENT:
+        hit["health"] = health
+    if len(payload) > 2:
+        bullet_id, x, y, delay_ms = HIT_CLAIM_STRUCT.unpack_from(payload, 2)
+        hit.update(bullet=bullet_id, x=dequantize_position(x), y=dequantize_position(y), delay=delay_ms / 1000)
+    return {"hit": hit}
+
+
+def _encode_game_reset(message: Dict[str, Any]) -> bytes:
+    healths = message.get("car_healths", [])
+    return bytes([len(healths)] + [_clamp_u8(h) for h in healths])
+
+
+def _decode_game_reset(payload) -> Dict[str, Any]:
+    if not payload or len(payload) != payload[0] + 1:
+        raise ProtocolError("Malformed game_reset payload")
+    return {"game_reset": True, "car_healths": list(payload[1:])}
+
+
+def _encode_game_over(message: Dict[str, Any]) -> bytes:
+    return bytes((message["winner"],))
+
+
+def _decode_game_over(payload) -> Dict[str, Any]:
+    winner, = struct.unpack("<B", payload)
+    return {"game_over": True, "winner": winner}
+
+
+DELTA_HAS_REMOVED = 1 << len(DELTA_CAR_FIELDS)
+DELTA_HAS_BULLETS = DELTA_HAS_REMOVED << 1
+
+
+def _encode_state_delta(message: Dict[str, Any]) -> bytes:
+    delta = message["state_delta"]
+    car = delta["car"]
+    removed = delta["removed"]
+    bullets = delta["bullets"]
+    mask = (DELTA_HAS_REMOVED if removed else 0) | (DELTA_HAS_BULLETS if bullets else 0)
+    fields = bytearray()
+    for bit, name in enumerate(DELTA_CAR_FIELDS):
+        if name in car:
+            mask |= 1 << bit
+            fields += encode_zigzag(car[name])
+    out = bytearray((delta["player"],))
+    out += U16.pack(delta["seq"] & 0xFFFF)
+    out += encode_varint(delta["base"])
+    out.append(mask)
+    out += fields
+    if removed:
+        out += encode_varint(len(removed))
+        for bullet_id in removed:
+            out += U16.pack(bullet_id)
+    if bullets:
+        out += encode_varint(len(bullets))
+        for bullet in bullets:
+            out += DELTA_BULLET_STRUCT.pack(*bullet)
+    return bytes(out)
+
+
+def _decode_state_delta(payload) -> Dict[str, Any]:
+    player = payload[0]
+    seq, = U16.unpack_from(payload, 1)
+    base, offset = _read_varint(payload, 3)
+    mask = payload[offset]
+    offset += 1
+    car = {}
+    for bit, name in enumerate(DELTA_CAR_FIELDS):
+        if mask & (1 << bit):
+            car[name], offset = decode_zigzag(payload, offset)
+    removed = []
+    if mask & DELTA_HAS_REMOVED:
+        count, offset = _read_varint(payload, offset)
+        removed = [U16.unpack_from(payload, offset + 2 * i)[0] for i in range(count)]
+        offset += 2 * count
+    bullets = []
+    if mask & DELTA_HAS_BULLETS:
+        count, offset = _read_varint(payload, offset)
+        end = offset + count * DELTA_BULLET_STRUCT.size
+        bullets = list(DELTA_BULLET_STRUCT.iter_unpack(payload[offset:end]))
+        offset = end
+    if offset != len(payload):
+        raise ProtocolError("Malformed state_delta payload")
+    return {
+        "state_delta": {"player": player, "seq": seq, "base": base, "car": car, "removed": removed, "bullets": bullets}
+    }
+
+
+def _encode_state_ack(message: Dict[str, Any]) -> bytes:
+    ack = message["state_ack"]
+    return struct.pack("<BHB", ack["player"], ack["seq"] & 0xFFFF, bool(ack.get("keyframe", False)))
+
+
+def _decode_state_ack(payload) -> Dict[str, Any]:
+    player, seq, keyframe = struct.unpack("<BHB", payload)
+    return {"state_ack": {"player": player, "seq": seq, "keyframe": bool(keyframe)}}
+
+
+def _encode_input(message: Dict[str, Any]) -> bytes:
+    player_input = message["input"]
+    return INPUT_STRUCT.pack(
+        player_input["seq"] & 0xFFFF, player_input["throttle"], player_input["steering"], player_input["shots"] & 0xFFFF
+    )
+
+
+def _decode_input(payload) -> Dict[str, Any]:
+    seq, throttle, steering, shots = INPUT_STRUCT.unpack(payload)
+    return {"input": {"seq": seq, "throttle": throttle, "steering": steering, "shots": shots}}
+
+
+def _encode_snapshot(message: Dict[str, Any]) -> bytes:
+    snapshot = message["snapshot"]
+    out = bytearray(U16.pack(snapshot["tick"] & 0xFFFF))
+    cars = snapshot["cars"]
+    out.append(len(cars))
+    present = 0
+    for index, car in enumerate(cars):
+        if car is not None:
+            present |= 1 << index
+    out += present.to_bytes((len(cars) + 7) // 8, "little")
+    for car, ack in zip(cars, snapshot["acks"]):
+        if car is None:
+            continue
+        out += pack_car(car)
+        out += SNAPSHOT_CAR_EXTRA_STRUCT.pack(quantize_position(car.get("speed", 0.0)), ack & 0xFFFF)
+    bullets = snapshot["bullets"]
+    if isinstance(bullets, (bytes, bytearray, memoryview)):
+        # Already packed records, e.g. BulletPool.serialize()
+        out += encode_varint(len(bullets) // SNAPSHOT_BULLET_STRUCT.size)
+        out += bullets
+        return bytes(out)
+    out += encode_varint(len(bullets))
+    if len(bullets) >= BULK_PACK_MIN_BULLETS:
+        out += pack_records(bullets, SNAPSHOT_BULLET_DTYPE)
+        return bytes(out)
+    for bullet in bullets:
+        out += SNAPSHOT_BULLET_STRUCT.pack(
+            bullet["owner"],
+            bullet["id"] & 0xFFFF,
+            quantize_position(bullet["x"]),
+            quantize_position(bullet["y"]),
+            quantize_angle(bullet["angle"]),
+            max(0, min(255, round(bullet["speed"]))),
+        )
+    return bytes(out)
+
+
+def _decode_snapshot(payload) -> Dict[str, Any]:
+    tick, = U16.unpack_from(payload, 0)
+    car_count = payload[2]
+    offset = 3 + (car_count + 7) // 8
+    present = int.from_bytes(payload[3:offset], "little")
+    cars = []
+    acks = []
+    for index in range(car_count):
+        if not present >> index & 1:
+            cars.append(None)
+            acks.append(None)
+            continue
+        car = unpack_car(payload, offset)
+        offset += CAR_STRUCT.size
+        speed, ack = SNAPSHOT_CAR_EXTRA_STRUCT.unpack_from(payload, offset)
+        offset += SNAPSHOT_CAR_EXTRA_STRUCT.size
+        car["speed"] = dequantize_position(speed)
+        cars.append(car)
+        acks.append(ack)
+    count, offset = _read_varint(payload, offset)
+    end = offset + count * SNAPSHOT_BULLET_STRUCT.size
+    if end != len(payload):
+        raise ProtocolError("Malformed snapshot payload")
+    if count >= BULK_UNPACK_MIN_BULLETS:
+        columns = unpack_columns(payload, offset, count, SNAPSHOT_BULLET_DTYPE)
+        bullets = [
+            {"owner": owner, "id": bullet_id, "x": x, "y": y, "angle": angle, "speed": speed}
+            for owner, bullet_id, x, y, angle, speed in zip(
+                columns["owner"], columns["id"], columns["x"], columns["y"], columns["angle"], columns["speed"]
+            )
+        ]
+        return {"snapshot": {"tick": tick, "cars": cars, "acks": acks, "bullets": bullets}}
+    bullets = [
+        {"owner": owner, "id": bullet_id, "x": x / POSITION_SCALE, "y": y / POSITION_SCALE, "angle": angle / ANGLE_SCALE, "speed": speed}
+        for owner, bullet_id, x, y, angle, speed in SNAPSHOT_BULLET_STRUCT.iter_unpack(payload[offset:end])
+    ]
+    return {"snapshot": {"tick": tick, "cars": cars, "acks": acks, "bullets": bullets}}
+
+
+def _encode_ping(message: Dict[str, Any]) -> bytes:
+    return U32.pack(message["ping"] & 0xFFFFFFFF)
+
+
+def _decode_ping(payload) -> Dict[str, Any]:
+    nonce, = U32.unpack(payload)
+    return {"ping": nonce}
+
+
+def _encode_pong(message: Dict[str, Any]) -> bytes:
+    return U32.pack(message["pong"] & 0xFFFFFFFF)
+
+
+def _decode_pong(payload) -> Dict[str, Any]:
+    nonce, = U32.unpack(payload)
+    return {"pong": nonce}
+
+
+def _encode_spectate(message: Dict[str, Any]) -> bytes:
+    room = message["spectate"]
+    return U16.pack(SPECTATE_ANY if room is None else room)
+
+
+def _decode_spectate(payload) -> Dict[str, Any]:
+    room, = U16.unpack(payload)
+    return {"spectate": None if room == SPECTATE_ANY else room}
+
+
+def _encode_player_name(message: Dict[str, Any]) -> bytes:
+    name = message["player_name"].encode("utf-8")
+    if len(name) > MAX_NAME_BYTES:
+        raise ProtocolError(f"player name of {len(name)} bytes, limit {MAX_NAME_BYTES}")
+    return name
+
+
+def _decode_player_name(payload) -> Dict[str, Any]:
+    if len(payload) > MAX_NAME_BYTES:
+        raise ProtocolError(f"player name of {len(payload)} bytes, limit {MAX_NAME_BYTES}")
+    return {"player_name": bytes(payload).decode("utf-8")}
+
+
+# Message type table: (type id, identifying key, encoder, decoder).  Messages are
+# matched on the first key present, in table order, mirroring how
+# Game.process_server_data dispatches on them.
+MESSAGE_TYPES: List[Tuple[int, str, Callable, Callable]] = [
+    (1, "player_id", _encode_player_id, _decode_player_id),
+    (2, "game_start", _encode_game_start, _decode_game_start),
+    (3, "game_state", _encode_game_state, _decode_game_state),
+    (4, "hit", _encode_hit, _decode_hit),
+    (5, "game_reset", _encode_game_reset, _decode_game_reset),
+    (6, "game_over", _encode_game_over, _decode_game_over),
+    (7, "state_delta", _encode_state_delta, _decode_state_delta),
+    (8, "state_ack", _encode_state_ack, _decode_state_ack),
+    (9, "input", _encode_input, _decode_input),
+    (10, "snapshot", _encode_snapshot, _decode_snapshot),
+    (11, "ping", _encode_ping, _decode_ping),
+    (12, "pong", _encode_pong, _decode_pong),
+    (13, "spectate", _encode_spectate, _decode_spectate),
+    (14, "player_name", _encode_player_name, _decode_player_name),
+]
+
+_DECODERS = {type_id: decoder for type_id, _, _, decoder in MESSAGE_TYPES}
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    for type_id, key, encoder, _ in MESSAGE_TYPES:
+        if key in message:
+            payload = encoder(message)
+            return encode_varint(len(payload) + 1) + bytes((type_id,)) + payload
+    raise ProtocolError(f"No message type for keys {list(message)}")
+
+
+def decode_payload(type_id: int, payload) -> Dict[str, Any]:
+    decoder = _DECODERS.get(type_id)
+    if decoder is None:
+        raise ProtocolError(f"Unknown message type {type_id}")
+    try:
+        return decoder(payload)
+    except (struct.error, IndexError, KeyError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Malformed payload for message type {type_id}: {e}") from e
+
+
+class FrameDecoder:
+    # Streaming decoder: feed it whatever recv() returned and it yields every
+    # complete message, keeping partial frames buffered for the next call.
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        # When set, `frames` holds the raw complete frames the last feed() consumed
+        self.keep_frames = False
+        self.frames = b""
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        self.buffer += data
+        messages = []
+        offset = 0
+        view = memoryview(self.buffer)
+        try:
+            while True:
+                length, body_start = decode_varint(self.buffer, offset)
+                if body_start < 0:
+                    break
+                if length == 0 or length > self.max_frame_size:
+                    raise ProtocolError(f"Invalid frame length {length}")
+                end = body_start + length
+                if end > len(self.buffer):
+                    break
+                messages.append(decode_payload(self.buffer[body_start], view[body_start + 1:end]))
+                offset = end
+        finally:
+            view.release()
+        if self.keep_frames:
+            self.frames = bytes(self.buffer[:offset])
+        del self.buffer[:offset]
+        return messages
+
+
+def benchmark(bullet_counts=(0, 5, 20, 100), iterations: int = 2000) -> None:
+    import pickle
+    import random
+    import timeit
+
+    rng = random.Random(1234)
+    print(f"{'bullets':>8} {'pickle B':>9} {'binary B':>9} {'ratio':>6} {'pickle us':>10} {'binary us':>10}")
+    for count in bullet_counts:
+        message = {
+            "game_state": {
+                "car": {"x": rng.uniform(0, 1366), "y": rng.uniform(0, 768), "angle": rng.uniform(-360, 360), "health": 90},
+                "bullets": [
+                    {"x": rng.uniform(0, 1366), "y": rng.uniform(0, 768), "angle": rng.uniform(-360, 360), "speed": 30}
+                    for _ in range(count)
+                ],
+                "other_car_health": 100,
+            }
+        }
+        pickled = pickle.dumps(message)
+        encoded = encode_message(message)
+        decoder = FrameDecoder()
+        pickle_time = timeit.timeit(lambda: pickle.loads(pickle.dumps(message)), number=iterations)
+        binary_time = timeit.timeit(lambda: decoder.feed(encode_message(message)), number=iterations)
+        print(
+            f"{count:>8} {len(pickled):>9} {len(encoded):>9} {len(pickled) / len(encoded):>5.1f}x"
+            f" {pickle_time / iterations * 1e6:>10.1f} {binary_time / iterations * 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
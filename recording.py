@@ -0,0 +1,265 @@
+import bisect
+import json
+import mmap
+import queue
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from protocol import PROTOCOL_VERSION, ProtocolError, decode_varint, encode_varint
+
+# Append-only match recordings.
+#
+# file    := header | metadata (JSON) | record* | index | trailer
+# header  := "RRRC" | u16 format version | u16 protocol version | u32 len(metadata)
+# record  := varint(microseconds since previous record) | u8 kind | varint(len) | bytes
+# index   := "RRIX" | varint count | (varint tick delta, varint offset delta, varint time delta)*
+# trailer := u64 index offset | u32 entry count | "RRND"
+#
+# Record payloads are the wire frames exactly as protocol.encode_message
+# produced them (already quantized and delta-compressed), so a match costs
+# about what it cost on the network.  The kind byte says which way they went:
+# RECORD_RECEIVED | player and RECORD_SENT | player, or RECORD_BROADCAST for
+# one copy of a frame that went to every player in the room.
+#
+# The index holds the offset and time of the first record of every tick
+# (elapsed time at the room's tick rate), delta-encoded.  It is written on
+# close; a file cut short by a crash has no trailer and is indexed by
+# scanning instead, losing at most the unflushed tail.
+#
+# Recorders only append to an in-memory buffer.  Full buffers are handed to a
+# single background thread that does every file write, so a slow disk never
+# stalls the event loop.
+
+RECORDING_MAGIC = b"RRRC"
+RECORDING_VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+INDEX_MAGIC = b"RRIX"
+TRAILER = struct.Struct("<QI4s")
+TRAILER_MAGIC = b"RRND"
+RECORDING_EXTENSION = ".rrr"
+
+RECORD_RECEIVED = 0x00
+RECORD_SENT = 0x40
+RECORD_BROADCAST = 0x80
+RECORD_DIRECTION = 0xC0
+RECORD_PLAYER = 0x3F
+# The kind byte has 6 bits for the player id; larger rooms are not recorded
+MAX_RECORDED_PLAYERS = RECORD_PLAYER + 1
+
+FLUSH_BYTES = 64 * 1024
+# A crash loses at most this much of a match
+FLUSH_INTERVAL = 1.0
+
+
+class _FileWriter:
+    # One daemon thread doing the writes for every open recording
+    def __init__(self):
+        self.jobs: "queue.Queue[Tuple[Any, bytes, bool]]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def submit(self, file, data: bytes, close: bool = False):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+                self.thread.start()
+        self.jobs.put((file, data, close))
+
+    def _run(self):
+        while True:
+            file, data, close = self.jobs.get()
+            try:
+                file.write(data)
+                if close:
+                    file.close()
+            except OSError as e:
+                print(f"Recording write to {file.name} failed: {e}")
+            self.jobs.task_done()
+
+    def drain(self):
+        # Blocks until everything submitted so far is on disk; for tools and shutdown
+        self.jobs.join()
+
+
+_writer = _FileWriter()
+
+
+def flush_recordings():
+    _writer.drain()
+
+
+def _player_bits(player: int) -> int:
+    # A larger id would spill into the direction bits and corrupt the file
+    if not 0 <= player <= RECORD_PLAYER:
+        raise ValueError(f"player {player} cannot be recorded; at most {MAX_RECORDED_PLAYERS} players")
+    return player
+
+
+class MatchRecorder:
+    def __init__(self, path: str, metadata: Dict[str, Any], tick_rate: int = 60):
+        self.path = path
+        self.tick_rate = tick_rate
+        self.file = open(path, "wb")
+        meta = json.dumps(dict(metadata, started=time.time())).encode()
+        self.buffer = bytearray(HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, PROTOCOL_VERSION, len(meta)) + meta)
+        # File offset of buffer[0]
+        self.offset = 0
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.last_time_us = 0
+        self.next_tick = 0
+        # (tick, file offset, time in us) of the first record of each tick
+        self.index: List[Tuple[int, int, int]] = []
+        self.records = 0
+        self.size = 0
+        self.closed = False
+        # The client records from its receive thread and its main loop
+        self.lock = threading.Lock()
+
+    def received(self, player: int, data) -> None:
+        self._append(RECORD_RECEIVED | _player_bits(player), data)
+
+    def sent(self, player: int, data) -> None:
+        self._append(RECORD_SENT | _player_bits(player), data)
+
+    def broadcast(self, data) -> None:
+        self._append(RECORD_BROADCAST, data)
+
+    def _append(self, kind: int, data):
+        with self.lock:
+            if self.closed:
+                return
+            now = time.monotonic()
+            elapsed = now - self.start
+            time_us = int(elapsed * 1e6)
+            tick = int(elapsed * self.tick_rate)
+            if tick >= self.next_tick:
+                self.index.append((tick, self.offset + len(self.buffer), time_us))
+                self.next_tick = tick + 1
+            buffer = self.buffer
+            buffer += encode_varint(time_us - self.last_time_us)
+            buffer.append(kind)
+            buffer += encode_varint(len(data))
+            buffer += data
+            self.last_time_us = time_us
+            self.records += 1
+            if len(buffer) >= FLUSH_BYTES or now - self.last_flush >= FLUSH_INTERVAL:
+                self._flush(now)
+
+    def _flush(self, now: float):
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.offset += len(data)
+            self.buffer = bytearray()
+            _writer.submit(self.file, data)
+        self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            index_offset = self.offset + len(self.buffer)
+            self.buffer += INDEX_MAGIC + encode_varint(len(self.index))
+            previous = (0, 0, 0)
+            for entry in self.index:
+                for value, base in zip(entry, previous):
+                    self.buffer += encode_varint(value - base)
+                previous = entry
+            self.buffer += TRAILER.pack(index_offset, len(self.index), TRAILER_MAGIC)
+            self.size = self.offset + len(self.buffer)
+            _writer.submit(self.file, bytes(self.buffer), close=True)
+            self.buffer = bytearray()
+
+
+class Recording:
+    # Read side: memory-maps a recording and walks its records
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.protocol_version, meta_length = HEADER.unpack_from(self.data)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ProtocolError(f"{path} is not a version {RECORDING_VERSION} recording")
+        self.metadata: Dict[str, Any] = json.loads(self.data[HEADER.size:HEADER.size + meta_length])
+        self.records_start = HEADER.size + meta_length
+        self.complete = False
+        self.records_end = len(self.data)
+        self.index: List[Tuple[int, int, int]] = []
+        if len(self.data) >= self.records_start + TRAILER.size:
+            index_offset, count, trailer_magic = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+            if trailer_magic == TRAILER_MAGIC and self.data[index_offset:index_offset + 4] == INDEX_MAGIC:
+                self.records_end = index_offset
+                self.index = self._read_index(index_offset + 4)
+                self.complete = True
+        if not self.complete:
+            self.index = self._scan_index()
+        self.ticks = [tick for tick, _, _ in self.index]
+
+    def _read_index(self, offset: int) -> List[Tuple[int, int, int]]:
+        count, offset = decode_varint(self.data, offset)
+        index = []
+        tick = position = time_us = 0
+        for _ in range(count):
+            delta, offset = decode_varint(self.data, offset)
+            tick += delta
+            delta, offset = decode_varint(self.data, offset)
+            position += delta
+            delta, offset = decode_varint(self.data, offset)
+            time_us += delta
+            index.append((tick, position, time_us))
+        return index
+
+    def _scan_index(self) -> List[Tuple[int, int, int]]:
+        tick_rate = self.metadata.get("tick_rate", 60)
+        index = []
+        next_tick = 0
+        for time_us, _, _, offset in self.records(with_offsets=True):
+            tick = time_us * tick_rate // 1_000_000
+            if tick >= next_tick:
+                index.append((tick, offset, time_us))
+                next_tick = tick + 1
+        return index
+
+    @property
+    def duration(self) -> float:
+        return self.index[-1][2] / 1e6 if self.index else 0.0
+
+    def seek(self, seconds: float) -> Tuple[int, int]:
+        # (offset, time in us) of the first record at or after `seconds`
+        tick = int(seconds * self.metadata.get("tick_rate", 60))
+        position = bisect.bisect_left(self.ticks, tick)
+        if position >= len(self.index):
+            return self.records_end, self.index[-1][2] if self.index else 0
+        _, offset, time_us = self.index[position]
+        return offset, time_us
+
+    def records(self, offset: Optional[int] = None, time_us: int = 0, with_offsets: bool = False) -> Iterator[tuple]:
+        # Yields (time in us, kind, payload) or, with offsets, (..., record offset).
+        # An offset from seek() must come with the time seek() returned.
+        data = self.data
+        view = memoryview(data)
+        position = self.records_start if offset is None else offset
+        end = self.records_end
+        while position < end:
+            start = position
+            delta, position = decode_varint(data, position)
+            if position < 0 or position >= end:
+                break
+            kind = data[position]
+            length, position = decode_varint(data, position + 1)
+            if position < 0 or position + length > end:
+                # Torn tail of a recording that was never closed
+                break
+            time_us += delta
+            payload = view[position:position + length]
+            position += length
+            if with_offsets:
+                yield time_us, kind, payload, start
+            else:
+                yield time_us, kind, payload
+
+    def close(self):
+        self.data.close()
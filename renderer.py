@@ -0,0 +1,175 @@
+import numpy as np
+import pygame
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Hashable
+
+from profiler import NETWORK_COLUMNS
+
+# Dirty-rectangle rendering.
+#
+# The background is only blitted in full when the scene changes (waiting ->
+# playing -> game over).  Within a scene, every frame restores the background
+# under whatever was drawn last frame, draws the moving objects, and pushes
+# just those regions to the display.  A static screen therefore costs next to
+# nothing once it has been drawn.
+
+MAX_TEXT_SURFACES = 64
+# Past this many rects a single full update is cheaper than the bookkeeping
+MAX_DIRTY_RECTS = 96
+
+Colour = Tuple[int, int, int]
+
+
+class TextCache:
+    def __init__(self, max_surfaces: int = MAX_TEXT_SURFACES):
+        self.max_surfaces = max_surfaces
+        self.fonts: Dict[Tuple[Optional[str], int], pygame.font.Font] = {}
+        self.surfaces: "OrderedDict[Tuple[str, int, Colour], pygame.Surface]" = OrderedDict()
+
+    def font(self, size: int, name: Optional[str] = None) -> pygame.font.Font:
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.Font(name, size)
+        return font
+
+    def render(self, text: str, size: int, colour: Colour) -> pygame.Surface:
+        key = (text, size, colour)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = self.font(size).render(text, True, colour)
+            while len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class DirtyRenderer:
+    def __init__(self, screen: pygame.Surface, background: pygame.Surface):
+        self.screen = screen
+        self.background = background
+        self.bounds = screen.get_rect()
+        self.scene: Hashable = None
+        self.scene_changed = True
+        self.full_update = True
+        self.dirty: List[pygame.Rect] = []
+        self.previous: List[pygame.Rect] = []
+
+    def invalidate(self):
+        self.full_update = True
+
+    def begin_frame(self, scene: Hashable):
+        self.scene_changed = scene != self.scene or self.full_update
+        self.scene = scene
+        if self.scene_changed:
+            self.screen.blit(self.background, (0, 0)) # 1 surface
+            self.full_update = True
+            self.previous = []
+        else:
+            for rect in self.previous:
+                self.screen.blit(self.background, rect, rect)
+        self.dirty = []
+
+    def mark(self, rect: Optional[pygame.Rect]):
+        if rect:
+            rect = rect.clip(self.bounds)
+            if rect:
+                self.dirty.append(rect)
+
+    def present(self):
+        if self.full_update or len(self.dirty) + len(self.previous) > MAX_DIRTY_RECTS:
+            pygame.display.flip()
+            self.full_update = False
+        else:
+            # Last frame's rects have to go out too, now showing background
+            pygame.display.update(self.previous + self.dirty)
+        self.previous = self.dirty
+
+
+OVERLAY_REFRESH = 0.25
+OVERLAY_GRAPH_FRAMES = 240
+OVERLAY_GRAPH_HEIGHT = 64
+# Graph scale: two 60 Hz frames fill it
+OVERLAY_GRAPH_MS = 1000 / 30
+OVERLAY_COLOURS = {
+    "events": (255, 200, 60),
+    "receive": (60, 140, 255),
+    "update": (80, 200, 255),
+    "collisions": (255, 110, 60),
+    "send": (180, 120, 255),
+    "remote": (90, 230, 130),
+    "audio": (255, 160, 200),
+    "draw": (255, 22, 93),
+    "flip": (240, 240, 240),
+}
+
+
+class PerfOverlay:
+    # Frame-time graph and per-phase p50/p99 from a profiler.FrameProfiler,
+    # drawn in the top-left corner.  The surface is rebuilt a few times a
+    # second; in between it is just blitted.
+    def __init__(self, profiler, refresh: float = OVERLAY_REFRESH):
+        self.profiler = profiler
+        self.refresh = refresh
+        self.visible = False
+        self.font = pygame.font.Font(None, 18)
+        self.surface: Optional[pygame.Surface] = None
+        self.built_at = 0.0
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.surface = None
+
+    def draw(self, screen: pygame.Surface, now: float) -> Optional[pygame.Rect]:
+        if not self.visible:
+            return None
+        if self.surface is None or now - self.built_at >= self.refresh:
+            self.surface = self._build()
+            self.built_at = now
+        return screen.blit(self.surface, (8, 8))
+
+    def _build(self) -> pygame.Surface:
+        profiler = self.profiler
+        columns = profiler.columns
+        p50, p99 = profiler.percentiles()
+        frame_ms = profiler.column("frame_ms")
+        seconds = frame_ms.sum() / 1000 or 1.0
+        frames = profiler.frames()
+        lines = [f"frame  p50 {p50[0]:5.2f}  p99 {p99[0]:5.2f} ms  ({len(frame_ms) / seconds:.0f} fps)"]
+        for phase in profiler.phases:
+            i = columns.index(f"{phase}_ms")
+            lines.append(f"{phase:<10} p50 {p50[i]:5.2f}  p99 {p99[i]:5.2f}")
+        net = [frames[:, columns.index(name)].sum() if len(frames) else 0 for name in NETWORK_COLUMNS]
+        lines.append(f"net  {net[0] / seconds / 1024:.1f} KB/s  {net[1] / seconds:.0f} msg/s")
+        lines.append(f"     decode {net[2] / seconds / 10:.2f}% of a core, {net[3] / seconds:.1f} states/s coalesced")
+
+        line_height = self.font.get_linesize()
+        width = OVERLAY_GRAPH_FRAMES + 16
+        surface = pygame.Surface((width, line_height * len(lines) + OVERLAY_GRAPH_HEIGHT + 16))
+        surface.set_alpha(210)
+        surface.fill((20, 20, 28))
+        for row, text in enumerate(lines):
+            surface.blit(self.font.render(text, True, (230, 230, 230)), (8, 4 + row * line_height))
+
+        # One column per frame, the busy phases stacked; idle is left out
+        top = 8 + line_height * len(lines)
+        bottom = top + OVERLAY_GRAPH_HEIGHT
+        scale = OVERLAY_GRAPH_HEIGHT / OVERLAY_GRAPH_MS
+        recent = frames[-OVERLAY_GRAPH_FRAMES:]
+        busy = [phase for phase in OVERLAY_COLOURS if phase in profiler.phases]
+        tops = np.cumsum(recent[:, [columns.index(f"{phase}_ms") for phase in busy]], axis=1)
+        tops = bottom - np.minimum(tops, OVERLAY_GRAPH_MS) * scale
+        bottoms = np.hstack((np.full((len(recent), 1), float(bottom)), tops[:, :-1]))
+        for j, phase in enumerate(busy):
+            colour = OVERLAY_COLOURS[phase]
+            for x, (start, end) in enumerate(zip(bottoms[:, j].tolist(), tops[:, j].tolist())):
+                if start - end >= 1:
+                    pygame.draw.line(surface, colour, (8 + x, start), (8 + x, end))
+        # Whole frames, idle included, against the 60 Hz budget
+        budget = bottom - (1000 / 60) * scale
+        pygame.draw.line(surface, (120, 120, 120), (8, budget), (width - 8, budget))
+        frame_tops = bottom - np.minimum(recent[:, 0], OVERLAY_GRAPH_MS) * scale
+        for x, y in enumerate(frame_tops.tolist()):
+            surface.set_at((8 + x, int(y)), (255, 255, 255))
+        return surface
@@ -0,0 +1,258 @@
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from delta import SnapshotDecoder
+from protocol import PROTOCOL_VERSION, FrameDecoder
+from recording import RECORD_BROADCAST, RECORD_DIRECTION, RECORD_PLAYER, RECORD_RECEIVED, RECORD_SENT, Recording
+
+# Plays back recordings made by game_server.py --record or game.py --record.
+#
+#   python replay.py match.rrr               headless, as fast as it decodes
+#   python replay.py match.rrr --speed 10    headless, paced at 10x real time
+#   python replay.py match.rrr --render      one player's view through Game.draw
+#
+# Relay rooms send deltas against earlier states, so starting part-way in
+# (--start) still decodes everything before it, just without pacing or
+# drawing.  Authoritative snapshots are full states: headless playback jumps
+# straight to the indexed tick.
+
+DIRECTIONS = {RECORD_RECEIVED: "received", RECORD_SENT: "sent", RECORD_BROADCAST: "broadcast"}
+
+
+def decode_frames(payload) -> List[Dict[str, Any]]:
+    return FrameDecoder().feed(payload)
+
+
+class MatchReplay:
+    # Headless playback: follows what every player was told without a display
+    def __init__(self, recording: Recording):
+        self.recording = recording
+        self.capacity = recording.metadata.get("capacity", 2)
+        self.authoritative = recording.metadata.get("authoritative", False)
+        # (direction, message type) -> [count, bytes]
+        self.traffic: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+        # Each player's outgoing deltas, and each (recipient, source) relayed stream
+        self.sender_decoders: Dict[int, SnapshotDecoder] = defaultdict(SnapshotDecoder)
+        self.relay_decoders: Dict[Tuple[int, int], SnapshotDecoder] = defaultdict(SnapshotDecoder)
+        self.baseline_misses = 0
+        self.states: Dict[int, Dict[str, Any]] = {}
+        self.healths = [100] * self.capacity
+        self.tick: Optional[int] = None
+        self.winners: List[int] = []
+        self.records = 0
+        self.bytes = 0
+        self.first_us: Optional[int] = None
+        self.last_us = 0
+
+    def run(self, start: float = 0.0, end: Optional[float] = None, speed: Optional[float] = None) -> float:
+        # Returns wall-clock seconds spent; speed=None plays as fast as possible
+        offset, time_us = None, 0
+        if start and self.authoritative:
+            offset, time_us = self.recording.seek(start)
+        start_us = int(start * 1e6)
+        end_us = None if end is None else int(end * 1e6)
+        began = time.perf_counter()
+        for record_us, kind, payload in self.recording.records(offset, time_us):
+            if end_us is not None and record_us > end_us:
+                break
+            counted = record_us >= start_us
+            if counted and speed:
+                delay = (record_us - start_us) / 1e6 / speed - (time.perf_counter() - began)
+                if delay > 0:
+                    time.sleep(delay)
+            self.apply(record_us, kind, payload, counted)
+        return time.perf_counter() - began
+
+    def apply(self, record_us: int, kind: int, payload, counted: bool = True):
+        direction = kind & RECORD_DIRECTION
+        player = kind & RECORD_PLAYER
+        if counted:
+            self.records += 1
+            self.bytes += len(payload)
+            if self.first_us is None:
+                self.first_us = record_us
+            self.last_us = record_us
+        messages = decode_frames(payload)
+        for message in messages:
+            name = next(iter(message))
+            if counted:
+                entry = self.traffic[(DIRECTIONS.get(direction, "?"), name)]
+                entry[0] += 1
+                entry[1] += len(payload) // len(messages)
+            if direction == RECORD_RECEIVED:
+                if name == "state_delta":
+                    message["state_delta"]["player"] = player
+                    self._decode(self.sender_decoders[player], message["state_delta"], player)
+                elif name == "game_state":
+                    self.states[player] = message["game_state"]
+            elif name == "state_delta":
+                delta = message["state_delta"]
+                self._decode(self.relay_decoders[(player, delta["player"])], delta, None)
+            elif name == "hit":
+                self.healths[message["hit"]["target"]] = message["hit"]["health"]
+            elif name == "game_reset":
+                self.healths = list(message["car_healths"])
+                self.states.clear()
+                for decoder in list(self.sender_decoders.values()) + list(self.relay_decoders.values()):
+                    decoder.reset()
+            elif name == "snapshot":
+                snapshot = message["snapshot"]
+                self.tick = snapshot["tick"]
+                for player_id, car in enumerate(snapshot["cars"]):
+                    if car is None:
+                        continue
+                    self.states[player_id] = {"car": car, "bullets": [b for b in snapshot["bullets"] if b["owner"] == player_id]}
+                    self.healths[player_id] = car["health"]
+            elif name == "game_over" and direction == RECORD_BROADCAST:
+                self.winners.append(message["winner"])
+
+    def _decode(self, decoder: SnapshotDecoder, delta: Dict[str, Any], player: Optional[int]):
+        state = decoder.decode(delta)
+        ack = decoder.take_ack()
+        if ack and ack["keyframe"]:
+            # The live peer would have asked for a keyframe here
+            self.baseline_misses += 1
+        if state is not None and player is not None:
+            self.states[player] = state
+
+    def summary(self, elapsed: float) -> str:
+        duration = ((self.last_us - self.first_us) / 1e6) if self.first_us is not None else 0.0
+        lines = [
+            f"Replayed {self.records} records ({self.bytes} bytes, {duration:.1f} s of play) in {elapsed:.3f} s"
+            + (f" ({duration / elapsed:.0f}x real time)" if elapsed > 0 else ""),
+        ]
+        for (direction, name), (count, size) in sorted(self.traffic.items()):
+            lines.append(f"  {direction:<10} {name:<12} {count:>8} msgs {size:>10} bytes")
+        lines.append(f"Healths {self.healths}, winners {self.winners or 'none'}, baseline misses {self.baseline_misses}")
+        for player_id, state in sorted(self.states.items()):
+            car = state["car"]
+            lines.append(f"  player {player_id}: car at ({car['x']:.1f}, {car['y']:.1f}) angle {car['angle']:.1f}, {len(state['bullets'])} bullets")
+        return "\n".join(lines)
+
+
+class NullClient:
+    # Stands in for the server connection; acks and pongs go nowhere
+    bytes_in = messages_in = 0
+    decode_seconds = 0.0
+
+    def send(self, message: Dict[str, Any]):
+        pass
+
+    def queue(self, message: Dict[str, Any]):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def render(recording: Recording, player: Optional[int] = None, start: float = 0.0, speed: float = 1.0):
+    # Drives a real Game from the recording: the server's messages to `player`
+    # go through process_inbound, and the player's own reported state
+    # moves their car, so the screen is what they saw (minus local prediction)
+    import pygame
+    from bullet_pool import bullet_records
+    from game import FRAME_RATE, Game
+
+    if player is None:
+        player = next((kind & RECORD_PLAYER for _, kind, _ in recording.records() if kind & RECORD_DIRECTION == RECORD_SENT), 0)
+    game = Game.__new__(Game)
+    game.running = True
+    game.recorder = None
+    game.profile_path = None
+    game.initialize_pygame()
+    game.initialize_game_state()
+    game.client = NullClient()
+    pygame.display.set_caption(f"Replay of {os.path.basename(recording.path)} as player {player}")
+    own_decoder = SnapshotDecoder()
+
+    def feed(kind: int, payload, live: bool):
+        direction = kind & RECORD_DIRECTION
+        if direction != RECORD_BROADCAST and kind & RECORD_PLAYER != player:
+            return
+        for message in decode_frames(payload):
+            if direction != RECORD_RECEIVED:
+                if "snapshot" in message and not live:
+                    # Full states: only the ones near the start point matter
+                    continue
+                if "game_reset" in message:
+                    own_decoder.reset()
+                if "ping" not in message:
+                    game.inbound.put(message)
+                    game.process_inbound()
+            elif game.car1 is not None and not game.authoritative:
+                if "state_delta" in message:
+                    message["state_delta"]["player"] = player
+                    state = own_decoder.decode(message["state_delta"])
+                    own_decoder.take_ack()
+                elif "game_state" in message:
+                    state = message["game_state"]
+                else:
+                    continue
+                if state is not None:
+                    game.car1.deserialize(state["car"])
+                    game.bullets1.load(bullet_records(state["bullets"]), 0)
+
+    start_us = int(start * 1e6)
+    # Snapshots within a second of the start point are applied while skipping ahead
+    live_us = start_us - 1_000_000
+    records = recording.records()
+    pending = next(records, None)
+    while pending is not None and pending[0] < start_us:
+        feed(pending[1], pending[2], pending[0] >= live_us)
+        pending = next(records, None)
+
+    playhead = start_us
+    while game.running and pending is not None:
+        game.profiler.begin_frame()
+        dt = game.clock.tick(FRAME_RATE) / 1000
+        game.profiler.lap("idle")
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                game.running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                game.perf_overlay.toggle()
+        game.profiler.lap("events")
+        playhead += int(dt * speed * 1e6)
+        while pending is not None and pending[0] <= playhead:
+            feed(pending[1], pending[2], True)
+            pending = next(records, None)
+        if game.game_started and game.car1 and game.car2:
+            game.update_remote_state()
+        game.audio.update()
+        game.draw()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a recorded match")
+    parser.add_argument("path")
+    parser.add_argument("--render", action="store_true", help="draw one player's view at --speed (default real time)")
+    parser.add_argument("--player", type=int, help="whose view to render (default: the first recorded player)")
+    parser.add_argument("--speed", type=float, help="playback speed; headless default is as fast as possible")
+    parser.add_argument("--start", type=float, default=0.0, help="seconds into the match")
+    parser.add_argument("--end", type=float, help="stop at this many seconds (headless)")
+    args = parser.parse_args()
+
+    recording = Recording(args.path)
+    meta = recording.metadata
+    room = "an authoritative room" if meta.get("authoritative") else "a relay room"
+    print(
+        f"{args.path}: {meta.get('source', 'server')} recording of {room}, {meta.get('capacity', 2)} players, "
+        f"{recording.duration:.1f} s, {len(recording.index)} ticks indexed"
+        + ("" if recording.complete else " (no index footer: recording was cut short, rebuilt by scanning)")
+    )
+    if recording.protocol_version != PROTOCOL_VERSION:
+        print(f"Warning: recorded with protocol {recording.protocol_version}, this build speaks {PROTOCOL_VERSION}")
+    if args.render:
+        render(recording, args.player, args.start, args.speed or 1.0)
+    else:
+        replay = MatchReplay(recording)
+        elapsed = replay.run(args.start, args.end, args.speed)
+        print(replay.summary(elapsed))
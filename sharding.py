@@ -0,0 +1,348 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from game_server import GameServer
+from lag_compensation import REWIND_WINDOW
+from metrics import METRICS_PORT, Registry, serve_metrics
+from protocol import MAX_PLAYERS_PER_ROOM
+
+# Multi-process room sharding.
+#
+# One Python process runs about one core of rooms, so ShardedServer splits
+# them over worker processes.  The acceptor process owns the listening socket
+# and decides which room every new connection joins; the accepted socket is
+# then passed (socket.send_fds) to the worker that owns the room, which runs
+# an ordinary GameServer for its rooms.  The acceptor never touches game
+# traffic.
+#
+# Each worker has one AF_UNIX SOCK_SEQPACKET control channel, with one JSON
+# object per packet:
+#   acceptor -> worker  {"op": "client", "room": id} + the client's fd
+#   worker -> acceptor  {"op": "left", "room": id}           a client went away
+#                       {"op": "load", "clients": n, "rooms": n, "busy": s}
+#                       every LOAD_INTERVAL; busy is handler seconds per second
+#
+# New rooms go to the least busy worker (ties: fewest players).  Players fill
+# the most populated open room first, whichever worker has it, like
+# Matchmaker.  A worker that dies, or goes WORKER_TIMEOUT without a load
+# report, is killed and replaced; only its own rooms are lost, and their
+# clients see a dropped connection and can reconnect.
+#
+# TCP only: UDP sessions share one socket and cannot be handed off this way.
+#
+#   python game_server.py --workers 4
+
+LOAD_INTERVAL = 1.0
+WORKER_TIMEOUT = 5.0
+RESPAWN_DELAY = 1.0
+CONTROL_PACKET_SIZE = 4096
+
+
+class ShardWorker(GameServer):
+    # A GameServer fed with sockets by the acceptor instead of listening itself
+    def __init__(self, index: int, control: socket.socket, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+        self.control = control
+        self.outbox: "asyncio.Queue[bytes]" = asyncio.Queue()
+        self.stopped: Optional[asyncio.Future] = None
+
+    async def serve_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        await self._start_background()
+        self.control.setblocking(False)
+        loop.add_reader(self.control.fileno(), self._read_control)
+        loop.create_task(self._send_reports())
+        loop.create_task(self._report_load())
+        print(f"Worker {self.index} (pid {os.getpid()}) ready")
+        await self.stopped
+
+    def _read_control(self):
+        while True:
+            try:
+                data, fds, _, _ = socket.recv_fds(self.control, CONTROL_PACKET_SIZE, 1)
+            except BlockingIOError:
+                return
+            except OSError:
+                data, fds = b"", []
+            if not data:
+                # The acceptor is gone, so nobody can reach our rooms' players any more
+                print(f"Worker {self.index}: control channel closed, stopping")
+                if not self.stopped.done():
+                    self.stopped.set_result(None)
+                return
+            message = json.loads(data)
+            if message["op"] == "client" and fds:
+                sock = socket.socket(fileno=fds[0])
+                asyncio.get_running_loop().create_task(self._adopt(sock, message["room"]))
+            else:
+                for fd in fds:
+                    os.close(fd)
+
+    async def _adopt(self, sock: socket.socket, room_id: int):
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except OSError as e:
+            print(f"Worker {self.index}: could not adopt client for room {room_id}: {e}")
+            sock.close()
+            self._report({"op": "left", "room": room_id})
+            return
+        await self.handle_client(reader, writer, room_id)
+
+    def _handle_client_disconnect(self, client):
+        room = client.room
+        super()._handle_client_disconnect(client)
+        if room is not None:
+            self._report({"op": "left", "room": room.room_id})
+
+    def _report(self, message: Dict[str, Any]):
+        self.outbox.put_nowait(json.dumps(message).encode())
+
+    async def _send_reports(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await self.outbox.get()
+            try:
+                await loop.sock_sendall(self.control, data)
+            except OSError:
+                return
+
+    async def _report_load(self):
+        previous = 0.0
+        while True:
+            busy = self.metrics.message_seconds.sum + self.metrics.tick_seconds.sum
+            self._report({
+                "op": "load",
+                "clients": len(self.clients),
+                "rooms": len(self.matchmaker.rooms),
+                "busy": (busy - previous) / LOAD_INTERVAL,
+            })
+            previous = busy
+            await asyncio.sleep(LOAD_INTERVAL)
+
+
+def _run_worker(index: int, control: socket.socket, options: Dict[str, Any]):
+    try:
+        ShardWorker(index, control, **options).start()
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerHandle:
+    # The acceptor's view of one worker process
+    def __init__(self, index: int, process: multiprocessing.Process, control: socket.socket):
+        self.index = index
+        self.process = process
+        self.control = control
+        # room_id -> players handed off and not yet reported gone
+        self.rooms: Dict[int, int] = {}
+        self.clients = 0
+        self.busy = 0.0
+        self.last_report = time.monotonic()
+        self.alive = True
+
+    @property
+    def players(self) -> int:
+        return sum(self.rooms.values())
+
+
+class ShardedServer:
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 12345,
+        workers: Optional[int] = None,
+        players_per_room: int = 2,
+        authoritative: bool = False,
+        tick_rate: int = 60,
+        snapshot_rate: int = 20,
+        metrics_port: Optional[int] = METRICS_PORT,
+        record_dir: Optional[str] = None,
+        interest_radius: Optional[float] = None,
+        rewind_window: float = REWIND_WINDOW,
+        stats_path: Optional[str] = None,
+    ):
+        # Checked here too, before any worker is started
+        if not 1 <= players_per_room <= MAX_PLAYERS_PER_ROOM:
+            raise ValueError(f"a room holds 1 to {MAX_PLAYERS_PER_ROOM} players, not {players_per_room}")
+        self.host = host
+        self.port = port
+        self.worker_count = workers or os.cpu_count() or 1
+        self.players_per_room = players_per_room
+        # Passed through to every worker's GameServer
+        self.options = {
+            "players_per_room": players_per_room,
+            "authoritative": authoritative,
+            "tick_rate": tick_rate,
+            "snapshot_rate": snapshot_rate,
+            "record_dir": record_dir,
+            "interest_radius": interest_radius,
+            "rewind_window": rewind_window,
+            # Every worker adds to the same file; see stats.py
+            "stats_path": stats_path,
+        }
+        # The acceptor serves its own metrics; worker i serves on metrics_port + 1 + i
+        self.metrics_port = metrics_port
+        self.workers: List[Optional[WorkerHandle]] = [None] * self.worker_count
+        self.next_room_id = 0
+        self.listener: Optional[socket.socket] = None
+        # Workers are started with "spawn": forking a process that is running
+        # an event loop would hand the child a copy of that loop's state
+        self.context = multiprocessing.get_context("spawn")
+        self.registry = Registry()
+        self.handoffs = self.registry.counter("shard_handoffs_total", "Connections passed to a worker")
+        self.handoff_failures = self.registry.counter("shard_handoff_failures_total", "Connections dropped because no worker took them")
+        self.restarts = self.registry.counter("shard_worker_restarts_total", "Workers replaced after dying or hanging")
+        self._register_collectors()
+
+    def _register_collectors(self):
+        def per_worker(attribute: str):
+            return lambda: [({"worker": w.index}, getattr(w, attribute)) for w in self.workers if w is not None and w.alive]
+
+        self.registry.collect("shard_workers_alive", "gauge", "Worker processes running",
+                              lambda: [({}, sum(1 for w in self.workers if w is not None and w.alive))])
+        self.registry.collect("shard_worker_players", "gauge", "Players placed on each worker", per_worker("players"))
+        self.registry.collect("shard_worker_rooms", "gauge", "Rooms placed on each worker",
+                              lambda: [({"worker": w.index}, len(w.rooms)) for w in self.workers if w is not None and w.alive])
+        self.registry.collect("shard_worker_busy", "gauge", "Handler seconds per second, as last reported", per_worker("busy"))
+
+    def start(self) -> None:
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            for worker in self.workers:
+                if worker is not None and worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join(timeout=5)
+
+    async def serve_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        for index in range(self.worker_count):
+            self._spawn_worker(index)
+        if self.metrics_port is not None:
+            try:
+                await serve_metrics(self.registry, port=self.metrics_port)
+            except OSError as e:
+                print(f"Metrics endpoint disabled: {e}")
+        self.listener = socket.create_server((self.host, self.port), backlog=1024)
+        self.listener.setblocking(False)
+        print(f"Sharded server on {self.listener.getsockname()} with {self.worker_count} workers")
+        loop.create_task(self._watch_workers())
+        while True:
+            conn, addr = await loop.sock_accept(self.listener)
+            self._hand_off(conn, addr)
+
+    def _spawn_worker(self, index: int):
+        acceptor_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        options = dict(self.options, host=self.host, port=self.port)
+        options["metrics_port"] = None if self.metrics_port is None else self.metrics_port + 1 + index
+        process = self.context.Process(target=_run_worker, args=(index, worker_end, options), name=f"shard-worker-{index}", daemon=True)
+        process.start()
+        worker_end.close()
+        acceptor_end.setblocking(False)
+        worker = self.workers[index] = WorkerHandle(index, process, acceptor_end)
+        asyncio.get_running_loop().add_reader(acceptor_end.fileno(), self._read_worker, worker)
+
+    def _place(self, exclude: List[WorkerHandle]) -> Optional[Tuple[WorkerHandle, int]]:
+        candidates = [w for w in self.workers if w is not None and w.alive and w not in exclude]
+        if not candidates:
+            return None
+        # Fill the most populated open room first so waiting players get a match quickly
+        best: Optional[Tuple[WorkerHandle, int, int]] = None
+        for worker in candidates:
+            for room_id, players in worker.rooms.items():
+                if players < self.players_per_room and (best is None or players > best[2]):
+                    best = (worker, room_id, players)
+        if best is not None:
+            return best[0], best[1]
+        worker = min(candidates, key=lambda w: (w.busy, w.players))
+        room_id = self.next_room_id
+        self.next_room_id += 1
+        worker.rooms[room_id] = 0
+        return worker, room_id
+
+    def _hand_off(self, conn: socket.socket, addr):
+        tried: List[WorkerHandle] = []
+        try:
+            while True:
+                placement = self._place(tried)
+                if placement is None:
+                    self.handoff_failures.inc()
+                    print(f"No worker available for {addr}; dropping the connection")
+                    return
+                worker, room_id = placement
+                message = json.dumps({"op": "client", "room": room_id}).encode()
+                try:
+                    socket.send_fds(worker.control, [message], [conn.fileno()])
+                except OSError as e:
+                    # Full control queue (a stuck worker) or a dead one: try the others
+                    print(f"Worker {worker.index} did not take {addr}: {e}")
+                    if not worker.rooms.get(room_id):
+                        worker.rooms.pop(room_id, None)
+                    tried.append(worker)
+                    continue
+                worker.rooms[room_id] += 1
+                self.handoffs.inc()
+                return
+        finally:
+            # The worker holds its own descriptor for the socket now
+            conn.close()
+
+    def _read_worker(self, worker: WorkerHandle):
+        while True:
+            try:
+                data = worker.control.recv(CONTROL_PACKET_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""
+            if not data:
+                self._worker_died(worker, "control channel closed")
+                return
+            message = json.loads(data)
+            op = message["op"]
+            if op == "load":
+                worker.clients = message["clients"]
+                worker.busy = message["busy"]
+                worker.last_report = time.monotonic()
+            elif op == "left":
+                room_id = message["room"]
+                if room_id in worker.rooms:
+                    worker.rooms[room_id] -= 1
+                    if worker.rooms[room_id] <= 0:
+                        del worker.rooms[room_id]
+
+    def _worker_died(self, worker: WorkerHandle, reason: str):
+        if not worker.alive:
+            return
+        worker.alive = False
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(worker.control.fileno())
+        worker.control.close()
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=1)
+        print(
+            f"Worker {worker.index} lost ({reason}, exit code {worker.process.exitcode}); "
+            f"{len(worker.rooms)} rooms and {worker.players} players with it. Restarting"
+        )
+        self.restarts.inc()
+        loop.call_later(RESPAWN_DELAY, self._spawn_worker, worker.index)
+
+    async def _watch_workers(self):
+        while True:
+            await asyncio.sleep(LOAD_INTERVAL)
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker is None or not worker.alive:
+                    continue
+                if not worker.process.is_alive():
+                    self._worker_died(worker, "process exited")
+                elif now - worker.last_report > WORKER_TIMEOUT:
+                    self._worker_died(worker, f"no load report for {now - worker.last_report:.0f} s")
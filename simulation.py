@@ -0,0 +1,358 @@
+import math
+from collections import deque
+from typing import List, Dict, Any
+
+import numpy as np
+
+from bullet_pool import BulletPool
+from physics import CarPhysics
+from spatial_hash import SpatialHash
+
+# Headless game core.  Nothing in here may import pygame: the server runs it
+# without a display or audio device, and car.Car / Bullet.Bullet extend these
+# classes with drawing and sound on the client.
+
+SCREEN_WIDTH = 1366
+SCREEN_HEIGHT = 768
+CAR_LENGTH = 150
+HIT_DAMAGE = 10
+MAX_HEALTH = 100
+# Inputs buffered per player beyond this are dropped, bounding the added latency
+MAX_QUEUED_INPUTS = 8
+
+
+class Vector2:
+    # The subset of pygame.math.Vector2 the game physics uses
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: float = 0.0, y: float = 0.0):
+        self.x = x
+        self.y = y
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __repr__(self):
+        return f"Vector2({self.x}, {self.y})"
+
+    def __add__(self, other):
+        ox, oy = other
+        return Vector2(self.x + ox, self.y + oy)
+
+    def __iadd__(self, other):
+        ox, oy = other
+        self.x += ox
+        self.y += oy
+        return self
+
+    def __sub__(self, other):
+        ox, oy = other
+        return Vector2(self.x - ox, self.y - oy)
+
+    def __mul__(self, scalar: float):
+        return Vector2(self.x * scalar, self.y * scalar)
+
+    __rmul__ = __mul__
+
+    def rotate(self, degrees: float) -> "Vector2":
+        radians = math.radians(degrees)
+        cos, sin = math.cos(radians), math.sin(radians)
+        return Vector2(self.x * cos - self.y * sin, self.x * sin + self.y * cos)
+
+    def copy(self) -> "Vector2":
+        return Vector2(self.x, self.y)
+
+
+class Projectile:
+    def __init__(self, position, angle, bullet_id=0, owner=None):
+        self.id = bullet_id
+        self.owner = owner
+        self.position = position
+        self.angle = angle
+        self.speed = 30
+
+    def update(self):
+        self.position.x += math.cos(math.radians(self.angle)) * self.speed
+        self.position.y -= math.sin(math.radians(self.angle)) * self.speed
+
+    def is_out_of_bounds(self, screen_width, screen_height):
+        return (self.position.x < 0 or self.position.x > screen_width or
+                self.position.y < 0 or self.position.y > screen_height)
+
+    def collides_with(self, car):
+        return (
+            math.hypot(
+                self.position.x - car.position.x, self.position.y - car.position.y
+            )
+            < car.length / 2
+        )
+
+    def serialize(self):
+        # Convert bullet data to a format that can be sent over the network
+        return {
+            'id': self.id,
+            'x': self.position.x,
+            'y': self.position.y,
+            'angle': self.angle,
+            'speed': self.speed
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        # Create a new bullet instance from received network data
+        bullet = cls(Vector2(data["x"], data["y"]), data["angle"], data.get("id", 0), data.get("owner"))
+        bullet.speed = data["speed"]
+        return bullet
+
+
+class CarBody:
+    bullet_class = Projectile
+
+    def __init__(self, x, y, angle=0, length=CAR_LENGTH, max_steering=1, max_acceleration=450.0):
+        self.position = Vector2(x, y)
+        self.velocity = Vector2(0.0, 0.0)
+        self.angle = angle
+        self.length = length
+        # Body radius for car-vs-car contact, about half the drawn sprite;
+        # bullets keep using length / 2
+        self.radius = length / 4
+        self.max_acceleration = max_acceleration
+        self.max_steering = max_steering
+        self.brake_deceleration = 200
+        self.free_deceleration = 100
+
+        self.acceleration = 0.0
+        self.steering = 0.0
+
+        self.deaths = 0
+        self.shots_fired = 0
+        self.max_health = MAX_HEALTH
+        self.health = self.max_health
+
+    def update(self, dt):
+        self.velocity += (self.acceleration * dt, 0)
+        self.velocity.x = max(-self.max_acceleration, min(self.velocity.x, self.max_acceleration))
+
+        if self.steering:
+            turning_radius = self.length / math.tan(self.steering)
+            angular_velocity = self.velocity.x / turning_radius
+        else:
+            angular_velocity = 0
+
+        self.position += self.velocity.rotate(-self.angle) * dt
+        # Kept in [0, 360) like the wire format, so replayed predictions match the server
+        self.angle = (self.angle + math.degrees(angular_velocity) * dt) % 360
+
+    def wrap(self, screen_width, screen_height):
+        # Cars that leave the screen reappear on the opposite edge
+        if self.position.x > screen_width:
+            self.position.x = 0
+        elif self.position.x < 0:
+            self.position.x = screen_width
+        if self.position.y > screen_height:
+            self.position.y = 0
+        elif self.position.y < 0:
+            self.position.y = screen_height
+
+    def shoot(self):
+        # Calculate the offset of the bullet's initial position
+        offset = Vector2(self.length / 2, 0).rotate(-self.angle)
+        # Add the offset to the car's position to get the bullet's initial position
+        bullet = self.bullet_class(self.position + offset, self.angle, self.shots_fired & 0xFFFF)
+        self.shots_fired += 1
+        return bullet
+
+    def hit(self, damage=HIT_DAMAGE):
+        self.health = max(0, self.health - damage)
+
+    def serialize(self):
+        # Convert car data to a format that can be sent over the network
+        return {
+            'x': self.position.x,
+            'y': self.position.y,
+            'angle': self.angle,
+            'health': self.health
+        }
+
+    def deserialize(self, data):
+        # Update car data based on received network data
+        self.position.x = data['x']
+        self.position.y = data['y']
+        self.angle = data['angle']
+        self.health = data['health']
+        if 'speed' in data:
+            self.velocity.x = data['speed']
+            self.velocity.y = 0.0
+
+
+def separate_cars(a: CarBody, b: CarBody, dx: float, dy: float, a_share: float = 0.5) -> bool:
+    # Pushes overlapping cars apart along the line between them and stops
+    # whichever of them moved; (dx, dy) is b - a, already wrap-corrected.
+    distance = math.hypot(dx, dy)
+    overlap = a.radius + b.radius - distance
+    if overlap <= 0:
+        return False
+    if distance == 0:
+        dx, dy, distance = 1.0, 0.0, 1.0
+    nx, ny = dx / distance * overlap, dy / distance * overlap
+    for car, share in ((a, -a_share), (b, 1 - a_share)):
+        if share:
+            car.position.x += nx * share
+            car.position.y += ny * share
+            car.velocity.x = 0.0
+    return True
+
+
+def spawn_point(player_id: int, player_count: int, screen_width: int = SCREEN_WIDTH, screen_height: int = SCREEN_HEIGHT):
+    # Players 0 and 1 keep the classic left/right start; larger rooms stack rows
+    rows = (player_count + 1) // 2
+    row = player_id // 2
+    y = screen_height * (row + 1) // (rows + 1)
+    if player_id % 2 == 0:
+        return 100, y, 0
+    return screen_width - 100, y, 180
+
+
+class PlayerInput:
+    __slots__ = ("seq", "throttle", "steering", "shots")
+
+    def __init__(self, seq: int = 0, throttle: int = 0, steering: int = 0, shots: int = 0):
+        self.seq = seq
+        self.throttle = throttle
+        self.steering = steering
+        # Running total of shots fired (16-bit), so a lost input never loses a shot
+        self.shots = shots
+
+
+class Simulation:
+    def __init__(self, player_count: int = 2, screen_width: int = SCREEN_WIDTH, screen_height: int = SCREEN_HEIGHT):
+        self.player_count = player_count
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.grid = SpatialHash(screen_width, screen_height)
+        self.reset()
+
+    def reset(self):
+        self.tick = 0
+        # Every car of the room in one CarPhysics, stepped together
+        self.cars = CarPhysics(self.player_count)
+        for player_id in range(self.player_count):
+            self.cars.place(player_id, *spawn_point(player_id, self.player_count, self.screen_width, self.screen_height))
+        self.health: List[int] = [MAX_HEALTH] * self.player_count
+        self.shots_fired: List[int] = [0] * self.player_count
+        self.bullets = BulletPool()
+        # Last applied input per player; its seq is what snapshots ack
+        self.inputs: List[PlayerInput] = [PlayerInput() for _ in range(self.player_count)]
+        # Every received input drives exactly one tick of its car, the way the
+        # client predicted it.  Late inputs are caught up on later ticks rather
+        # than guessed, and the credit (one per tick) keeps a client from
+        # running its car faster than real time.
+        self.input_queues: List[deque] = [deque() for _ in range(self.player_count)]
+        self.input_credit: List[int] = [0] * self.player_count
+
+    def apply_input(self, player_id: int, data: Dict[str, Any]):
+        # Clients restart seq and shots from 0 on every game_reset
+        queue = self.input_queues[player_id]
+        newest = queue[-1].seq if queue else self.inputs[player_id].seq
+        seq = data["seq"]
+        if not 0 < ((seq - newest) & 0xFFFF) < 0x8000:
+            return
+        queue.append(PlayerInput(seq, data["throttle"], data["steering"], data["shots"]))
+        while len(queue) > MAX_QUEUED_INPUTS:
+            queue.popleft()
+
+    def _apply_inputs(self, movers: List[int], inputs: List[PlayerInput], dt: float):
+        # One tick for each of `movers`, all at once: move, then fire
+        cars = self.cars
+        cars.control(movers, [player_input.throttle for player_input in inputs], [player_input.steering for player_input in inputs])
+        cars.advance(dt, self.screen_width, self.screen_height, movers)
+        for player_id, player_input in zip(movers, inputs):
+            # Shots are a running counter, so inputs dropped from the queue lose no shots
+            shots = (player_input.shots - self.inputs[player_id].shots) & 0xFFFF
+            self.inputs[player_id] = player_input
+            for _ in range(shots):
+                self._fire(player_id)
+
+    def _fire(self, player_id: int):
+        # Same muzzle position as CarBody.shoot
+        cars = self.cars
+        angle = float(cars.angle[player_id])
+        offset = Vector2(float(cars.length[player_id]) / 2, 0).rotate(-angle)
+        x, y = float(cars.x[player_id]) + offset.x, float(cars.y[player_id]) + offset.y
+        self.bullets.spawn(x, y, angle, bullet_id=self.shots_fired[player_id] & 0xFFFF, owner=player_id)
+        self.shots_fired[player_id] += 1
+
+    def step(self, dt: float) -> List[Dict[str, Any]]:
+        # Advances one tick and returns the hits it produced
+        self.tick += 1
+        credit = self.input_credit
+        for player_id in range(self.player_count):
+            credit[player_id] = min(credit[player_id] + 1, MAX_QUEUED_INPUTS)
+        # Usually one round; players catching up on late inputs take more.
+        # Dead cars neither move nor fire, so they cannot decide the match
+        health = self.health
+        while True:
+            movers, inputs = [], []
+            for player_id, queue in enumerate(self.input_queues):
+                if health[player_id] <= 0:
+                    queue.clear()
+                elif queue and credit[player_id] > 0:
+                    credit[player_id] -= 1
+                    movers.append(player_id)
+                    inputs.append(queue.popleft())
+            if not movers:
+                break
+            self._apply_inputs(movers, inputs, dt)
+
+        # One grid per tick, built with the bullet radius, which also covers
+        # the smaller car-vs-car radius
+        if self._collide_cars():
+            self._build_grid()
+
+        self.bullets.step(self.screen_width, self.screen_height)
+
+        hits = []
+        spent = []
+        slots, targets = self.bullets.hits(
+            self.car_x, self.car_y, self.hit_radius, np.array(health) > 0, grid=self.grid
+        )
+        for slot, target in zip(slots.tolist(), targets.tolist()):
+            # A car killed earlier in this tick takes no more bullets
+            if health[target] <= 0:
+                continue
+            health[target] = max(0, health[target] - HIT_DAMAGE)
+            spent.append(slot)
+            hits.append({"target": target, "health": health[target], "shooter": int(self.bullets.owner[slot])})
+        self.bullets.kill(spent)
+        return hits
+
+    def _build_grid(self):
+        self.car_x = self.cars.x.copy()
+        self.car_y = self.cars.y.copy()
+        self.hit_radius = self.cars.length / 2
+        self.grid.build(self.car_x, self.car_y, self.hit_radius)
+
+    def _collide_cars(self) -> bool:
+        self._build_grid()
+        first, second = self.grid.pairs()
+        # Wrecks are left where they are and living cars drive through them
+        health = self.health
+        pairs = [(a, b) for a, b in zip(first.tolist(), second.tolist()) if health[a] > 0 and health[b] > 0]
+        return self.cars.separate_pairs(pairs, self.grid.delta, self.screen_width, self.screen_height)
+
+    def healths(self) -> List[int]:
+        return list(self.health)
+
+    def snapshot(self) -> Dict[str, Any]:
+        cars = self.cars
+        return {
+            "tick": self.tick,
+            "cars": [
+                {"x": x, "y": y, "angle": angle, "health": health, "speed": speed}
+                for x, y, angle, health, speed in zip(cars.x.tolist(), cars.y.tolist(), cars.angle.tolist(), self.health, cars.vx.tolist())
+            ],
+            "acks": [player_input.seq for player_input in self.inputs],
+            # Packed wire records; protocol.encode_message passes them through
+            "bullets": self.bullets.serialize(),
+        }
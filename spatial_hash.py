@@ -0,0 +1,132 @@
+import math
+import time
+import numpy as np
+from typing import Dict, List, Tuple
+
+# Uniform-grid broad phase on the wrapped (toroidal) playfield.
+#
+# Cars are few and large, so each one is inserted into every cell its
+# bounding circle touches, wrapping across the screen edges the same way
+# CarBody.wrap does.  Bullets are points and only look up the cell they are
+# in, which makes bullet-vs-car candidates a single table gather.  Cells tile
+# the screen exactly, so a wrapped cell index always means the same area.
+#
+#   python spatial_hash.py   benchmarks brute force against the grid
+
+CELL_SIZE = 128
+
+
+class SpatialHash:
+    def __init__(self, width: float, height: float, cell_size: float = CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.cols = max(1, round(width / cell_size))
+        self.rows = max(1, round(height / cell_size))
+        self.cell_width = width / self.cols
+        self.cell_height = height / self.rows
+        # cell -> object indices, padded with -1 to the fullest cell
+        self.table = np.full((self.cols * self.rows, 1), -1, dtype=np.int32)
+        self.count = 0
+
+    def build(self, x: np.ndarray, y: np.ndarray, radius: np.ndarray):
+        cells: Dict[int, List[int]] = {}
+        for index, (ox, oy, r) in enumerate(zip(x.tolist(), y.tolist(), radius.tolist())):
+            first_col, last_col = math.floor((ox - r) / self.cell_width), math.floor((ox + r) / self.cell_width)
+            first_row, last_row = math.floor((oy - r) / self.cell_height), math.floor((oy + r) / self.cell_height)
+            # A circle wider than the screen would otherwise visit a cell twice
+            cols = {col % self.cols for col in range(first_col, min(last_col, first_col + self.cols - 1) + 1)}
+            rows = {row % self.rows for row in range(first_row, min(last_row, first_row + self.rows - 1) + 1)}
+            for row in rows:
+                for col in cols:
+                    cells.setdefault(row * self.cols + col, []).append(index)
+        depth = max((len(members) for members in cells.values()), default=1)
+        self.table = np.full((self.cols * self.rows, depth), -1, dtype=np.int32)
+        for cell, members in cells.items():
+            self.table[cell, :len(members)] = members
+        self.count = len(x)
+
+    def cell_of(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        cols = np.floor(x / self.cell_width).astype(np.int64) % self.cols
+        rows = np.floor(y / self.cell_height).astype(np.int64) % self.rows
+        return rows * self.cols + cols
+
+    def candidates(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (point index, object index) for every object sharing the point's cell
+        members = self.table[self.cell_of(x, y)]
+        points, slots = np.nonzero(members >= 0)
+        return points, members[points, slots]
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Unique (i, j), i < j, of objects that share at least one cell
+        if self.table.shape[1] < 2:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        a, b = np.triu_indices(self.table.shape[1], 1)
+        first, second = self.table[:, a].ravel(), self.table[:, b].ravel()
+        valid = (first >= 0) & (second >= 0)
+        keys = np.unique(first[valid].astype(np.int64) * self.count + second[valid])
+        return keys // self.count, keys % self.count
+
+    def delta(self, ax, ay, bx, by):
+        # b - a along the shortest way round the wrapped playfield
+        dx = (bx - ax + self.width / 2) % self.width - self.width / 2
+        dy = (by - ay + self.height / 2) % self.height - self.height / 2
+        return dx, dy
+
+
+def benchmark(car_counts=(2, 16, 64), bullet_counts=(1000, 4000), iterations: int = 50) -> None:
+    from bullet_pool import BulletPool
+    from simulation import SCREEN_WIDTH, SCREEN_HEIGHT
+
+    rng = np.random.default_rng(1)
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+    print(f"{'cars':>5} {'bullets':>8} {'brute us':>9} {'grid us':>8} {'hits':>6}  {'car pairs brute us':>19} {'grid us':>8} {'pairs':>6}")
+    for cars in car_counts:
+        car_x = rng.uniform(0, SCREEN_WIDTH, cars)
+        car_y = rng.uniform(0, SCREEN_HEIGHT, cars)
+        radius = np.full(cars, 75.0)
+        for bullets in bullet_counts:
+            pool = BulletPool(bullets)
+            for x, y, angle in zip(rng.uniform(0, SCREEN_WIDTH, bullets), rng.uniform(0, SCREEN_HEIGHT, bullets), rng.uniform(0, 360, bullets)):
+                pool.spawn(x, y, angle, owner=int(rng.integers(cars)))
+
+            # Brute force over every bullet/car pair with the same wrapped distance
+            start = time.perf_counter()
+            for _ in range(iterations):
+                slots = pool.live_slots()
+                dx, dy = grid.delta(pool.x[slots, None], pool.y[slots, None], car_x[None, :], car_y[None, :])
+                inside = (dx * dx + dy * dy < (radius ** 2)[None, :]) & (pool.owner[slots, None] != np.arange(cars)[None, :])
+                brute = slots[inside.any(axis=1)]
+            brute_time = (time.perf_counter() - start) / iterations
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                grid.build(car_x, car_y, radius)
+                hashed = pool.hits(car_x, car_y, radius, grid=grid)
+            grid_time = (time.perf_counter() - start) / iterations
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                dx, dy = grid.delta(car_x[:, None], car_y[:, None], car_x[None, :], car_y[None, :])
+                close = np.hypot(dx, dy) < radius[:, None] + radius[None, :]
+                brute_pairs = np.argwhere(np.triu(close, 1))
+            brute_pair_time = (time.perf_counter() - start) / iterations
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                grid.build(car_x, car_y, radius)
+                first, second = grid.pairs()
+                dx, dy = grid.delta(car_x[first], car_y[first], car_x[second], car_y[second])
+                touching = np.hypot(dx, dy) < radius[first] + radius[second]
+            grid_pair_time = (time.perf_counter() - start) / iterations
+
+            assert np.array_equal(np.sort(brute), np.sort(hashed[0])), "grid disagrees with brute force"
+            assert touching.sum() == len(brute_pairs), "grid lost a car pair"
+            print(
+                f"{cars:>5} {bullets:>8} {brute_time * 1e6:>9.0f} {grid_time * 1e6:>8.0f} {len(hashed[0]):>6}"
+                f"  {brute_pair_time * 1e6:>19.0f} {grid_pair_time * 1e6:>8.0f} {int(touching.sum()):>6}"
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
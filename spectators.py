@@ -0,0 +1,201 @@
+import asyncio
+import time
+from typing import Dict, Hashable, List, Optional
+
+from metrics import Counter
+
+# Read-only match streams.
+#
+# Each room has a SpectatorFeed.  The room publishes its stream to it as
+# encoded frames, once, whatever the number of viewers; every FLUSH_INTERVAL
+# the feed joins what was published into one immutable bytes object and
+# writes that same object to every spectator, one write per viewer per flush.
+#
+# The stream has two kinds of message.  Events (game_start, game_reset, hit,
+# game_over) are small and rare and always delivered.  States (snapshots in
+# authoritative rooms, one keyframe state_delta per player in relay rooms)
+# are each complete on their own, so within a flush only the newest state per
+# key (per player, or "snapshot") is kept.
+#
+# Each spectator's send queue is its socket's write buffer, bounded by
+# max_queued_bytes.  A viewer past that bound is behind: it is sent only the
+# events, skipping states until its buffer drains, and then resumes at the
+# newest keyframe rather than working through stale ones.  A viewer behind
+# for longer than STALL_TIMEOUT is disconnected.  Nothing here ever waits on
+# a socket, so a slow viewer cannot hold up the room or its players.
+#
+# TCP only, on its own port; not available with sharding.
+#
+#   python game_server.py --spectator-port 12346
+#   python loadgen.py --serve --bots 20 --spectators 300
+#   python spectators.py   times a flush against the number of viewers
+
+FLUSH_INTERVAL = 0.05
+MAX_QUEUED_BYTES = 64 * 1024
+STALL_TIMEOUT = 5.0
+# How long a new spectator has to send its spectate request
+SPECTATE_TIMEOUT = 5.0
+
+
+class Spectator:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_queued_bytes: int = MAX_QUEUED_BYTES):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.feed: Optional["SpectatorFeed"] = None
+        self.max_queued_bytes = max_queued_bytes
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.states_skipped = 0
+        # When the write buffer last went over max_queued_bytes, None if it is not
+        self.behind_since: Optional[float] = None
+        # Why the server closed the stream, None while open or if the viewer left
+        self.drop_reason: Optional[str] = None
+        self.closed = False
+
+    def queued_bytes(self) -> int:
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def write(self, data: bytes, messages: int):
+        self.messages_out += messages
+        self.bytes_out += len(data)
+        self.writer.write(data)
+
+    def send(self, batch: bytes, messages: int, events: bytes, event_count: int, now: float) -> int:
+        # Writes one flush; returns how many of its states were skipped
+        if self.closed:
+            return 0
+        if self.queued_bytes() <= self.max_queued_bytes:
+            self.behind_since = None
+            self.write(batch, messages)
+            return 0
+        if self.behind_since is None:
+            self.behind_since = now
+        elif now - self.behind_since > STALL_TIMEOUT:
+            self.close("stalled")
+            return 0
+        if events:
+            self.write(events, event_count)
+        skipped = messages - event_count
+        self.states_skipped += skipped
+        return skipped
+
+    def close(self, reason: Optional[str] = None):
+        if self.closed:
+            return
+        self.closed = True
+        self.drop_reason = reason
+        if self.feed is not None:
+            self.feed.remove(self)
+        self.writer.close()
+
+
+class SpectatorFeed:
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, states_skipped: Optional[Counter] = None):
+        self.flush_interval = flush_interval
+        self.spectators: List[Spectator] = []
+        # Published since the last flush, in order; superseded states become None
+        self.pending: List[Optional[bytes]] = []
+        self.is_state: List[bool] = []
+        self.state_index: Dict[Hashable, int] = {}
+        self.states_skipped = states_skipped
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self.spectators)
+
+    def add(self, spectator: Spectator, *frames: bytes):
+        # frames go to this spectator alone, ahead of the stream
+        spectator.feed = self
+        self.spectators.append(spectator)
+        if frames:
+            spectator.write(b"".join(frames), len(frames))
+
+    def remove(self, spectator: Spectator):
+        if spectator in self.spectators:
+            self.spectators.remove(spectator)
+        spectator.feed = None
+
+    def close(self):
+        for spectator in list(self.spectators):
+            spectator.close()
+        self._cancel_flush()
+        self.pending.clear()
+
+    def publish(self, data: bytes, state: Optional[Hashable] = None):
+        # `state` names what the frame is a complete state of; a newer state
+        # with the same name replaces it until the next flush
+        if not self.spectators:
+            return
+        if state is not None:
+            previous = self.state_index.get(state)
+            if previous is not None:
+                self.pending[previous] = None
+            self.state_index[state] = len(self.pending)
+        self.pending.append(data)
+        self.is_state.append(state is not None)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self, now: Optional[float] = None):
+        self._flush_handle = None
+        frames = [data for data in self.pending if data is not None]
+        events = [data for data, state in zip(self.pending, self.is_state) if data is not None and not state]
+        self.pending.clear()
+        self.is_state.clear()
+        self.state_index.clear()
+        if not frames:
+            return
+        batch = b"".join(frames)
+        event_batch = b"".join(events)
+        now = time.monotonic() if now is None else now
+        skipped = 0
+        for spectator in list(self.spectators):
+            skipped += spectator.send(batch, len(frames), event_batch, len(events), now)
+        if skipped and self.states_skipped is not None:
+            self.states_skipped.inc(skipped)
+
+    def _cancel_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+
+if __name__ == "__main__":
+    import timeit
+
+    from protocol import encode_message
+    from simulation import Simulation
+
+    class NullTransport:
+        def get_write_buffer_size(self):
+            return 0
+
+    class NullWriter:
+        transport = NullTransport()
+
+        def get_extra_info(self, name):
+            return ("bench", 0)
+
+        def write(self, data):
+            pass
+
+        def close(self):
+            pass
+
+    message = {"snapshot": Simulation(8).snapshot()}
+    data = encode_message(message)
+    encode = timeit.timeit(lambda: encode_message(message), number=2000) / 2000
+    print(f"8-player snapshot, {len(data)} bytes: encode {encode * 1e6:.1f} us (what encoding per viewer would cost each time)")
+    print(f"{'viewers':>8} {'flush':>10}   one snapshot and one hit per flush, written to every viewer")
+    for viewers in (1, 10, 100, 300, 1000):
+        feed = SpectatorFeed()
+        feed.spectators = [Spectator(None, NullWriter()) for _ in range(viewers)]
+
+        def flush():
+            feed.pending += [data, b"hit"]
+            feed.is_state += [True, False]
+            feed.flush(0.0)
+        count = max(10, 100000 // viewers)
+        print(f"{viewers:>8} {timeit.timeit(flush, number=count) / count * 1e6:>7.1f} us")
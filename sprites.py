@@ -0,0 +1,87 @@
+import pygame
+from assets import assets
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+# Shared cache of pre-rotated sprites.
+#
+# Each image is decoded and scaled once; rotated variants are built on first
+# use (or ahead of time with warm()) for angles quantized to `angle_step`
+# degrees and kept under an LRU memory budget.  A variant carries everything a
+# draw or a pixel-perfect test needs, so drawing is a lookup plus a blit.
+
+CAR_IMAGE = "images/Death Race Car Sticker Fantasy.png"
+CAR_SCALE = 0.15
+DEFAULT_ANGLE_STEP = 1.0
+DEFAULT_MEMORY_BUDGET = 16 * 1024 * 1024
+
+
+class SpriteVariant:
+    __slots__ = ("surface", "rect", "mask", "offset", "size_bytes")
+
+    def __init__(self, surface: pygame.Surface):
+        self.surface = surface
+        # Centered on (0, 0); move a copy to the sprite's position
+        self.rect = surface.get_rect(center=(0, 0))
+        self.offset = self.rect.topleft
+        self.mask = pygame.mask.from_surface(surface)
+        width, height = surface.get_size()
+        self.size_bytes = width * height * surface.get_bytesize() + width * height // 8
+
+
+class SpriteCache:
+    def __init__(self, angle_step: float = DEFAULT_ANGLE_STEP, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.angle_step = angle_step
+        self.steps = max(1, round(360 / angle_step))
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.bases: Dict[Tuple[str, float], pygame.Surface] = {}
+        self.variants: "OrderedDict[Tuple[str, float, int], SpriteVariant]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def base(self, path: str, scale: float) -> pygame.Surface:
+        key = (path, scale)
+        surface = self.bases.get(key)
+        if surface is None:
+            # convert_alpha needs a display mode, so this can't run at import time
+            surface = assets.image(path).convert_alpha()
+            if scale != 1:
+                surface = pygame.transform.rotozoom(surface, 0, scale)
+            self.bases[key] = surface
+        return surface
+
+    def get(self, path: str, angle: float, scale: float = 1.0) -> SpriteVariant:
+        key = (path, scale, round(angle / self.angle_step) % self.steps)
+        variant = self.variants.get(key)
+        if variant is not None:
+            self.hits += 1
+            self.variants.move_to_end(key)
+            return variant
+        self.misses += 1
+        return self._build(key)
+
+    def _build(self, key: Tuple[str, float, int]) -> SpriteVariant:
+        path, scale, index = key
+        variant = SpriteVariant(pygame.transform.rotozoom(self.base(path, scale), index * self.angle_step, 1))
+        self.variants[key] = variant
+        self.memory_used += variant.size_bytes
+        while self.memory_used > self.memory_budget and len(self.variants) > 1:
+            _, evicted = self.variants.popitem(last=False)
+            self.memory_used -= evicted.size_bytes
+        return variant
+
+    def warm(self, path: str, scale: float = 1.0):
+        # Builds every angle up front (as far as the budget allows)
+        for index in range(self.steps):
+            key = (path, scale, index)
+            if key not in self.variants:
+                self._build(key)
+
+    def clear(self):
+        self.bases.clear()
+        self.variants.clear()
+        self.memory_used = 0
+
+
+sprite_cache = SpriteCache()
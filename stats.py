@@ -0,0 +1,243 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+# Persistent per-player statistics in a local SQLite file.
+#
+# The server only ever calls add(), which adds to an in-memory dict of
+# per-player increments under a lock held for a few dictionary operations.
+# A background thread wakes every FLUSH_INTERVAL, swaps that dict out and
+# applies it in one transaction, one upsert per player that changed
+# ("wins = wins + ?"), so a busy second costs one commit, not one per hit,
+# and the event loop never waits on the disk.  Increments add up, so several
+# server processes (sharding.py) can share one file; WAL mode lets readers
+# run while a batch is written.  A crash loses at most FLUSH_INTERVAL.
+#
+# Leaderboards are read straight from SQLite through an index per ranked
+# column and see what was flushed.  player() serves a bounded LRU cache of
+# recently read records, kept current as batches are written, plus whatever
+# is still pending, so a lookup never misses a hit the server has counted.
+#
+#   python game_server.py --stats stats.db
+#   python stats.py stats.db --by hits        leaderboard
+#   python stats.py stats.db --player alice
+#   python stats.py --bench                   times add() and a flush
+
+STATS_VERSION = 1
+STAT_COLUMNS = ("matches", "wins", "losses", "hits", "shots", "seconds")
+# Leaderboards can be ranked by these; each has an index
+RANKED_COLUMNS = ("wins", "hits", "matches", "seconds")
+FLUSH_INTERVAL = 1.0
+CACHE_SIZE = 1024
+MAX_NAME_LENGTH = 32
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS players ("
+    " name TEXT PRIMARY KEY,"
+    " matches INTEGER NOT NULL DEFAULT 0,"
+    " wins INTEGER NOT NULL DEFAULT 0,"
+    " losses INTEGER NOT NULL DEFAULT 0,"
+    " hits INTEGER NOT NULL DEFAULT 0,"
+    " shots INTEGER NOT NULL DEFAULT 0,"
+    " seconds REAL NOT NULL DEFAULT 0,"
+    " last_seen REAL NOT NULL DEFAULT 0)",
+] + [f"CREATE INDEX IF NOT EXISTS players_by_{column} ON players ({column} DESC)" for column in RANKED_COLUMNS]
+
+UPSERT = (
+    f"INSERT INTO players (name, {', '.join(STAT_COLUMNS)}, last_seen) VALUES ({', '.join('?' * (len(STAT_COLUMNS) + 2))})"
+    f" ON CONFLICT (name) DO UPDATE SET {', '.join(f'{c} = {c} + excluded.{c}' for c in STAT_COLUMNS)}, last_seen = excluded.last_seen"
+)
+
+
+class PlayerStats(NamedTuple):
+    name: str
+    matches: int
+    wins: int
+    losses: int
+    hits: int
+    shots: int
+    seconds: float
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # Other processes may be mid-commit on the same file; wait for them
+    db = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    return db
+
+
+class StatsStore:
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL, cache_size: int = CACHE_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        db = _connect(path)
+        with db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.execute(f"PRAGMA user_version = {STATS_VERSION}")
+        # Readers only; the writer thread opens its own connection
+        self.db = db
+        # Name -> increments per STAT_COLUMNS, not yet written
+        self.pending: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # Held while a batch is written, so a reader sees it in the file or pending, never both
+        self.db_lock = threading.Lock()
+        self.cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.flush_requested = 0
+        self.flushed = 0
+        self.closing = False
+        self.thread = threading.Thread(target=self._run, name="stats-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, name: str, matches: int = 0, wins: int = 0, losses: int = 0, hits: int = 0, shots: int = 0, seconds: float = 0.0):
+        with self.lock:
+            row = self.pending.get(name)
+            if row is None:
+                self.pending[name] = [matches, wins, losses, hits, shots, seconds]
+                return
+            row[0] += matches
+            row[1] += wins
+            row[2] += losses
+            row[3] += hits
+            row[4] += shots
+            row[5] += seconds
+
+    def flush(self):
+        # Blocks until everything added so far is written; for tools and shutdown
+        with self.wakeup:
+            self.flush_requested += 1
+            target = self.flush_requested
+            self.wakeup.notify_all()
+            while self.flushed < target and self.thread.is_alive():
+                self.wakeup.wait(0.1)
+
+    def close(self):
+        with self.wakeup:
+            self.closing = True
+            self.wakeup.notify_all()
+        self.thread.join()
+        self.db.close()
+
+    def _run(self):
+        db = _connect(self.path)
+        while True:
+            with self.wakeup:
+                if not self.closing and self.flushed == self.flush_requested:
+                    self.wakeup.wait(self.flush_interval)
+                closing, requested = self.closing, self.flush_requested
+            with self.db_lock:
+                with self.lock:
+                    batch, self.pending = self.pending, {}
+                if batch:
+                    self._write(db, batch)
+            with self.wakeup:
+                self.flushed = requested
+                self.wakeup.notify_all()
+            if closing:
+                db.close()
+                return
+
+    def _write(self, db: sqlite3.Connection, batch: Dict[str, List[float]]):
+        now = time.time()
+        try:
+            with db:
+                db.executemany(UPSERT, [(name, *row, now) for name, row in batch.items()])
+        except sqlite3.Error as e:
+            # Kept for the next batch rather than lost
+            print(f"Stats write to {self.path} failed, retrying: {e}")
+            for name, row in batch.items():
+                self.add(name, *row)
+            return
+        self.batches += 1
+        self.rows_written += len(batch)
+        for name, row in batch.items():
+            cached = self.cache.get(name)
+            if cached is not None:
+                for i, value in enumerate(row):
+                    cached[i] += value
+
+    def player(self, name: str) -> Optional[PlayerStats]:
+        with self.db_lock:
+            row = self.cache.get(name)
+            if row is not None:
+                self.cache_hits += 1
+                self.cache.move_to_end(name)
+            else:
+                self.cache_misses += 1
+                found = self.db.execute(f"SELECT {', '.join(STAT_COLUMNS)} FROM players WHERE name = ?", (name,)).fetchone()
+                if found is not None:
+                    row = self.cache[name] = list(found)
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            with self.lock:
+                pending = self.pending.get(name)
+                if row is None and pending is None:
+                    return None
+                values = [a + b for a, b in zip(row or [0] * len(STAT_COLUMNS), pending or [0] * len(STAT_COLUMNS))]
+        return PlayerStats(name, *values)
+
+    def leaderboard(self, by: str = "wins", limit: int = 10) -> List[PlayerStats]:
+        if by not in RANKED_COLUMNS:
+            raise ValueError(f"cannot rank by {by!r}; one of {', '.join(RANKED_COLUMNS)}")
+        with self.db_lock:
+            rows = self.db.execute(
+                f"SELECT name, {', '.join(STAT_COLUMNS)} FROM players ORDER BY {by} DESC, name LIMIT ?", (limit,)
+            ).fetchall()
+        return [PlayerStats(*row) for row in rows]
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+    import timeit
+
+    parser = argparse.ArgumentParser(description="Player statistics")
+    parser.add_argument("path", nargs="?", help="stats database written by game_server.py --stats")
+    parser.add_argument("--by", choices=RANKED_COLUMNS, default="wins")
+    parser.add_argument("-n", "--limit", type=int, default=10)
+    parser.add_argument("--player", help="show one player")
+    parser.add_argument("--bench", action="store_true", help="time add() and a batched flush")
+    args = parser.parse_args()
+
+    if args.bench:
+        with tempfile.TemporaryDirectory() as directory:
+            store = StatsStore(os.path.join(directory, "bench.db"), flush_interval=3600)
+            count = 200000
+            add = timeit.timeit(lambda: store.add("player7", hits=1), number=count) / count
+            print(f"add(): {add * 1e6:.2f} us")
+            for players in (100, 1000, 10000):
+                for i in range(players):
+                    store.add(f"player{i}", matches=1, wins=i % 2, losses=1 - i % 2, hits=3, shots=20, seconds=95.0)
+                start = time.perf_counter()
+                store.flush()
+                print(f"flush of {players:>5} players: {(time.perf_counter() - start) * 1e3:7.1f} ms on the writer thread, one transaction")
+            store.player("player7")
+            lookup = timeit.timeit(lambda: store.player("player7"), number=20000) / 20000
+            board = timeit.timeit(lambda: store.leaderboard("hits", 10), number=2000) / 2000
+            print(f"player() cached: {lookup * 1e6:.1f} us, leaderboard(hits, 10) over 10000 players: {board * 1e6:.1f} us")
+            store.close()
+        raise SystemExit
+    if args.path is None:
+        parser.error("a stats database is needed (or --bench)")
+    store = StatsStore(args.path)
+    players = [store.player(args.player)] if args.player else store.leaderboard(args.by, args.limit)
+    print(f"{'name':<{MAX_NAME_LENGTH}} {'matches':>8} {'wins':>6} {'losses':>6} {'hits':>6} {'shots':>7} {'played':>9}")
+    for stats in players:
+        if stats is None:
+            print(f"{args.player}: no matches recorded")
+            continue
+        print(
+            f"{stats.name:<{MAX_NAME_LENGTH}} {stats.matches:>8} {stats.wins:>6} {stats.losses:>6}"
+            f" {stats.hits:>6} {stats.shots:>7} {stats.seconds / 60:>7.1f} m"
+        )
+    store.close()
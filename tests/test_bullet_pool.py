@@ -0,0 +1,85 @@
+import random
+
+import numpy as np
+import pytest
+
+from bullet_pool import NO_OWNER, BulletPool, bullet_records
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH, Projectile, Vector2
+from spatial_hash import SpatialHash
+
+
+def test_step_matches_projectiles():
+    rng = random.Random(1)
+    projectiles = [Projectile(Vector2(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)), rng.uniform(0, 360)) for _ in range(200)]
+    pool = BulletPool(256)
+    for projectile in projectiles:
+        pool.add(projectile)
+    for _ in range(30):
+        projectiles = [p for p in projectiles if not p.is_out_of_bounds(SCREEN_WIDTH, SCREEN_HEIGHT)]
+        for projectile in projectiles:
+            projectile.update()
+        pool.step(SCREEN_WIDTH, SCREEN_HEIGHT)
+    slots = pool.live_slots()
+    assert len(slots) == len(projectiles)
+    assert sorted(zip(pool.x[slots].round(6), pool.y[slots].round(6))) == sorted((round(p.position.x, 6), round(p.position.y, 6)) for p in projectiles)
+
+
+def test_freed_slots_are_reused_lowest_first():
+    pool = BulletPool(16)
+    for i in range(10):
+        pool.spawn(i, 0, 0)
+    pool.kill([7, 2, 5])
+    assert [pool.spawn(0, 0, 0) for _ in range(3)] == [2, 5, 7]
+
+
+def test_high_shrinks_past_dead_top_slots():
+    pool = BulletPool(16)
+    for i in range(10):
+        pool.spawn(i, 0, 0)
+    pool.kill([9, 8, 6])
+    assert pool.high == 8
+    pool.kill([7])
+    assert pool.high == 6
+    pool.kill(range(6))
+    assert pool.high == 0 and len(pool) == 0
+
+
+def test_full_pool_drops():
+    pool = BulletPool(2)
+    assert pool.spawn(0, 0, 0) == 0 and pool.spawn(0, 0, 0) == 1
+    assert pool.spawn(0, 0, 0) == -1
+    assert pool.dropped == 1
+
+
+def test_load_then_spawn_uses_the_next_free_slot():
+    pool = BulletPool(8)
+    pool.load(bullet_records([{"x": 1.0, "y": 2.0, "angle": 0.0, "speed": 30} for _ in range(3)]))
+    assert [pool.spawn(0, 0, 0) for _ in range(2)] == [3, 4]
+
+
+def test_serialize_round_trip():
+    pool = BulletPool(8)
+    pool.spawn(100.5, 200.25, 45.0, bullet_id=7, owner=1)
+    pool.spawn(10.0, 20.0, 270.0, bullet_id=8)
+    copy = BulletPool(8)
+    assert copy.deserialize(pool.serialize()) == 2
+    assert copy.x[:2].tolist() == [100.5, 10.0]
+    assert copy.ids[:2].tolist() == [7, 8]
+    assert copy.owner[:2].tolist() == [1, NO_OWNER]
+
+
+@pytest.mark.parametrize("use_grid", [False, True])
+def test_hits_skip_the_owner_and_pick_the_first_car(use_grid):
+    car_x = np.array([100.0, 110.0, 600.0])
+    car_y = np.array([100.0, 100.0, 400.0])
+    radius = np.full(3, 75.0)
+    pool = BulletPool(8)
+    own = pool.spawn(100, 100, 0, owner=0)
+    shared = pool.spawn(105, 100, 0, owner=2)
+    pool.spawn(1000, 700, 0, owner=1)
+    grid = None
+    if use_grid:
+        grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+        grid.build(car_x, car_y, radius)
+    slots, cars = pool.hits(car_x, car_y, radius, grid=grid)
+    assert dict(zip(slots.tolist(), cars.tolist())) == {own: 1, shared: 0}
@@ -0,0 +1,128 @@
+import math
+import random
+
+from delta import BULLET_TOLERANCE, SnapshotDecoder, SnapshotEncoder, quantize_bullets, quantize_car
+from protocol import FrameDecoder, encode_message
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH
+
+
+def wire(delta):
+    # Through the real codec, as the relay sends it
+    return FrameDecoder().feed(encode_message({"state_delta": delta}))[0]["state_delta"]
+
+
+class Sender:
+    # One car firing straight-flying bullets, moved the way Bullet.update moves them
+    def __init__(self, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.car = {"x": 400.0, "y": 300.0, "angle": 0.0, "health": 100}
+        self.bullets = []
+        self.next_id = 0
+
+    def state(self):
+        self.car["x"] = (self.car["x"] + 3) % SCREEN_WIDTH
+        self.car["angle"] = (self.car["angle"] + 7) % 360
+        for bullet in self.bullets:
+            bullet["x"] += math.cos(math.radians(bullet["angle"])) * bullet["speed"]
+            bullet["y"] -= math.sin(math.radians(bullet["angle"])) * bullet["speed"]
+        self.bullets = [b for b in self.bullets if 0 <= b["x"] <= SCREEN_WIDTH and 0 <= b["y"] <= SCREEN_HEIGHT]
+        if self.rng.random() < 0.3:
+            self.bullets.append({"id": self.next_id, "x": self.car["x"], "y": self.car["y"], "angle": self.rng.uniform(0, 360), "speed": 30})
+            self.next_id += 1
+        return {"car": dict(self.car), "bullets": [dict(b) for b in self.bullets]}
+
+
+def assert_matches(decoded, state):
+    assert quantize_car(decoded) == quantize_car(state)
+    expected = quantize_bullets(state)
+    received = quantize_bullets(decoded)
+    assert received.keys() == expected.keys()
+    for bullet_id, (x, y, angle, speed) in expected.items():
+        rx, ry, rangle, rspeed = received[bullet_id]
+        assert (rangle, rspeed) == (angle, speed)
+        assert abs(rx - x) <= BULLET_TOLERANCE and abs(ry - y) <= BULLET_TOLERANCE
+
+
+def test_acked_deltas_reconstruct_every_state():
+    sender = Sender()
+    encoder = SnapshotEncoder(player=0)
+    decoder = SnapshotDecoder()
+    based = 0
+    for seq in range(1, 200):
+        state = sender.state()
+        delta = wire(encoder.encode(seq, state))
+        based += delta["base"] > 0
+        assert_matches(decoder.decode(delta), state)
+        ack = decoder.take_ack()
+        if ack is not None:
+            encoder.ack(ack)
+    assert based > 150
+
+
+def test_lost_deltas_are_recovered_from_an_older_baseline():
+    sender = Sender(2)
+    encoder = SnapshotEncoder(player=0)
+    decoder = SnapshotDecoder()
+    rng = random.Random(3)
+    delivered = 0
+    for seq in range(1, 300):
+        state = sender.state()
+        delta = wire(encoder.encode(seq, state))
+        if rng.random() < 0.3:
+            continue
+        decoded = decoder.decode(delta)
+        assert decoded is not None
+        assert_matches(decoded, state)
+        delivered += 1
+        ack = decoder.take_ack()
+        if ack is not None and rng.random() < 0.7:
+            encoder.ack(ack)
+    assert delivered > 150
+
+
+def test_lost_baseline_requests_a_keyframe():
+    sender = Sender(4)
+    encoder = SnapshotEncoder(player=0)
+    # Holds only the newest snapshot, so the baseline the encoder still
+    # diffs against is gone once a second delta arrives
+    decoder = SnapshotDecoder(history_size=1)
+    decoder.decode(wire(encoder.encode(1, sender.state())))
+    encoder.ack(decoder.take_ack())
+    decoder.decode(wire(encoder.encode(2, sender.state())))
+    decoder.take_ack()
+
+    delta = wire(encoder.encode(3, sender.state()))
+    assert delta["base"] == 2
+    assert decoder.decode(delta) is None
+    ack = decoder.take_ack()
+    assert ack == {"player": 0, "seq": 3, "keyframe": True}
+
+    encoder.ack(ack)
+    state = sender.state()
+    keyframe = wire(encoder.encode(4, state))
+    assert keyframe["base"] == 0
+    assert_matches(decoder.decode(keyframe), state)
+
+
+def test_stale_deltas_are_dropped():
+    sender = Sender(5)
+    encoder = SnapshotEncoder(player=0)
+    decoder = SnapshotDecoder()
+    decoder.decode(wire(encoder.encode(1, sender.state())))
+    encoder.ack(decoder.take_ack())
+    older = wire(encoder.encode(2, sender.state()))
+    newer = wire(encoder.encode(3, sender.state()))
+    assert decoder.decode(newer) is not None
+    assert decoder.decode(older) is None
+
+
+def test_sequence_numbers_wrap():
+    sender = Sender(6)
+    encoder = SnapshotEncoder(player=0)
+    decoder = SnapshotDecoder()
+    for seq in range(0xFFFF - 20, 0xFFFF + 20):
+        state = sender.state()
+        assert_matches(decoder.decode(wire(encoder.encode(seq, state))), state)
+        ack = decoder.take_ack()
+        if ack is not None:
+            encoder.ack(ack)
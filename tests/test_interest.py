@@ -0,0 +1,58 @@
+from interest import InterestManager
+from simulation import SCREEN_WIDTH
+
+
+def line_of_cars(count, spacing=10.0, radius=None):
+    # Player 0 at x=100, everyone else further along the same row
+    interest = InterestManager(count, radius=radius, full_rate_slots=2, max_interval=8)
+    for player_id in range(count):
+        interest.move(player_id, 100.0 + player_id * spacing, 300.0)
+    interest.refresh(force=True)
+    return interest
+
+
+def sends(interest, recipient, source, updates):
+    return sum(interest.should_send(recipient, source) for _ in range(updates))
+
+
+def test_rates_halve_with_each_band_of_distance():
+    interest = line_of_cars(12)
+    assert interest.intervals[0][0] == 0
+    # Nearest two every update, next two every 2nd, then 4th, then capped at 8
+    assert interest.intervals[0][1:] == [1, 1, 2, 2, 4, 4, 8, 8, 8, 8, 8]
+    assert [sends(interest, 0, source, 64) for source in (1, 3, 5, 7, 11)] == [64, 32, 16, 8, 8]
+
+
+def test_distances_wrap_round_the_edges():
+    interest = InterestManager(4, full_rate_slots=1, max_interval=8)
+    interest.move(0, 10.0, 300.0)
+    interest.move(1, SCREEN_WIDTH - 10.0, 300.0)
+    interest.move(2, 200.0, 300.0)
+    interest.move(3, 400.0, 300.0)
+    interest.refresh(force=True)
+    assert interest.intervals[0][1:] == [1, 2, 4]
+
+
+def test_radius_drops_far_cars_entirely():
+    interest = line_of_cars(6, spacing=100.0, radius=250.0)
+    assert interest.intervals[0][1:] == [1, 1, 0, 0, 0]
+    assert sends(interest, 0, 4, 100) == 0
+
+
+def test_removed_players_get_nothing():
+    interest = line_of_cars(6)
+    interest.remove(2)
+    interest.refresh(force=True)
+    assert interest.intervals[0][2] == 0 and interest.intervals[2] == [0] * 6
+
+
+def test_refresh_waits_for_its_interval():
+    interest = InterestManager(3, full_rate_slots=1)
+    for player_id in range(3):
+        interest.move(player_id, 100.0 + player_id * 10, 100.0)
+    interest.refresh(now=10.0)
+    interest.move(2, 105.0, 100.0)
+    interest.refresh(now=10.1)
+    assert interest.intervals[0][1:] == [1, 2]
+    interest.refresh(now=10.0 + interest.refresh_interval)
+    assert interest.intervals[0][1:] == [2, 1]
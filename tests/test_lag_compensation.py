@@ -0,0 +1,68 @@
+import pytest
+
+from lag_compensation import CAR_HALF_LENGTH, HIT_TOLERANCE, StateHistory, check_hit
+from simulation import SCREEN_WIDTH
+
+START = 100.0
+
+
+@pytest.fixture
+def history():
+    # Player 1 drives right at 60 px/s for two seconds
+    history = StateHistory(2, tick_rate=60, window=0.5)
+    history.reset(START)
+    for tick in range(120):
+        history.record(1, 200.0 + tick, 300.0, 0.0, START + tick / 60)
+    return history
+
+
+def shooter(bullets=(), x=250.0):
+    return {"car": {"x": x, "y": 300.0, "angle": 0.0, "health": 100}, "bullets": list(bullets)}
+
+
+def bullet_at(x, y):
+    return {"id": 3, "x": x, "y": y, "angle": 0.0, "speed": 30}
+
+
+def test_hit_on_the_rewound_car_is_accepted(history):
+    # At tick 100 the car was at x=300, twenty px behind where it is now
+    view = START + 100 / 60
+    assert check_hit(history, 1, shooter([bullet_at(290.0, 300.0)]), {"bullet": 3, "x": 300.0, "y": 300.0}, view) is None
+
+
+def test_hit_only_the_present_car_would_take_is_a_miss(history):
+    view = START + 100 / 60
+    x = 300.0 - CAR_HALF_LENGTH - HIT_TOLERANCE - 1
+    assert check_hit(history, 1, shooter([bullet_at(x, 300.0)]), {"bullet": 3, "x": x, "y": 300.0}, view) == "miss"
+
+
+def test_views_older_than_the_window_are_rejected(history):
+    view = START + 119 / 60 - history.window - 0.1
+    assert check_hit(history, 1, shooter([bullet_at(250.0, 300.0)]), {"bullet": 3, "x": 250.0, "y": 300.0}, view) == "outside window"
+
+
+def test_bullet_must_be_where_the_shooter_reported_it(history):
+    view = START + 100 / 60
+    far = bullet_at(300.0 - 30 * 10, 300.0)
+    assert check_hit(history, 1, shooter([far]), {"bullet": 3, "x": 300.0, "y": 300.0}, view) == "bullet mismatch"
+
+
+def test_unreported_bullets_must_leave_the_shooters_muzzle(history):
+    view = START + 100 / 60
+    # Not in the shooter's last state: fired since, so it started at their car
+    assert check_hit(history, 1, shooter(x=250.0), {"bullet": 3, "x": 300.0, "y": 300.0}, view) is None
+    assert check_hit(history, 1, shooter(x=-300.0), {"bullet": 3, "x": 300.0, "y": 300.0}, view) == "bullet mismatch"
+
+
+def test_distances_wrap_round_the_edge():
+    history = StateHistory(2, tick_rate=60, window=0.5)
+    history.reset(START)
+    history.record(1, 5.0, 300.0, 0.0, START)
+    # The bullet is 15 px away across the left edge
+    hit = {"bullet": 3, "x": SCREEN_WIDTH - 10.0, "y": 300.0}
+    assert check_hit(history, 1, shooter([bullet_at(SCREEN_WIDTH - 20.0, 300.0)]), hit, START) is None
+
+
+def test_claims_without_a_bullet_are_rejected(history):
+    assert check_hit(history, 1, None, {"bullet": 3, "x": 0.0, "y": 0.0}, START) == "no claim"
+    assert check_hit(history, 1, shooter(), {"x": 0.0, "y": 0.0}, START) == "no claim"
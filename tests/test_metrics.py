@@ -0,0 +1,53 @@
+import json
+import logging
+import math
+
+from metrics import Histogram, Registry, SampledLog
+
+
+def test_render_text_exposition_format():
+    registry = Registry()
+    registry.counter("messages_total", "Messages received").inc(3)
+    registry.gauge("rooms", "Open rooms").set(2.5)
+    latency = registry.histogram("tick_seconds", "Tick time", buckets=(0.001, 0.01))
+    for value in (0.0005, 0.005, 0.005, 1.0):
+        latency.observe(value)
+    registry.collect("client_rtt_seconds", "gauge", "RTT per client", lambda: [({"client": 'a "b"\n'}, 0.25)])
+    assert registry.render() == (
+        "# HELP messages_total Messages received\n"
+        "# TYPE messages_total counter\n"
+        "messages_total 3\n"
+        "# HELP rooms Open rooms\n"
+        "# TYPE rooms gauge\n"
+        "rooms 2.5\n"
+        "# HELP tick_seconds Tick time\n"
+        "# TYPE tick_seconds histogram\n"
+        'tick_seconds_bucket{le="0.001"} 1\n'
+        'tick_seconds_bucket{le="0.01"} 3\n'
+        'tick_seconds_bucket{le="+Inf"} 4\n'
+        "tick_seconds_sum 1.0105\n"
+        "tick_seconds_count 4\n"
+        "# HELP client_rtt_seconds RTT per client\n"
+        "# TYPE client_rtt_seconds gauge\n"
+        'client_rtt_seconds{client="a \\"b\\"\\n"} 0.25\n'
+    )
+
+
+def test_histogram_quantile_is_a_bucket_bound():
+    histogram = Histogram("h", "", buckets=(1, 2, 4))
+    assert math.isnan(histogram.quantile(0.5))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.99) == math.inf
+
+
+def test_sampled_log_keeps_one_in_every(caplog):
+    log = SampledLog(logging.getLogger("test_metrics"), every=10)
+    with caplog.at_level(logging.INFO, logger="test_metrics"):
+        for i in range(35):
+            if log.sample():
+                log.log("message", n=i)
+    records = [json.loads(record.getMessage()) for record in caplog.records]
+    assert [record["n"] for record in records] == [9, 19, 29]
+    assert all(record["sample_rate"] == 10 and record["event"] == "message" for record in records)
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from physics import BATCH_MIN_CARS, MAX_SUBSTEPS, CarPhysics, FixedTimestep
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH, CarBody
+
+DT = 1 / 60
+
+
+@pytest.mark.parametrize("count", [3, BATCH_MIN_CARS * 2])
+def test_car_physics_follows_car_body(count):
+    rng = random.Random(count)
+    bodies = [CarBody(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT), rng.uniform(0, 360)) for _ in range(count)]
+    physics = CarPhysics(count)
+    for car, body in enumerate(bodies):
+        physics.load(car, body)
+    for step in range(600):
+        if step % 60 == 0:
+            # New inputs every second, so cars brake, reverse and turn both ways
+            throttle = [rng.choice((-1, 0, 1)) for _ in bodies]
+            steering = [rng.choice((-1, 0, 1)) for _ in bodies]
+            physics.control(None, throttle, steering)
+            for body, t, s in zip(bodies, throttle, steering):
+                body.acceleration = t * body.max_acceleration
+                body.steering = s * body.max_steering
+        physics.advance(DT, SCREEN_WIDTH, SCREEN_HEIGHT)
+        for body in bodies:
+            body.update(DT)
+            body.wrap(SCREEN_WIDTH, SCREEN_HEIGHT)
+    for car, body in enumerate(bodies):
+        assert physics.x[car] == pytest.approx(body.position.x, abs=1e-6)
+        assert physics.y[car] == pytest.approx(body.position.y, abs=1e-6)
+        assert physics.angle[car] == pytest.approx(body.angle, abs=1e-6)
+        assert physics.vx[car] == pytest.approx(body.velocity.x, abs=1e-6)
+
+
+def test_advance_moves_only_the_given_cars():
+    physics = CarPhysics(3)
+    for car in range(3):
+        physics.place(car, 100.0, 100.0, 0.0)
+    physics.control([1], [1], [0])
+    physics.vx[:] = 60.0
+    physics.advance(DT, SCREEN_WIDTH, SCREEN_HEIGHT, [1])
+    assert physics.x[1] > 100.0
+    assert np.array_equal(physics.x[[0, 2]], [100.0, 100.0])
+
+
+def test_fixed_timestep_carries_the_remainder():
+    timestep = FixedTimestep(DT)
+    assert timestep.advance(DT / 2) == 0
+    assert timestep.alpha == pytest.approx(0.5)
+    assert timestep.advance(DT) == 1
+    assert timestep.advance(DT / 2) == 1
+    assert timestep.alpha == pytest.approx(0.0, abs=1e-9)
+
+
+def test_fixed_timestep_drops_long_stalls():
+    timestep = FixedTimestep(DT)
+    assert timestep.advance(10.0) == MAX_SUBSTEPS
+    assert timestep.advance(DT) == 1
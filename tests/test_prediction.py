@@ -0,0 +1,73 @@
+import pytest
+
+from prediction import InputPredictor, SnapshotBuffer, lerp_angle, lerp_wrapped
+from simulation import CarBody
+
+TICK_RATE = 60
+INPUTS = [(1, 0), (1, 1), (1, 1), (0, -1), (-1, 0), (1, 0), (1, -1), (1, 1), (0, 0), (1, 0)]
+
+
+def drive(car, inputs):
+    for throttle, steering in inputs:
+        car.acceleration = throttle * car.max_acceleration
+        car.steering = steering * car.max_steering
+        car.update(1 / TICK_RATE)
+        car.wrap(1366, 768)
+
+
+def server_state(car):
+    state = car.serialize()
+    state["speed"] = car.velocity.x
+    return state
+
+
+def test_reconcile_replays_unacked_inputs():
+    client = CarBody(300, 300)
+    predictor = InputPredictor(TICK_RATE)
+    for seq, (throttle, steering) in enumerate(INPUTS, 1):
+        predictor.record(seq, throttle, steering)
+    drive(client, INPUTS)
+    # The server has applied the first 4 inputs
+    server = CarBody(300, 300)
+    drive(server, INPUTS[:4])
+    predictor.reconcile(client, server_state(server), 4)
+    assert [seq for seq, _, _ in predictor.pending] == list(range(5, len(INPUTS) + 1))
+    drive(server, INPUTS[4:])
+    assert client.serialize() == pytest.approx(server.serialize())
+
+
+def test_reconcile_takes_the_servers_correction():
+    client = CarBody(300, 300)
+    predictor = InputPredictor(TICK_RATE)
+    for seq, (throttle, steering) in enumerate(INPUTS, 1):
+        predictor.record(seq, throttle, steering)
+    drive(client, INPUTS)
+    # The server saw the car pushed 50 px by a collision before input 6
+    server = CarBody(300, 300)
+    drive(server, INPUTS[:5])
+    server.position.x += 50
+    predictor.reconcile(client, server_state(server), 5)
+    drive(server, INPUTS[5:])
+    assert client.serialize() == pytest.approx(server.serialize())
+
+
+def test_acknowledge_handles_seq_wraparound():
+    predictor = InputPredictor(TICK_RATE)
+    for seq in (0xFFFE, 0xFFFF, 0, 1):
+        predictor.record(seq, 1, 0)
+    predictor.acknowledge(0xFFFF)
+    assert [seq for seq, _, _ in predictor.pending] == [0, 1]
+
+
+def test_snapshot_buffer_interpolates_behind_the_clock():
+    buffer = SnapshotBuffer(TICK_RATE, delay=0.1)
+    for tick in range(0, 30, 3):
+        buffer.push(tick, {"car": {"x": tick * 10.0, "y": 100.0, "angle": 0.0, "health": 100}, "bullets": []}, 1.0 + tick / TICK_RATE)
+    # 0.1 s behind tick 24 is tick 18; halfway between 18 and 21 is 19.5
+    sample = buffer.sample(1.0 + 25.5 / TICK_RATE)
+    assert sample["car"]["x"] == pytest.approx(195.0)
+
+
+def test_interpolation_wraps_the_short_way():
+    assert lerp_wrapped(1360, 6, 0.5, 1366) == pytest.approx(0.0)
+    assert lerp_angle(350, 10, 0.5) % 360 == pytest.approx(0.0)
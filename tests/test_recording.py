@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+import recording
+from protocol import encode_message
+from recording import RECORD_BROADCAST, RECORD_RECEIVED, RECORD_SENT, TRAILER, MatchRecorder, Recording, flush_recordings
+from replay import MatchReplay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(recording.time, "monotonic", clock)
+    return clock
+
+
+def record_match(path, clock, ticks=120):
+    recorder = MatchRecorder(path, {"capacity": 2, "tick_rate": 60, "authoritative": False})
+    written = []
+
+    def add(kind, player, message):
+        data = encode_message(message)
+        if kind == RECORD_BROADCAST:
+            recorder.broadcast(data)
+        elif kind == RECORD_SENT:
+            recorder.sent(player, data)
+        else:
+            recorder.received(player, data)
+        written.append((kind | player, data))
+
+    add(RECORD_BROADCAST, 0, {"game_reset": True, "car_healths": [100, 100]})
+    for tick in range(ticks):
+        clock.now += 1 / 60
+        add(RECORD_RECEIVED, tick % 2, {"state_ack": {"player": tick % 2, "seq": tick, "keyframe": False}})
+        if tick % 10 == 9:
+            add(RECORD_BROADCAST, 0, {"hit": {"target": 1, "health": 100 - (tick + 1)}})
+    add(RECORD_SENT, 1, {"player_id": 1})
+    add(RECORD_BROADCAST, 0, {"game_over": True, "winner": 0})
+    recorder.close()
+    flush_recordings()
+    return written
+
+
+def test_round_trip(tmp_path, clock):
+    path = str(tmp_path / "match.rrr")
+    written = record_match(path, clock)
+    match = Recording(path)
+    assert match.complete
+    assert match.metadata["capacity"] == 2
+    assert [(kind, bytes(payload)) for _, kind, payload in match.records()] == written
+    assert match.duration == pytest.approx(2.0, abs=0.05)
+    match.close()
+
+
+def test_seek_lands_on_the_tick(tmp_path, clock):
+    path = str(tmp_path / "match.rrr")
+    record_match(path, clock)
+    match = Recording(path)
+    offset, time_us = match.seek(1.0)
+    first_us = next(match.records(offset, time_us))[0]
+    assert 1.0 <= first_us / 1e6 < 1.0 + 2 / 60
+    match.close()
+
+
+def test_torn_tail_is_read_up_to_the_last_whole_record(tmp_path, clock):
+    path = str(tmp_path / "match.rrr")
+    written = record_match(path, clock)
+    complete = Recording(path)
+    records_end = complete.records_end
+    complete.close()
+    # As if the process died mid-write: no index or trailer, half a record
+    with open(path, "r+b") as f:
+        f.truncate(records_end - 3)
+    torn = Recording(path)
+    assert not torn.complete
+    read = [(kind, bytes(payload)) for _, kind, payload in torn.records()]
+    assert read == written[:len(read)]
+    assert len(read) == len(written) - 1
+    assert torn.index and torn.duration == pytest.approx(2.0, abs=0.05)
+    torn.close()
+
+
+def test_replay_follows_the_match(tmp_path, clock):
+    path = str(tmp_path / "match.rrr")
+    record_match(path, clock)
+    replay = MatchReplay(Recording(path))
+    replay.run()
+    assert replay.healths == [100, 0]
+    assert replay.winners == [0]
+    assert replay.records == 2 + 120 + 12 + 1
+
+
+def test_player_ids_past_the_kind_bits_are_refused(tmp_path):
+    recorder = MatchRecorder(str(tmp_path / "big.rrr"), {})
+    recorder.received(63, b"x")
+    with pytest.raises(ValueError):
+        recorder.received(64, b"x")
+    recorder.close()
+    flush_recordings()
+    assert os.path.getsize(tmp_path / "big.rrr") > TRAILER.size
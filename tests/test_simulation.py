@@ -0,0 +1,38 @@
+import random
+
+from protocol import encode_message
+from simulation import Simulation
+
+
+def play(seed: int, ticks: int = 600):
+    rng = random.Random(seed)
+    simulation = Simulation(4)
+    shots = [0] * 4
+    frames = []
+    for tick in range(ticks):
+        for player_id in range(4):
+            shots[player_id] += rng.random() < 0.2
+            player_input = {"seq": tick + 1, "throttle": rng.choice((-1, 0, 1)), "steering": rng.choice((-1, 0, 1)), "shots": shots[player_id]}
+            simulation.apply_input(player_id, player_input)
+        hits = simulation.step(1 / 60)
+        frames.append((encode_message({"snapshot": simulation.snapshot()}), [sorted(hit.items()) for hit in hits]))
+    return frames, simulation.healths()
+
+
+def test_same_inputs_same_match():
+    assert play(1) == play(1)
+
+
+def test_different_inputs_different_match():
+    assert play(1)[0] != play(2)[0]
+
+
+def test_dead_cars_stay_put():
+    simulation = Simulation(2)
+    simulation.health[1] = 0
+    before = simulation.snapshot()["cars"][1]
+    for tick in range(30):
+        simulation.apply_input(1, {"seq": tick + 1, "throttle": 1, "steering": 1, "shots": tick})
+        simulation.step(1 / 60)
+    assert simulation.snapshot()["cars"][1] == before
+    assert simulation.shots_fired[1] == 0
@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+
+from simulation import SCREEN_HEIGHT, SCREEN_WIDTH
+from spatial_hash import SpatialHash
+
+
+def wrapped_distance(grid, ax, ay, bx, by):
+    dx, dy = grid.delta(ax, ay, bx, by)
+    return np.hypot(dx, dy)
+
+
+def test_delta_takes_the_short_way_round():
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+    assert grid.delta(10.0, 10.0, SCREEN_WIDTH - 10.0, 20.0) == (-20.0, 10.0)
+    assert grid.delta(10.0, SCREEN_HEIGHT - 5.0, 30.0, 5.0) == (20.0, 10.0)
+
+
+def test_candidates_include_every_overlapping_car():
+    rng = random.Random(1)
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+    car_x = np.array([rng.uniform(0, SCREEN_WIDTH) for _ in range(16)])
+    car_y = np.array([rng.uniform(0, SCREEN_HEIGHT) for _ in range(16)])
+    radius = np.full(16, 75.0)
+    grid.build(car_x, car_y, radius)
+    x = np.array([rng.uniform(0, SCREEN_WIDTH) for _ in range(2000)])
+    y = np.array([rng.uniform(0, SCREEN_HEIGHT) for _ in range(2000)])
+    points, cars = grid.candidates(x, y)
+    found = set(zip(points.tolist(), cars.tolist()))
+    for point in range(len(x)):
+        for car in range(16):
+            if wrapped_distance(grid, x[point], y[point], car_x[car], car_y[car]) < radius[car]:
+                assert (point, car) in found
+
+
+def test_pairs_find_every_overlap_across_the_edges():
+    rng = random.Random(2)
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+    count = 40
+    car_x = np.array([rng.uniform(0, SCREEN_WIDTH) for _ in range(count)])
+    car_y = np.array([rng.uniform(0, SCREEN_HEIGHT) for _ in range(count)])
+    # One pair straddling the corner
+    car_x[:2], car_y[:2] = (5.0, SCREEN_WIDTH - 5.0), (5.0, SCREEN_HEIGHT - 5.0)
+    radius = np.full(count, 37.5)
+    grid.build(car_x, car_y, radius)
+    first, second = grid.pairs()
+    found = set(zip(first.tolist(), second.tolist()))
+    assert all(a < b for a, b in found)
+    assert (0, 1) in found
+    for a in range(count):
+        for b in range(a + 1, count):
+            if wrapped_distance(grid, car_x[a], car_y[a], car_x[b], car_y[b]) < radius[a] + radius[b]:
+                assert (a, b) in found
+
+
+def test_no_pairs_without_shared_cells():
+    grid = SpatialHash(SCREEN_WIDTH, SCREEN_HEIGHT)
+    grid.build(np.array([200.0]), np.array([200.0]), np.array([10.0]))
+    first, second = grid.pairs()
+    assert len(first) == len(second) == 0
@@ -0,0 +1,96 @@
+import asyncio
+
+from metrics import Counter
+from spectators import STALL_TIMEOUT, Spectator, SpectatorFeed
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.written = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ("viewer", 0)
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+def watching(count, max_queued_bytes=100):
+    feed = SpectatorFeed(states_skipped=Counter("states_skipped", "States not sent to spectators that were behind"))
+    spectators = [Spectator(None, FakeWriter(), max_queued_bytes) for _ in range(count)]
+    for spectator in spectators:
+        feed.add(spectator)
+    return feed, spectators
+
+
+def publish(feed, *messages):
+    async def run():
+        for data, state in messages:
+            feed.publish(data, state=state)
+        # The flush timer is replaced by flushing by hand
+        feed._cancel_flush()
+    asyncio.run(run())
+
+
+def test_only_the_newest_state_per_key_is_sent():
+    feed, (spectator,) = watching(1)
+    publish(feed, (b"s1a", 1), (b"s2a", 2), (b"hit", None), (b"s1b", 1))
+    feed.flush(0.0)
+    assert spectator.writer.written == [b"s2ahits1b"]
+    assert spectator.messages_out == 3
+
+
+def test_every_viewer_gets_the_same_batch():
+    feed, spectators = watching(3)
+    publish(feed, (b"snap", "snapshot"))
+    feed.flush(0.0)
+    assert [spectator.writer.written for spectator in spectators] == [[b"snap"]] * 3
+    assert all(s.writer.written[0] is spectators[0].writer.written[0] for s in spectators)
+
+
+def test_viewers_that_are_behind_get_events_only():
+    feed, (ok, behind) = watching(2)
+    behind.writer.transport.buffered = 101
+    publish(feed, (b"snap", "snapshot"), (b"hit", None))
+    feed.flush(0.0)
+    assert ok.writer.written == [b"snaphit"]
+    assert behind.writer.written == [b"hit"]
+    assert behind.states_skipped == 1
+    assert feed.states_skipped.value == 1
+
+    # Once drained it picks up at the newest state
+    behind.writer.transport.buffered = 0
+    publish(feed, (b"snap2", "snapshot"))
+    feed.flush(1.0)
+    assert behind.writer.written == [b"hit", b"snap2"]
+    assert behind.behind_since is None
+
+
+def test_viewers_behind_too_long_are_dropped():
+    feed, (spectator,) = watching(1)
+    spectator.writer.transport.buffered = 101
+    for now in (0.0, STALL_TIMEOUT, STALL_TIMEOUT + 0.1):
+        publish(feed, (b"snap", "snapshot"))
+        feed.flush(now)
+    assert spectator.closed and spectator.writer.closed
+    assert spectator.drop_reason == "stalled"
+    assert len(feed) == 0
+
+
+def test_nothing_is_queued_without_viewers():
+    feed = SpectatorFeed()
+    feed.publish(b"snap", state="snapshot")
+    assert feed.pending == []
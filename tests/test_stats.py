@@ -0,0 +1,59 @@
+import pytest
+
+from stats import PlayerStats, StatsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Nothing is written until flush() or close()
+    store = StatsStore(str(tmp_path / "stats.db"), flush_interval=3600)
+    yield store
+    store.close()
+
+
+def test_adds_are_batched_into_one_write(store):
+    for _ in range(50):
+        store.add("alice", hits=1, shots=2)
+    store.add("bob", matches=1, wins=1)
+    assert store.batches == 0
+    store.flush()
+    assert store.batches == 1
+    assert store.rows_written == 2
+    assert store.player("alice") == PlayerStats("alice", 0, 0, 0, 50, 100, 0.0)
+
+
+def test_pending_adds_are_visible_before_a_flush(store):
+    store.add("alice", matches=1, wins=1, seconds=90.0)
+    store.flush()
+    assert store.player("alice").wins == 1
+    store.add("alice", matches=1, losses=1, seconds=30.0)
+    # Served from the cache plus what is pending, not yet from the file
+    assert store.player("alice") == PlayerStats("alice", 2, 1, 1, 0, 0, 120.0)
+    store.flush()
+    assert store.player("alice") == PlayerStats("alice", 2, 1, 1, 0, 0, 120.0)
+    assert store.cache_hits >= 2
+    assert store.player("nobody") is None
+
+
+def test_leaderboard_sees_flushed_rows(store):
+    store.add("alice", wins=3, hits=1)
+    store.add("bob", wins=5, hits=9)
+    store.add("carol", wins=3, hits=4)
+    assert store.leaderboard() == []
+    store.flush()
+    assert [p.name for p in store.leaderboard("wins")] == ["bob", "alice", "carol"]
+    assert [p.name for p in store.leaderboard("hits", limit=2)] == ["bob", "carol"]
+    with pytest.raises(ValueError):
+        store.leaderboard("losses")
+
+
+def test_stores_sharing_a_file_add_up(tmp_path):
+    path = str(tmp_path / "stats.db")
+    first, second = StatsStore(path, flush_interval=3600), StatsStore(path, flush_interval=3600)
+    first.add("alice", matches=1, hits=2)
+    second.add("alice", matches=1, hits=3)
+    first.close()
+    second.close()
+    store = StatsStore(path, flush_interval=3600)
+    assert store.player("alice") == PlayerStats("alice", 2, 0, 0, 5, 0, 0.0)
+    store.close()
@@ -0,0 +1,35 @@
+import pytest
+
+from loopback import SCENARIOS, LinkConditions, LoopbackHarness, run_scenario
+from transport import is_reliable
+
+
+@pytest.mark.parametrize("conditions", SCENARIOS, ids=repr)
+def test_reliable_events_arrive_in_order_and_states_never_go_back(conditions):
+    result = run_scenario(conditions, seconds=5.0)
+    assert result["events_delivered"] == result["events_sent"]
+    assert result["events_in_order"]
+    assert result["states_monotonic"]
+    assert 0 < result["states_delivered"] <= result["states_sent"]
+
+
+def test_duplicated_datagrams_deliver_once():
+    harness = LoopbackHarness(LinkConditions(duplicate=1.0, latency=0.02), seed=3)
+    for event_id in range(50):
+        harness.step(server_outbox=[{"hit": {"target": event_id, "health": 0}}])
+    for _ in range(60):
+        harness.step()
+    assert [m["hit"]["target"] for _, m in harness.client_received] == list(range(50))
+
+
+def test_no_retransmits_on_a_clean_link():
+    result = run_scenario(LinkConditions(latency=0.02), seconds=5.0)
+    assert result["retransmits"] == 0
+    assert result["states_delivered"] == result["states_sent"]
+
+
+def test_reliable_classification():
+    assert is_reliable({"hit": {"target": 0, "health": 10}})
+    assert is_reliable({"game_over": True, "winner": 1})
+    assert not is_reliable({"snapshot": {}})
+    assert not is_reliable({"state_ack": {"player": 0, "seq": 1, "keyframe": False}})
@@ -0,0 +1,534 @@
+import asyncio
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from protocol import FrameDecoder, ProtocolError, PROTOCOL_VERSION, decode_varint, encode_message
+
+# Datagram layout
+# ---------------
+# CONNECT    := u8 type | u8 protocol version
+# ACCEPT     := u8 type
+# DISCONNECT := u8 type
+# DATA       := u8 type | u16 packet seq | u16 reliable ack | u8 reliable count
+#               | reliable count * (u16 reliable seq | protocol frame)
+#               | protocol frames for the unreliable channel
+#
+# The unreliable channel is sequenced: frames from a packet older than the
+# newest one seen are dropped, so state snapshots are latest-wins.  The
+# reliable channel is ordered: every message gets a seq, the peer acks the next
+# seq it expects (cumulative) and unacked messages are resent after an RTO
+# derived from the measured round trip.
+
+PACKET_CONNECT = 1
+PACKET_ACCEPT = 2
+PACKET_DATA = 3
+PACKET_DISCONNECT = 4
+
+DATA_HEADER = struct.Struct("<BHHB")
+RELIABLE_HEADER = struct.Struct("<H")
+
+MAX_DATAGRAM_SIZE = 1200
+MAX_RELIABLE_WINDOW = 1024
+MIN_RESEND_INTERVAL = 0.05
+INITIAL_RESEND_INTERVAL = 0.2
+KEEPALIVE_INTERVAL = 0.5
+CONNECTION_TIMEOUT = 5.0
+CONNECT_RETRY_INTERVAL = 0.25
+CLIENT_POLL_INTERVAL = 0.02
+# Unwritten bytes past which a TCP client drops its latest-wins messages
+MAX_SEND_BACKLOG = 16 * 1024
+# Received messages a client holds for its main loop before dropping latest-wins ones
+MAX_INBOUND = 256
+
+# Latest-wins traffic, plus pings (a lost one is just a missing RTT sample);
+# everything else (player_id, hit, game_reset, game_over, ...) is reliable
+UNRELIABLE_KEYS = ("state_delta", "state_ack", "game_state", "input", "snapshot", "ping", "pong")
+
+
+def is_reliable(message: Dict[str, Any]) -> bool:
+    return not any(key in message for key in UNRELIABLE_KEYS)
+
+
+def _seq_newer(a: int, b: int) -> bool:
+    return 0 < ((a - b) & 0xFFFF) < 0x8000
+
+
+def _decode_frames(data) -> List[Dict[str, Any]]:
+    decoder = FrameDecoder()
+    messages = decoder.feed(data)
+    if decoder.buffer:
+        raise ProtocolError("Truncated frame in datagram")
+    return messages
+
+
+class UdpConnection:
+    # Socket-agnostic state machine for one peer; the caller supplies the clock
+    # and a function that puts a datagram on the wire.
+    def __init__(self, send_datagram: Callable[[bytes], None], now: float):
+        self.send_datagram = send_datagram
+        self.packet_seq = 0
+        self.remote_packet_seq: Optional[int] = None
+        self.next_reliable_seq = 0
+        # seq -> [frame, last_sent, first_sent, resent]
+        self.reliable_pending: "OrderedDict[int, list]" = OrderedDict()
+        self.expected_reliable_seq = 0
+        self.reliable_received: Dict[int, bytes] = {}
+        self.unreliable_queue: List[bytes] = []
+        self.ack_dirty = False
+        self.last_received = now
+        self.last_sent = now
+        self.srtt: Optional[float] = None
+        self.closed = False
+        self.stats = {"packets_sent": 0, "packets_received": 0, "retransmits": 0, "stale_dropped": 0}
+
+    @property
+    def resend_interval(self) -> float:
+        if self.srtt is None:
+            return INITIAL_RESEND_INTERVAL
+        return max(MIN_RESEND_INTERVAL, 2 * self.srtt)
+
+    def queue(self, message: Dict[str, Any], reliable: Optional[bool] = None):
+        if reliable is None:
+            reliable = is_reliable(message)
+        self.queue_frame(encode_message(message), reliable)
+
+    def queue_frame(self, frame: bytes, reliable: bool):
+        if reliable:
+            self.reliable_pending[self.next_reliable_seq] = [frame, None, None, False]
+            self.next_reliable_seq += 1
+        else:
+            self.unreliable_queue.append(frame)
+
+    def is_timed_out(self, now: float, timeout: float = CONNECTION_TIMEOUT) -> bool:
+        return now - self.last_received > timeout
+
+    def flush(self, now: float):
+        reliable = []
+        resend_interval = self.resend_interval
+        for seq, entry in self.reliable_pending.items():
+            if len(reliable) == 255:
+                break
+            if entry[1] is None:
+                entry[2] = now
+            elif now - entry[1] >= resend_interval:
+                entry[3] = True
+                self.stats["retransmits"] += 1
+            else:
+                continue
+            entry[1] = now
+            reliable.append((seq, entry[0]))
+        unreliable, self.unreliable_queue = self.unreliable_queue, []
+
+        if not reliable and not unreliable:
+            if self.ack_dirty or now - self.last_sent >= KEEPALIVE_INTERVAL:
+                self._send_packet([], [], now)
+            return
+        while reliable or unreliable:
+            size = DATA_HEADER.size
+            packet_reliable = []
+            while reliable and (not packet_reliable or size + 2 + len(reliable[0][1]) <= MAX_DATAGRAM_SIZE):
+                seq, frame = reliable.pop(0)
+                packet_reliable.append((seq, frame))
+                size += RELIABLE_HEADER.size + len(frame)
+            packet_unreliable = []
+            # Oversized state frames still go out alone and rely on IP fragmentation
+            while unreliable and (not (packet_reliable or packet_unreliable) or size + len(unreliable[0]) <= MAX_DATAGRAM_SIZE):
+                frame = unreliable.pop(0)
+                packet_unreliable.append(frame)
+                size += len(frame)
+            self._send_packet(packet_reliable, packet_unreliable, now)
+
+    def _send_packet(self, reliable: List[Tuple[int, bytes]], unreliable: List[bytes], now: float):
+        self.packet_seq = (self.packet_seq + 1) & 0xFFFF
+        parts = [DATA_HEADER.pack(PACKET_DATA, self.packet_seq, self.expected_reliable_seq & 0xFFFF, len(reliable))]
+        for seq, frame in reliable:
+            parts.append(RELIABLE_HEADER.pack(seq & 0xFFFF))
+            parts.append(frame)
+        parts.extend(unreliable)
+        self.send_datagram(b"".join(parts))
+        self.ack_dirty = False
+        self.last_sent = now
+        self.stats["packets_sent"] += 1
+
+    def receive_datagram(self, data: bytes, now: float) -> List[Dict[str, Any]]:
+        if not data:
+            return []
+        if data[0] == PACKET_DISCONNECT:
+            self.closed = True
+            return []
+        if data[0] != PACKET_DATA:
+            return []
+        try:
+            _, packet_seq, ack, reliable_count = DATA_HEADER.unpack_from(data)
+        except struct.error as e:
+            raise ProtocolError(f"Truncated packet header: {e}") from e
+        self.last_received = now
+        self.stats["packets_received"] += 1
+        self._process_ack(ack, now)
+
+        messages = []
+        offset = DATA_HEADER.size
+        for _ in range(reliable_count):
+            if offset + RELIABLE_HEADER.size > len(data):
+                raise ProtocolError("Truncated reliable header")
+            seq16, = RELIABLE_HEADER.unpack_from(data, offset)
+            offset += RELIABLE_HEADER.size
+            length, body_start = decode_varint(data, offset)
+            if body_start < 0 or body_start + length > len(data):
+                raise ProtocolError("Truncated reliable frame")
+            self._receive_reliable(seq16, bytes(data[offset:body_start + length]))
+            offset = body_start + length
+        messages.extend(self._deliver_reliable())
+
+        if self.remote_packet_seq is None or _seq_newer(packet_seq, self.remote_packet_seq):
+            self.remote_packet_seq = packet_seq
+            messages.extend(_decode_frames(data[offset:]))
+        else:
+            self.stats["stale_dropped"] += 1
+        return messages
+
+    def _process_ack(self, ack: int, now: float):
+        while self.reliable_pending:
+            seq, entry = next(iter(self.reliable_pending.items()))
+            if not _seq_newer(ack, seq & 0xFFFF):
+                break
+            del self.reliable_pending[seq]
+            if entry[2] is not None and not entry[3]:
+                sample = now - entry[2]
+                self.srtt = sample if self.srtt is None else 0.875 * self.srtt + 0.125 * sample
+
+    def _receive_reliable(self, seq16: int, frame: bytes):
+        self.ack_dirty = True
+        offset = (seq16 - self.expected_reliable_seq) & 0xFFFF
+        if offset >= 0x8000 or offset >= MAX_RELIABLE_WINDOW:
+            return
+        self.reliable_received.setdefault(self.expected_reliable_seq + offset, frame)
+
+    def _deliver_reliable(self) -> List[Dict[str, Any]]:
+        messages = []
+        while self.expected_reliable_seq in self.reliable_received:
+            messages.extend(_decode_frames(self.reliable_received.pop(self.expected_reliable_seq)))
+            self.expected_reliable_seq += 1
+        return messages
+
+
+class InboundQueue:
+    # Hands received messages from a client's receive thread to its main
+    # loop.  deque appends and pops are atomic, so neither side locks.  When
+    # the main loop falls max_size messages behind, arriving unreliable ones
+    # are dropped; reliable ones never are.
+    def __init__(self, max_size: int = MAX_INBOUND):
+        self.messages: deque = deque()
+        self.max_size = max_size
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def put(self, message: Dict[str, Any]):
+        if len(self.messages) >= self.max_size and not is_reliable(message):
+            self.dropped += 1
+            return
+        self.messages.append(message)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        messages = self.messages
+        return [messages.popleft() for _ in range(len(messages))]
+
+
+class TcpClientTransport:
+    # Messages are queued and go out in one write per flush().  The write
+    # itself happens on a background thread, so a full socket buffer never
+    # blocks the caller; while it is behind by more than MAX_SEND_BACKLOG
+    # bytes, unreliable messages (states, inputs, acks) are dropped instead
+    # of piling up behind it.
+    def __init__(self, host: str, port: int):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect((host, port))
+        self.decoder = FrameDecoder()
+        self.send_lock = threading.Lock()
+        self.outbox: List[Tuple[bytes, bool]] = []
+        self.writes: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        # Bytes handed to the writer thread and not yet written
+        self.backlog = 0
+        self.dropped = 0
+        self.writes_sent = 0
+        # Set once a write fails; later flushes are discarded
+        self.closed = False
+        threading.Thread(target=self._write_loop, name="tcp-writer", daemon=True).start()
+        # Receive-side totals, read by the client's frame profiler
+        self.bytes_in = 0
+        self.messages_in = 0
+        self.decode_seconds = 0.0
+
+    def queue(self, message: Dict[str, Any], reliable: Optional[bool] = None):
+        if reliable is None:
+            reliable = is_reliable(message)
+        frame = encode_message(message)
+        with self.send_lock:
+            self.outbox.append((frame, reliable))
+
+    def flush(self):
+        with self.send_lock:
+            batch, self.outbox = self.outbox, []
+            if self.closed:
+                return
+            if self.backlog > MAX_SEND_BACKLOG:
+                frames = [frame for frame, reliable in batch if reliable]
+                self.dropped += len(batch) - len(frames)
+            else:
+                frames = [frame for frame, _ in batch]
+            if not frames:
+                return
+            data = b"".join(frames)
+            self.backlog += len(data)
+        self.writes.put(data)
+
+    def send(self, message: Dict[str, Any]):
+        self.queue(message)
+        self.flush()
+
+    def _write_loop(self):
+        while True:
+            data = self.writes.get()
+            if data is None:
+                return
+            # Batches that queued up while the last write blocked go out together
+            while not self.writes.empty():
+                more = self.writes.get()
+                if more is None:
+                    self.writes.put(None)
+                    break
+                data += more
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                # The receive thread sees the connection go and ends the game;
+                # nothing will write what is still queued, so forget it
+                with self.send_lock:
+                    self.closed = True
+                    self.backlog = 0
+                return
+            self.writes_sent += 1
+            with self.send_lock:
+                self.backlog -= len(data)
+
+    def receive(self) -> List[Dict[str, Any]]:
+        data = self.sock.recv(4096)
+        if not data:
+            raise ConnectionError("Server closed the connection")
+        start = time.perf_counter()
+        messages = self.decoder.feed(data)
+        self.decode_seconds += time.perf_counter() - start
+        self.bytes_in += len(data)
+        self.messages_in += len(messages)
+        return messages
+
+    def close(self):
+        self.writes.put(None)
+        self.sock.close()
+
+
+class UdpClientTransport:
+    def __init__(self, host: str, port: int, timeout: float = CONNECTION_TIMEOUT):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.lock = threading.Lock()
+        self.connection: Optional[UdpConnection] = None
+        self._early_messages: List[Dict[str, Any]] = []
+        self.bytes_in = 0
+        self.messages_in = 0
+        self.decode_seconds = 0.0
+        self._handshake(timeout)
+
+    def _handshake(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        connect = bytes((PACKET_CONNECT, PROTOCOL_VERSION))
+        self.sock.settimeout(CONNECT_RETRY_INTERVAL)
+        while time.monotonic() < deadline:
+            try:
+                self.sock.send(connect)
+                data = self.sock.recv(65535)
+            except (socket.timeout, ConnectionRefusedError):
+                continue
+            if not data or data[0] not in (PACKET_ACCEPT, PACKET_DATA):
+                continue
+            now = time.monotonic()
+            self.connection = UdpConnection(self.sock.send, now)
+            # The server may already be talking to us if our ACCEPT got lost
+            if data[0] == PACKET_DATA:
+                self._early_messages = self.connection.receive_datagram(data, now)
+            return
+        self.sock.close()
+        raise ConnectionError(f"No answer from UDP server within {timeout}s")
+
+    def queue(self, message: Dict[str, Any], reliable: Optional[bool] = None):
+        with self.lock:
+            self.connection.queue(message, reliable)
+
+    def flush(self):
+        # Everything queued since the last flush shares as few datagrams as fit
+        with self.lock:
+            self.connection.flush(time.monotonic())
+
+    def send(self, message: Dict[str, Any]):
+        self.queue(message)
+        self.flush()
+
+    def receive(self) -> List[Dict[str, Any]]:
+        messages, self._early_messages = self._early_messages, []
+        self.sock.settimeout(CLIENT_POLL_INTERVAL)
+        try:
+            data = self.sock.recv(65535)
+        except socket.timeout:
+            data = b""
+        with self.lock:
+            now = time.monotonic()
+            start = time.perf_counter()
+            received = self.connection.receive_datagram(data, now)
+            self.decode_seconds += time.perf_counter() - start
+            self.bytes_in += len(data)
+            self.messages_in += len(received)
+            messages.extend(received)
+            # Also drives retransmits, acks and keepalives while the game is idle
+            self.connection.flush(now)
+            if self.connection.closed:
+                raise ConnectionError("Server closed the connection")
+            if self.connection.is_timed_out(now):
+                raise ConnectionError("Server timed out")
+        return messages
+
+    def close(self):
+        try:
+            self.sock.send(bytes((PACKET_DISCONNECT,)))
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def connect(host: str, port: int, transport: str = "tcp"):
+    if transport == "udp":
+        return UdpClientTransport(host, port)
+    return TcpClientTransport(host, port)
+
+
+class UdpSession:
+    # Server-side peer; quacks like game_server.ClientConnection
+    def __init__(self, protocol: "UdpServerProtocol", addr):
+        self.protocol = protocol
+        self.addr = addr
+        self.room = None
+        self.player_id: Optional[int] = None
+        self.connection = UdpConnection(self._send_datagram, time.monotonic())
+        # Traffic and RTT, read by game_server's metrics
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.rtt: Optional[float] = None
+        self.ping_nonce = 0
+        self.ping_sent_at: Optional[float] = None
+        self.name: Optional[str] = None
+
+    def _send_datagram(self, data: bytes):
+        self.bytes_out += len(data)
+        self.protocol.transport.sendto(data, self.addr)
+
+    def send(self, message: Dict[str, Any]):
+        self.send_encoded(message, encode_message(message))
+
+    def send_encoded(self, message: Dict[str, Any], data: bytes):
+        # Queued; UdpServerProtocol's tick packs everything a session was
+        # sent since the last one into as few datagrams as fit.  Pings and
+        # pongs go at once so RTT samples don't include the wait for a tick
+        self.messages_out += 1
+        self.connection.queue_frame(data, is_reliable(message))
+        if "ping" in message or "pong" in message:
+            self.connection.flush(time.monotonic())
+
+    def send_queue_bytes(self) -> int:
+        # Reliable frames still waiting for an ack
+        return sum(len(entry[0]) for entry in self.connection.reliable_pending.values())
+
+    def close(self):
+        if self.protocol.sessions.pop(self.addr, None) is not None:
+            # Whatever is still queued (a game_over, say) goes out first
+            self.connection.flush(time.monotonic())
+            self.protocol.transport.sendto(bytes((PACKET_DISCONNECT,)), self.addr)
+
+
+class UdpServerProtocol(asyncio.DatagramProtocol):
+    def __init__(
+        self,
+        on_connect: Callable[[UdpSession], None],
+        on_message: Callable[[UdpSession, Dict[str, Any]], None],
+        on_disconnect: Callable[[UdpSession], None],
+        tick_interval: float = CLIENT_POLL_INTERVAL,
+    ):
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.tick_interval = tick_interval
+        self.sessions: Dict[Any, UdpSession] = {}
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._tick_handle: Optional[asyncio.TimerHandle] = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+        self._tick_handle = asyncio.get_running_loop().call_later(self.tick_interval, self._tick)
+
+    def connection_lost(self, exc):
+        if self._tick_handle is not None:
+            self._tick_handle.cancel()
+
+    def datagram_received(self, data: bytes, addr):
+        if not data:
+            return
+        session = self.sessions.get(addr)
+        if data[0] == PACKET_CONNECT:
+            if session is None:
+                if len(data) < 2 or data[1] != PROTOCOL_VERSION:
+                    print(f"Rejected UDP client {addr}: protocol version mismatch")
+                    self.transport.sendto(bytes((PACKET_DISCONNECT,)), addr)
+                    return
+                session = self.sessions[addr] = UdpSession(self, addr)
+                self.transport.sendto(bytes((PACKET_ACCEPT,)), addr)
+                self.on_connect(session)
+            else:
+                self.transport.sendto(bytes((PACKET_ACCEPT,)), addr)
+            return
+        if session is None:
+            return
+        session.bytes_in += len(data)
+        try:
+            messages = session.connection.receive_datagram(data, time.monotonic())
+        except ProtocolError as e:
+            print(f"Dropping UDP client {addr}: {e}")
+            self._drop(session)
+            return
+        for message in messages:
+            if self.sessions.get(addr) is not session:
+                break
+            self.on_message(session, message)
+        if session.connection.closed:
+            self._drop(session)
+
+    def _drop(self, session: UdpSession):
+        if self.sessions.get(session.addr) is session:
+            self.on_disconnect(session)
+            session.close()
+
+    def _tick(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if session.connection.is_timed_out(now):
+                print(f"UDP client {session.addr} timed out")
+                self._drop(session)
+            else:
+                session.connection.flush(now)
+        self._tick_handle = asyncio.get_running_loop().call_later(self.tick_interval, self._tick)